@@ -0,0 +1,272 @@
+"""
+JSON API over the same land records as the app, for scripts and batch jobs (no browser needed).
+
+    python api.py --port 8502
+
+    GET  /health                               data version, sheet count and refresh status
+    GET  /sheets                               sheet names
+    GET  /query?sheet=VDC01&ward=3&plot=123    one query
+    GET  /export?sheet=VDC01&ward=3&format=csv all rows of one query as a CSV or XLSX download
+    GET  /metrics                              timings, counters and sizes in the Prometheus text format
+    GET  /changes?sheet=VDC01&since=<time>     records added, removed or changed by recent refreshes
+    POST /query   {"queries": [{...}, ...]}    many queries (e.g. one per kitta), answered in order
+
+Query fields (all optional): sheet (leave it out to look a plot up in every sheet), ward,
+sheet_no, plot, mode ('exact', 'prefix', 'contains' or 'fuzzy'), limit (default 100) and offset.
+A sheet may be named in either script ('Bhaktapur' for 'भक्तपुर'), and plot numbers in
+Devanagari digits match ASCII ones.
+Each answer is {"total": ..., "matches": [{"sheet", "columns", "rows"}]} or {"error": ...}.
+Exports are streamed (chunked) as they are written, whatever the number of rows.
+/changes answers {"changes": [...]} newest first (see changes.py); `since` (seconds since the
+epoch, the `at` of the last change seen) returns only newer ones, `limit` at most that many.
+
+All requests share one in-memory copy of the prepared sheets and their indexes, loaded and
+refreshed in the background exactly like in the app (same snapshot folder and settings).
+"""
+import argparse
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qsl, urlsplit
+
+import numpy as np
+
+import export
+import metrics
+import records
+import refresh
+
+# Most queries one POST /query may carry
+MAX_BATCH = 1000
+# Largest request body accepted (bytes)
+MAX_BODY = 4 * 1024 * 1024
+# Stage name (metrics.py) of each GET path
+GET_STAGES = {
+    '/health': 'api_health',
+    '/sheets': 'api_sheets',
+    '/query': 'api_query',
+    '/export': 'api_export',
+    '/metrics': 'api_metrics',
+    '/changes': 'api_changes'
+}
+
+
+def _json_default(value):
+    # numpy numbers, timestamps and the like
+    if isinstance(value, np.generic):
+        return value.item()
+    return str(value)
+
+
+class RecordQueries:
+    """
+    The shared workbook state, plus the cross-sheet plot index of its current version.
+    """
+    def __init__(self, state):
+        self.state = state
+        self.global_index = (None, None)
+        self.index_lock = threading.Lock()
+
+    def snapshot(self):
+        snapshot = refresh.get_snapshot(self.state)
+        if snapshot is None:
+            raise RuntimeError(f"No data: {self.state['last_error']}")
+        return snapshot
+
+    def sheet_names(self, snapshot):
+        # Skip the first sheet (Cover Page), like the app
+        return refresh.data_sheet_names(snapshot['sheets'])
+
+    def get_global_index(self, snapshot):
+        version, index = self.global_index
+        if version != snapshot['version']:
+            with self.index_lock:
+                version, index = self.global_index
+                if version != snapshot['version']:
+                    index = snapshot['sheets'].global_plot_index(self.sheet_names(snapshot))
+                    self.global_index = (snapshot['version'], index)
+        return index
+
+    def answer(self, queries):
+        # One snapshot for the whole batch, so every answer comes from the same data version
+        snapshot = self.snapshot()
+        answers = []
+        for query in queries:
+            try:
+                # Wrong types (e.g. {"sheet": ["VDC01"]}) are this query's error, not the batch's
+                records.check_query(query)
+                global_index = None if query.get('sheet') else self.get_global_index(snapshot)
+                answers.append(records.query_records(
+                    snapshot['sheets'], query, global_index, self.state['result_cache'], snapshot['version']
+                ))
+            except ValueError as e:
+                answers.append({'error': str(e)})
+        return snapshot['version'], answers
+
+    def changes(self, query):
+        # Recent journal entries (refresh.recent_changes) for GET /changes
+        snapshot = self.snapshot()
+        try:
+            since = float(query['since']) if query.get('since') else None
+            limit = int(query.get('limit', refresh.JOURNAL_SIZE))
+        except ValueError:
+            raise ValueError("since and limit must be numbers")
+        sheet = query.get('sheet')
+        if sheet:
+            sheet = records.find_sheet_name(snapshot['sheets'], sheet)
+        return refresh.recent_changes(self.state['journal'], sheet, since, limit)
+
+    def export(self, query):
+        # (columns, chunks) of every row matching the query, with the source sheet first
+        snapshot = self.snapshot()
+        global_index = None if query.get('sheet') else self.get_global_index(snapshot)
+        hits = records.query_hits(
+            snapshot['sheets'], query, global_index, self.state['result_cache'], snapshot['version']
+        )
+        return export.hits_export(snapshot['sheets'], hits, 'sheet')
+
+
+class QueryHandler(BaseHTTPRequestHandler):
+    # Keep-alive, so a batch job can send many requests over one connection
+    protocol_version = 'HTTP/1.1'
+    # Headers and body are written separately; without this each answer waits ~40 ms for an ACK
+    disable_nagle_algorithm = True
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        with metrics.timer(GET_STAGES.get(url.path, 'api_not_found')):
+            self.answer_get(url)
+
+    def answer_get(self, url):
+        queries = self.server.queries
+        try:
+            if url.path == '/health':
+                state = queries.state
+                snapshot = queries.snapshot()
+                self.send_json(200, {
+                    'version': snapshot['version'],
+                    'sheets': len(queries.sheet_names(snapshot)),
+                    'refreshed_at': state['refreshed_at'],
+                    'refreshing': state['refreshing'],
+                    'last_error': state['last_error']
+                })
+            elif url.path == '/sheets':
+                self.send_json(200, {'sheets': queries.sheet_names(queries.snapshot())})
+            elif url.path == '/query':
+                version, answers = queries.answer([dict(parse_qsl(url.query))])
+                self.send_json(400 if 'error' in answers[0] else 200, dict(answers[0], version=version))
+            elif url.path == '/export':
+                query = dict(parse_qsl(url.query))
+                file_format = query.pop('format', 'csv')
+                if file_format not in export.MIME_TYPES:
+                    raise ValueError(f"format must be one of {', '.join(export.MIME_TYPES)}")
+                self.send_stream(export.export_blocks(queries.export(query), file_format),
+                                 export.MIME_TYPES[file_format], f'land_records.{file_format}')
+            elif url.path == '/changes':
+                self.send_json(200, {'changes': queries.changes(dict(parse_qsl(url.query)))})
+            elif url.path == '/metrics':
+                self.send_text(200, metrics.prometheus_text(), 'text/plain; version=0.0.4; charset=utf-8')
+            else:
+                self.send_json(404, {'error': 'Not found'})
+        except ValueError as e:
+            self.send_json(400, {'error': str(e)})
+        except RuntimeError as e:
+            self.send_json(503, {'error': str(e)})
+
+    def do_POST(self):
+        if urlsplit(self.path).path != '/query':
+            # The body was not read, so the connection cannot carry another request
+            self.close_connection = True
+            self.send_json(404, {'error': 'Not found'})
+            return
+        try:
+            length = int(self.headers.get('Content-Length') or 0)
+        except ValueError:
+            length = -1
+        if not 0 < length <= MAX_BODY:
+            self.close_connection = True
+            self.send_json(400, {'error': f'Send a JSON body of at most {MAX_BODY} bytes'})
+            return
+
+        try:
+            body = json.loads(self.rfile.read(length))
+            queries = body['queries'] if isinstance(body, dict) else None
+            if not isinstance(queries, list):
+                raise ValueError('Expected {"queries": [...]}')
+        except (ValueError, KeyError) as e:
+            self.send_json(400, {'error': str(e)})
+            return
+        if len(queries) > MAX_BATCH:
+            self.send_json(400, {'error': f'At most {MAX_BATCH} queries per request'})
+            return
+
+        metrics.count('api_batch_queries', len(queries))
+        try:
+            with metrics.timer('api_query_batch'):
+                version, answers = self.server.queries.answer(queries)
+        except RuntimeError as e:
+            self.send_json(503, {'error': str(e)})
+            return
+        self.send_json(200, {'version': version, 'results': answers})
+
+    def send_json(self, status, payload):
+        body = json.dumps(payload, ensure_ascii=False, default=_json_default)
+        self.send_text(status, body, 'application/json; charset=utf-8')
+
+    def send_text(self, status, text, content_type):
+        body = text.encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        if self.close_connection:
+            # Tell the client, so it does not send its next request on this connection
+            self.send_header('Connection', 'close')
+        self.end_headers()
+        self.wfile.write(body)
+
+    def send_stream(self, blocks, content_type, file_name):
+        # Chunked transfer: blocks go out as they are written, the size is not known up front
+        self.send_response(200)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Disposition', f'attachment; filename="{file_name}"')
+        self.send_header('Transfer-Encoding', 'chunked')
+        self.end_headers()
+        for block in blocks:
+            self.wfile.write(b'%x\r\n%s\r\n' % (len(block), block))
+        self.wfile.write(b'0\r\n\r\n')
+
+    def log_message(self, format, *args):
+        # One line per request is too much at hundreds of requests per second
+        pass
+
+
+def make_server(host='127.0.0.1', port=8502, state=None):
+    """
+    An HTTP server (one thread per connection) answering from `state` (refresh.new_workbook_state()).
+    """
+    server = ThreadingHTTPServer((host, port), QueryHandler)
+    server.daemon_threads = True
+    server.queries = RecordQueries(state or refresh.new_workbook_state())
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8502)
+    args = parser.parse_args()
+
+    server = make_server(args.host, args.port)
+    # Load the data before taking requests, so the first one does not wait for the download
+    server.queries.snapshot()
+    print(f'Serving land records on http://{args.host}:{server.server_address[1]}')
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == '__main__':
+    main()
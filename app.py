@@ -1,8 +1,15 @@
 import streamlit as st
 import pandas as pd
-import io
-import requests
 import base64
+import os
+import re
+import time
+import bulk
+import export
+import fuzzy
+import metrics
+import records
+import refresh
 
 # Set page settings
 st.set_page_config(
@@ -16,10 +23,6 @@ if 'dark_mode' not in st.session_state:
     st.session_state.dark_mode = False
 
 
-# Fixed values
-# Update to XLSX export URL to support multiple sheets
-DATA_URL = "https://docs.google.com/spreadsheets/d/1lpzFNKk0thSQqS8GQxzwiuLr8T9abM7M/export?format=xlsx"
-
 # Dictionary for languages
 TRANSLATIONS = {
     'NP': {
@@ -38,7 +41,51 @@ TRANSLATIONS = {
         'search_placeholder': "यहाँ टाईप गर्नुहोस्...",
         'missing_cols_msg': "केही columns फेला परेनन्",
         'available_cols_msg': "उपलब्ध columns",
-        'select_sheet': "साविक गा.वि.स. चयन गर्नुहोस् (Select a VDC)"
+        'select_sheet': "साविक गा.वि.स. चयन गर्नुहोस् (Select a VDC)",
+        'plot_match': "खोज्ने तरिका",
+        'match_exact': "पूरै मिल्ने",
+        'match_prefix': "सुरुबाट मिल्ने",
+        'match_contains': "कतै पनि मिल्ने",
+        'match_fuzzy': "मिल्दोजुल्दो",
+        'global_search': "सबै गा.वि.स.मा खोज्नुहोस्",
+        'global_search_hint': "सबै गा.वि.स.मा खोज्न कित्ता नं. टाईप गर्नुहोस्।",
+        'source_sheet': "स्रोत सिट",
+        'refreshing_msg': "पृष्ठभूमिमा डाटा अद्यावधिक हुँदैछ...",
+        'data_status': "डाटा {minutes} मिनेट अघि जाँचिएको ({duration:.1f} सेकेन्ड लाग्यो)",
+        'page_size': "प्रति पृष्ठ पङ्क्ति",
+        'page': "पृष्ठ",
+        'showing_rows': "{total} मध्ये {start}–{end} पङ्क्ति देखाइँदै ({pages} पृष्ठ)",
+        'bulk_lookup': "धेरै कित्ता एकैपटक खोज्नुहोस्",
+        'bulk_upload': "कित्ता सूची (CSV वा Excel): साविक गा.वि.स., वडा नं., कित्ता नं.",
+        'bulk_paste': "वा सूची यहाँ टाँस्नुहोस् (एक लाइनमा एउटा)",
+        'bulk_hint': "कित्ता नं. अनिवार्य छ; साविक गा.वि.स. र वडा नं. नभए पनि हुन्छ।",
+        'bulk_error': "सूची पढ्न सकिएन",
+        'bulk_summary': "सूचीका {rows} पङ्क्तिमध्ये {found} फेला परे, {missing} फेला परेनन् ({matches} नतिजा)",
+        'list_row': "सूची पङ्क्ति",
+        'not_found': "फेला नपरेका",
+        'export_csv': "CSV डाउनलोड",
+        'export_xlsx': "Excel डाउनलोड",
+        'download_not_found': "फेला नपरेका डाउनलोड (CSV)",
+        'land_use_summary': "भूउपयोग सारांश",
+        'summary_all_sheets': "सबै गा.वि.स.",
+        'summary_caption': "भूउपयोग क्षेत्र अनुसार कित्ता संख्या",
+        'no_land_use': "यो छनोटमा भूउपयोग क्षेत्रको तथ्याङ्क छैन।",
+        'blank_value': "खाली",
+        'total': "जम्मा",
+        'recent_changes': "हालका परिवर्तनहरू",
+        'no_changes': "डाटा अद्यावधिक हुँदा अहिलेसम्म कुनै परिवर्तन भेटिएको छैन।",
+        'changed_at': "समय",
+        'change': "परिवर्तन",
+        'details': "विवरण",
+        'change_added': "थपिएको",
+        'change_removed': "हटाइएको",
+        'change_changed': "परिवर्तित",
+        'change_sheet_added': "नयाँ गा.वि.स.",
+        'change_sheet_removed': "हटाइएको गा.वि.स.",
+        'change_more': "थप परिवर्तनहरू",
+        'admin_metrics': "सर्भरको कार्यसम्पादन (Admin)",
+        'admin_prometheus': "Prometheus ढाँचामा",
+        'admin_structure': "स्तम्भ पहिचानको विश्वसनीयता (०-१)"
     },
     'EN': {
         'header_title': "Land Use Classification Search System",
@@ -56,68 +103,493 @@ TRANSLATIONS = {
         'search_placeholder': "Type here to search...",
         'missing_cols_msg': "Some columns missing",
         'available_cols_msg': "Available Columns",
-        'select_sheet': "Select Sheet"
+        'select_sheet': "Select Sheet",
+        'plot_match': "Match",
+        'match_exact': "Exact",
+        'match_prefix': "Starts with",
+        'match_contains': "Contains",
+        'match_fuzzy': "Similar",
+        'global_search': "Search all VDCs",
+        'global_search_hint': "Type a plot/kitta number to search all VDCs.",
+        'source_sheet': "Source Sheet",
+        'refreshing_msg': "Updating data in the background...",
+        'data_status': "Data checked {minutes} min ago (took {duration:.1f} s)",
+        'page_size': "Rows per page",
+        'page': "Page",
+        'showing_rows': "Showing rows {start}–{end} of {total} ({pages} pages)",
+        'bulk_lookup': "Bulk kitta lookup",
+        'bulk_upload': "Kitta list (CSV or Excel): VDC, ward, kitta",
+        'bulk_paste': "or paste the list here (one per line)",
+        'bulk_hint': "Kitta is required; VDC and ward are optional.",
+        'bulk_error': "Could not read the list",
+        'bulk_summary': "{found} of {rows} list rows found, {missing} not found ({matches} matching records)",
+        'list_row': "List Row",
+        'not_found': "Not found",
+        'export_csv': "Download CSV",
+        'export_xlsx': "Download Excel",
+        'download_not_found': "Download not-found list (CSV)",
+        'land_use_summary': "Land use summary",
+        'summary_all_sheets': "All VDCs",
+        'summary_caption': "Number of kittas by land use",
+        'no_land_use': "No land use data for this selection.",
+        'blank_value': "blank",
+        'total': "Total",
+        'recent_changes': "Recent changes",
+        'no_changes': "No changes found in the data refreshes so far.",
+        'changed_at': "Time",
+        'change': "Change",
+        'details': "Details",
+        'change_added': "Added",
+        'change_removed': "Removed",
+        'change_changed': "Changed",
+        'change_sheet_added': "New VDC",
+        'change_sheet_removed': "Removed VDC",
+        'change_more': "More changes",
+        'admin_metrics': "Server performance (admin)",
+        'admin_prometheus': "In Prometheus format",
+        'admin_structure': "Column detection confidence (0-1)"
     }
 }
 
+# Process-wide workbook, kept between reruns and sessions so refreshes can be conditional
+@st.cache_resource(show_spinner=False)
+def get_workbook_state():
+    return refresh.new_workbook_state()
+
+# Opens the admin panel (timings of this server) with ?admin=<token> in the address; no token, no panel
+ADMIN_TOKEN = os.environ.get('LAND_RECORD_ADMIN_TOKEN')
+
 # This function gets data
-@st.cache_data(ttl=600, show_spinner=False)
 def load_all_sheets():
-    try:
-        response = requests.get(DATA_URL)
-        response.raise_for_status()
-        # Read the Excel file into a dictionary of DataFrames
-        # We read without header first to detect the correct header row
-        xls = pd.read_excel(io.BytesIO(response.content), sheet_name=None, header=None)
-        return xls
-    except Exception as e:
-        st.error(f"Error: {e}")
-        return None
+    with metrics.timer('app_get_snapshot'):
+        snapshot = refresh.get_snapshot(get_workbook_state())
+    if snapshot is None:
+        st.error(f"Error: {get_workbook_state()['last_error'] or 'The data is not published yet, try again in a moment.'}")
+    return snapshot
+
+# The cross-sheet index is built (or read from the snapshot folder) once per workbook version.
+# It only keeps the plot keys, so sheets can still leave the memory cache afterwards.
+@st.cache_resource(max_entries=4, show_spinner=False)
+def get_global_plot_index(version, sheet_names, _all_sheets):
+    return _all_sheets.global_plot_index(list(sheet_names))
+
+# Land use counts of every sheet, added up once per workbook version from the per-sheet summaries
+@st.cache_resource(max_entries=4, show_spinner=False)
+def get_land_use_totals(version, sheet_names, _all_sheets):
+    return records.build_land_use_totals(_all_sheets.load(list(sheet_names)))
+
+# Custom CSS for UI Animations & Theme Toggle; colors come from the variables in get_theme_style()
+PAGE_CSS = """
+    /* Theme Colors */
+    .stApp {
+        background-color: var(--bg-color);
+        color: var(--text-color);
+        animation: fadeIn 0.8s ease-in-out;
+        transition: background-color 0.3s ease, color 0.3s ease;
+    }
+    
+    @keyframes fadeIn {
+        0% { opacity: 0; }
+        100% { opacity: 1; }
+    }
+    
+    section[data-testid="stSidebar"] {
+        background-color: var(--sidebar-bg);
+        transition: all 0.3s ease;
+    }
+    
+    /* Text colors - comprehensive coverage */
+    h1, h2, h3, h4, h5, h6, p, span, label, div, li, a {
+        color: var(--text-color) !important;
+    }
+    
+    /* Ensure markdown text is visible */
+    .stMarkdown, .stMarkdown p, .stMarkdown span {
+        color: var(--text-color) !important;
+    }
+    
+    /* Input fields - background and text */
+    div[data-baseweb="select"] > div,
+    div[data-baseweb="input"] > div {
+        background-color: var(--input-bg) !important;
+        color: var(--text-color) !important;
+        transition: background-color 0.3s ease;
+        border-color: var(--text-color-40) !important;
+    }
+    
+    /* Dropdown menu items */
+    div[data-baseweb="select"] ul {
+        background-color: var(--input-bg) !important;
+    }
+    
+    div[data-baseweb="select"] li {
+        background-color: var(--input-bg) !important;
+        color: var(--text-color) !important;
+        opacity: 1 !important;
+    }
+    
+    div[data-baseweb="select"] li span {
+        color: var(--text-color) !important;
+        opacity: 1 !important;
+    }
+    
+    div[data-baseweb="select"] li:hover {
+        background-color: var(--text-color-20) !important;
+    }
+    
+    /* Selected option in dropdown */
+    div[data-baseweb="select"] [aria-selected="true"] {
+        background-color: #4CAF50 !important;
+        color: #FFFFFF !important;
+    }
+    
+    /* Currently displayed value in dropdown input */
+    div[data-baseweb="select"] input {
+        color: var(--text-color) !important;
+    }
+    
+    /* Input placeholder text */
+    input::placeholder, textarea::placeholder {
+        color: var(--text-color-60) !important;
+    }
+    
+    /* DataFrame/Table text visibility */
+    div[data-testid="stDataFrame"] {
+        color: var(--text-color) !important;
+        background-color: var(--bg-color) !important;
+    }
+    
+    div[data-testid="stDataFrame"] table {
+        color: var(--text-color) !important;
+        background-color: var(--bg-color) !important;
+    }
+    
+    div[data-testid="stDataFrame"] th,
+    div[data-testid="stDataFrame"] td {
+        color: var(--text-color) !important;
+        background-color: var(--bg-color) !important;
+    }
+    
+    /* Force table container backgrounds */
+    div[data-testid="stDataFrame"] > div {
+        background-color: var(--bg-color) !important;
+    }
+    
+    /* Table header row */
+    div[data-testid="stDataFrame"] thead {
+        background-color: var(--bg-color) !important;
+    }
+    
+    div[data-testid="stDataFrame"] thead th {
+        background-color: var(--bg-color) !important;
+        color: var(--text-color) !important;
+    }
+    
+    /* Table body */
+    div[data-testid="stDataFrame"] tbody {
+        background-color: var(--bg-color) !important;
+    }
+    
+    div[data-testid="stDataFrame"] tbody tr {
+        background-color: var(--bg-color) !important;
+    }
+    
+    /* Warning and info boxes */
+    .stAlert {
+        background-color: var(--card-bg) !important;
+        color: var(--text-color) !important;
+    }
+    
+    /* Radio button labels */
+    div[role="radiogroup"] label {
+        color: var(--text-color) !important;
+    }
+    
+    /* Ensure button text is always visible */
+    button {
+        color: white !important;
+    }
+    
+    /* Tooltip text - make it darker in light mode */
+    div[data-baseweb="tooltip"] {
+        color: #000000 !important;
+        opacity: 1 !important;
+    }
+    
+    div[data-baseweb="tooltip"] * {
+        color: #000000 !important;
+        opacity: 1 !important;
+    }
+    
+    /* Sidebar text elements */
+    section[data-testid="stSidebar"] * {
+        color: var(--text-color) !important;
+    }
+    
+    /* Toggle Switch Container - Top Right */
+    .theme-toggle-container {
+        position: fixed;
+        top: 20px;
+        right: 20px;
+        z-index: 999999;
+        display: flex;
+        align-items: center;
+        gap: 10px;
+    }
+    
+    /* Toggle Switch */
+    .theme-switch {
+        position: relative;
+        display: inline-block;
+        width: 60px;
+        height: 30px;
+    }
+    
+    .theme-switch input {
+        opacity: 0;
+        width: 0;
+        height: 0;
+    }
+    
+    .slider {
+        position: absolute;
+        cursor: pointer;
+        top: 0;
+        left: 0;
+        right: 0;
+        bottom: 0;
+        background-color: #ccc;
+        transition: 0.3s;
+        border-radius: 30px;
+    }
+    
+    .slider:before {
+        position: absolute;
+        content: "";
+        height: 22px;
+        width: 22px;
+        left: 4px;
+        bottom: 4px;
+        background-color: white;
+        transition: 0.3s;
+        border-radius: 50%;
+    }
+    
+    input:checked + .slider {
+        background-color: #2196F3;
+    }
+    
+    input:checked + .slider:before {
+        transform: translateX(30px);
+    }
+    
+    /* Icons in toggle */
+    .slider:after {
+        content: '☀️';
+        position: absolute;
+        left: 8px;
+        top: 4px;
+        font-size: 16px;
+    }
+    
+    input:checked + .slider:after {
+        content: '🌙';
+        left: auto;
+        right: 8px;
+    }
+    
+    /* Style the theme toggle button */
+    button[key="theme_toggle"] {
+        position: fixed !important;
+        top: 10px !important;
+        right: 10px !important;
+        z-index: 999999 !important;
+        background: linear-gradient(135deg, #667eea 0%, #764ba2 100%) !important;
+        border: none !important;
+        border-radius: 50px !important;
+        width: 50px !important;
+        height: 50px !important;
+        font-size: 24px !important;
+        cursor: pointer !important;
+        box-shadow: 0 4px 15px rgba(0,0,0,0.2) !important;
+        transition: all 0.3s ease !important;
+    }
+    
+    button[key="theme_toggle"]:hover {
+        transform: scale(1.1) !important;
+        box-shadow: 0 6px 20px rgba(0,0,0,0.3) !important;
+    }
 
-def find_header_row(df):
-    """
-    Search first 10 rows to find a row that looks like a header (contains at least 2 keywords).
-    """
-    keywords = ['कित्ता', 'साविक', 'वडा', 'सिट', 'भूउपयोग', 'सि.नं.', 'Plot', 'Ward', 'Sheet', 'VDC']
-    for i in range(min(10, len(df))):
-        row_values = df.iloc[i].astype(str).tolist()
-        match_count = sum(1 for val in row_values if any(k.lower() in val.lower() for k in keywords))
-        if match_count >= 2:
-            return i
-    return 0
-
-def identify_columns(df):
-    """
-    Heuristically identify required columns from the dataframe.
-    """
-    cols = df.columns.tolist()
-    mapping = {
-        'vdc': None,
-        'ward': None,
-        'sheet_no': None,
-        'plot': None,
-        'land_use': None
+    /* Smooth Transitions for Buttons */
+    div.stButton > button {
+        transition: all 0.3s ease !important;
+        border-radius: 8px !important;
+    }
+    div.stButton > button:hover {
+        transform: scale(1.02);
+        box-shadow: 0 4px 12px rgba(0,0,0,0.1);
+    }
+
+    /* Dropdown & Input Animation */
+    div[data-baseweb="select"] > div,
+    div[data-baseweb="input"] > div {
+        transition: border-color 0.2s ease, box-shadow 0.2s ease, transform 0.2s ease !important;
+    }
+    div[data-baseweb="select"]:hover,
+    div[data-baseweb="input"]:hover {
+        transform: translateY(-1px);
+    }
+
+    /* Dropdown Menu Items (Popovers) */
+    li[data-baseweb="menu-item"], div[data-baseweb="menu-item"] {
+        transition: background-color 0.2s ease !important;
+    }
+
+    /* DataFrame/Table styling - Subtler, Faster Animation for "Reflow" feel */
+    div[data-testid="stDataFrame"] {
+        transition: opacity 0.3s ease;
+        animation: slideUp 0.4s ease-out;
+    }
+    @keyframes slideUp {
+        0% { transform: translateY(10px); opacity: 0; }
+        100% { transform: translateY(0); opacity: 1; }
+    }
+
+    /* Metric/Card hover effects */
+    div[data-testid="metric-container"] {
+        transition: transform 0.2s ease;
+    }
+    div[data-testid="metric-container"]:hover {
+        transform: translateY(-2px);
+    }
+
+    /* Smooth Text Transitions for Language Change */
+    /* --text-fade-in names a different animation per language to FORCE it to replay */
+    h1, h2, h3, h4, h5, h6, p, label, .stMarkdown, .stButton button, div[data-baseweb="select"] div, span {
+        animation: var(--text-fade-in) 0.6s ease-in-out;
+    }
+
+    @keyframes textFadeIn_NP {
+        0% { opacity: 0; }
+        100% { opacity: 1; }
+    }
+    @keyframes textFadeIn_EN {
+        0% { opacity: 0; }
+        100% { opacity: 1; }
+    }
+
+    /* Smooth transition for the whole sidebar */
+    section[data-testid="stSidebar"] > div {
+         transition: all 0.5s ease-in-out;
+    }
+
+    /* Header Image Styling */
+    [data-testid="stHeader"] {
+        background: rgba(0,0,0,0);
+    }
+    .block-container {
+        padding-top: 1rem !important;
+    }
+    /* Header Image Styling - Final Centering Attempt */
+    .header-wrapper {
+        text-align: center !important;
+        width: 100% !important;
+        margin-top: -4.5rem !important;
+        margin-bottom: 0.5rem !important;
+        display: block !important;
     }
     
-    # Heuristic rules (keywords)
-    keywords = {
-        'vdc': ['साविक गा', 'साविक', 'गा.वि.स', 'VDC', 'Municipality', 'Gapa', 'Napa'],
-        'ward': ['वडा', 'वडा नं', 'Ward', 'Ward No'],
-        'sheet_no': ['सिट नं', 'सिट', 'Sheet', 'Sheet No'],
-        'plot': ['कित्ता', 'कित्ता नं', 'Plot', 'Kitta', 'Kitta No'],
-        'land_use': ['भूउपयोग क्षेत्र', 'भूउपयोग', 'Land Use', 'Classification']
+    /* Force the Streamlit image container to be inline-block so it centers via text-align */
+    .header-wrapper [data-testid="stImage"] {
+        display: inline-block !important;
+        margin: 0 auto !important;
+    }
+
+    .header-wrapper img {
+        border-radius: 12px;
+        box-shadow: 0 4px 15px rgba(0,0,0,0.15);
+        max-height: 160px !important;
+        width: auto !important;
+        object-fit: contain;
+    }
+
+    /* Adjust main title margin and centering */
+    .main-title {
+        margin-top: 0.5rem !important;
+        text-align: center;
+        width: 100%;
     }
     
-    for key, patterns in keywords.items():
-        for col in cols:
-            col_str = str(col).strip()
-            if any(p.lower() in col_str.lower() for p in patterns):
-                mapping[key] = col
-                break
+    .header-container-final {
+        display: flex !important;
+        justify-content: center !important;
+        align-items: center !important;
+        width: 100% !important;
+        margin-top: -1.5rem !important; /* Moved down from -4.5rem */
+        margin-bottom: 0.5rem !important;
+    }
     
-    return mapping
+    .header-img-final {
+        width: 500px !important;
+        max-height: 160px !important;
+        object-fit: contain;
+        border-radius: 0 !important; /* Removed rounded corners */
+        box-shadow: none !important; /* Removed shadow */
+    }
+"""
+
+# Theme colors, set as CSS variables
+THEME_COLORS = {
+    'light': {
+        'bg-color': "#FFFFFF",
+        'sidebar-bg': "#F0F2F6",
+        'text-color': "#31333F",
+        'input-bg': "#FFFFFF",
+        'card-bg': "#FFFFFF"
+    },
+    'dark': {
+        'bg-color': "#0E1117",
+        'sidebar-bg': "#262730",
+        'text-color': "#FAFAFA",
+        'input-bg': "#2C2F36",
+        'card-bg': "#1E1E1E"
+    }
+}
+
+@st.cache_data
+def get_page_style():
+    """
+    PAGE_CSS without comments and extra spaces, built once per process.
+    It is the same on every rerun, so the browser keeps it and Streamlit only sends a reference.
+    """
+    css = re.sub(r'/\*.*?\*/', '', PAGE_CSS, flags=re.S)
+    css = re.sub(r'\s+', ' ', css)
+    css = re.sub(r' ?([{};,>]) ?', r'\1', css)
+    return f"<style>{css.strip()}</style>"
+
+@st.cache_data
+def get_theme_style(dark_mode, lang_code):
+    """
+    The few lines that change with the theme and language: colors and the text animation name.
+    """
+    colors = dict(THEME_COLORS['dark' if dark_mode else 'light'])
+    # Text color with transparency, for borders, hover and placeholders
+    for alpha in ('20', '40', '60'):
+        colors[f'text-color-{alpha}'] = colors['text-color'] + alpha
+    # Dynamic animation name to force re-triggering on language change
+    colors['text-fade-in'] = f"textFadeIn_{lang_code}"
+    variables = ''.join(f"--{name}:{value};" for name, value in colors.items())
+    return f"<style>:root{{{variables}}}</style>"
+
+def get_header_src():
+    # With static serving (.streamlit/config.toml) the browser downloads and caches the file once
+    if st.get_option("server.enableStaticServing") and os.path.exists("static/header.jpeg"):
+        return "app/static/header.jpeg"
+    header_base64 = get_image_base64("static/header.jpeg")
+    return f"data:image/jpeg;base64,{header_base64}" if header_base64 else None
 
 # Helper to encode image for robust HTML display
+@st.cache_data
 def get_image_base64(path):
     try:
         with open(path, "rb") as image_file:
@@ -125,6 +597,217 @@ def get_image_base64(path):
     except Exception:
         return None
 
+def plot_search_inputs(t):
+    # Plot number box (trimmed, so a typed space is no search) and how to match it
+    search_plot = st.sidebar.text_input(
+        t['kit_number'],
+        placeholder=t['search_placeholder']
+    )
+    match_modes = {
+        t['match_exact']: 'exact',
+        t['match_prefix']: 'prefix',
+        t['match_contains']: 'contains',
+        t['match_fuzzy']: 'fuzzy'
+    }
+    match_choice = st.sidebar.radio(t['plot_match'], options=list(match_modes), horizontal=True)
+    return search_plot.strip(), match_modes[match_choice]
+
+def sheet_label(name):
+    # Nepali sheet names with their romanized spelling, so typing 'Bhaktapur' in the box finds 'भक्तपुर'
+    spelled = fuzzy.latin(name)
+    return name if spelled == name else f"{name} ({spelled})"
+
+def ward_sheet_inputs(t, prepared):
+    # Ward and sheet no. dropdowns (sheet nos. of the chosen ward only), from the prebuilt index
+    filter_index = prepared['filter_index']
+    selected_ward = None
+    selected_sheet = None
+
+    # 1. Filter for Ward
+    if prepared['col_mapping']['ward']:
+        selected_ward = st.sidebar.selectbox(
+            t['ward'], 
+            filter_index['ward_options'], 
+            index=None, 
+            placeholder=t['select_placeholder']
+        )
+    
+    # 2. Filter for Sheet No (depends on Ward)
+    if prepared['col_mapping']['sheet_no']:
+        if selected_ward:
+            sheet_options = filter_index['ward_sheet_options'].get(selected_ward, [])
+        else:
+            sheet_options = filter_index['sheet_options']
+        selected_sheet = st.sidebar.selectbox(
+            t['sheet_no'], 
+            sheet_options, 
+            index=None, 
+            placeholder=t['select_placeholder']
+        )
+    return selected_ward, selected_sheet
+
+PAGE_SIZES = [25, 50, 100, 500]
+
+def page_bounds(total, t, reset_key):
+    """
+    Page size and page number controls. Returns the (start, end) of the rows to show, so only
+    that page is sent to the browser. A new reset_key (other filters) goes back to page 1.
+    """
+    col_size, col_page = st.columns(2)
+    with col_size:
+        page_size = st.selectbox(t['page_size'], PAGE_SIZES, index=1)
+    page_count = max(1, -(-total // page_size))
+    # One page widget for every result (a key per result would stay in the session for good):
+    # back to page 1 when the result or the page size changes
+    if st.session_state.get('page_of') != (reset_key, page_size):
+        st.session_state['page_of'] = (reset_key, page_size)
+        st.session_state['page'] = 1
+    st.session_state['page'] = min(st.session_state['page'], page_count)
+    with col_page:
+        page = st.number_input(t['page'], min_value=1, max_value=page_count, step=1, key='page')
+    start = (page - 1) * page_size
+    end = min(start + page_size, total)
+    st.caption(t['showing_rows'].format(start=start + 1 if total else 0, end=end, total=total, pages=page_count))
+    return start, end
+
+# Same list and data version: same answer, so reruns (paging, downloads) do not redo the lookup
+@st.cache_data(max_entries=8, show_spinner=False)
+def run_bulk_lookup(version, content, file_name, row_label, source_label, _all_sheets, _global_index):
+    lookup = bulk.read_lookup_list(content, file_name)
+    found, not_found = bulk.bulk_lookup(_all_sheets, _global_index, lookup, row_label, source_label)
+    return len(lookup), found, not_found
+
+def export_buttons(t, name, make_result):
+    """
+    CSV and Excel download buttons for a result. The file is written (chunk by chunk, see export.py)
+    only when a button is clicked, not on every rerun. make_result() gives its (columns, chunks).
+    """
+    file_name = re.sub(r'[^\w.-]+', '_', name).strip('_') or "results"
+    for col, file_format in zip(st.columns(2), ('csv', 'xlsx')):
+        with col:
+            st.download_button(
+                t[f'export_{file_format}'],
+                lambda file_format=file_format: export.export_buffer(make_result(), file_format),
+                file_name=f"{file_name}.{file_format}",
+                mime=export.MIME_TYPES[file_format],
+                on_click="ignore",
+                use_container_width=True
+            )
+
+def show_table(data, height=520):
+    # Timed, sending the rows to the browser (serializing them) is often the slow part of a rerun
+    with metrics.timer('app_show_table'):
+        st.dataframe(data, use_container_width=True, hide_index=True, height=height)
+
+def show_admin_panel(t, all_sheets):
+    """
+    Hidden sidebar panel with the timings, counters and sizes of this server process (metrics.py),
+    and how sure the column detection was for the sheets read so far.
+    """
+    with st.sidebar.expander(t['admin_metrics']):
+        st.dataframe(metrics.stage_summary(), use_container_width=True, hide_index=True)
+        st.json({**metrics.counters(), **metrics.values()}, expanded=False)
+        st.caption(t['admin_structure'])
+        st.dataframe(all_sheets.structure_confidence(), use_container_width=True, hide_index=True)
+        st.caption(t['admin_prometheus'])
+        st.code(metrics.prometheus_text(), language=None)
+
+def show_land_use_counts(t, counts, row_label, name):
+    """
+    A kitta count table (rows x land use) with totals, its downloads and a chart of the land use totals.
+    counts comes precomputed from records.py, so this only formats a small table.
+    """
+    if counts.empty:
+        st.info(t['no_land_use'])
+        return
+    blank = f"({t['blank_value']})"
+    table = counts.rename(index={'': blank}, columns={'': blank})
+    table[t['total']] = table.sum(axis=1)
+    table.loc[t['total']] = table.sum()
+    table = table.rename_axis(row_label).reset_index()
+
+    st.caption(t['summary_caption'])
+    export_buttons(t, name, lambda: export.sheet_export(table))
+    st.dataframe(table, use_container_width=True, hide_index=True)
+    st.bar_chart(table.iloc[-1, 1:-1].rename(t['total']), horizontal=True)
+
+def change_details(entry):
+    # The values of a journal entry as one line: "column: old → new" for changed cells
+    if entry['change'] == 'more':
+        return str(entry['rows'])
+    parts = []
+    for name, value in entry.get('values', {}).items():
+        if entry['change'] == 'changed':
+            before, after = ('' if v is None else v for v in value)
+            parts.append(f"{name}: {before} → {after}")
+        elif value is not None:
+            parts.append(f"{name}: {value}")
+    return "; ".join(parts)
+
+def show_recent_changes(t, journal, sheet_name=None):
+    """
+    Records added, removed or changed by the last data refreshes (refresh.record_changes), newest first.
+    """
+    entries = refresh.recent_changes(journal, sheet_name)
+    if not entries:
+        st.info(t['no_changes'])
+        return
+    table = pd.DataFrame({
+        t['changed_at']: [time.strftime('%Y-%m-%d %H:%M', time.localtime(entry['at'])) for entry in entries],
+        t['vdc']: [sheet_label(entry['sheet']) for entry in entries],
+        t['ward']: [entry.get('ward') for entry in entries],
+        t['sheet_no']: [entry.get('sheet_no') for entry in entries],
+        t['kit_number']: [entry.get('plot') for entry in entries],
+        t['change']: [t[f"change_{entry['change']}"] for entry in entries],
+        t['details']: [change_details(entry) for entry in entries]
+    })
+    export_buttons(t, f"changes_{sheet_name or 'all'}", lambda: export.sheet_export(table))
+    show_table(table)
+
+def show_bulk_lookup(t, all_sheets, data_version, sheet_names):
+    """
+    Bulk mode: look up a whole uploaded or pasted kitta list at once, with downloads.
+    """
+    uploaded = st.file_uploader(t['bulk_upload'], type=['csv', 'txt', 'xlsx'])
+    pasted = st.text_area(t['bulk_paste'], placeholder="VDC01, 3, 123\nVDC01, 3, 124/1", height=120)
+    st.caption(t['bulk_hint'])
+    if uploaded is not None:
+        content, file_name = uploaded.getvalue(), uploaded.name
+    elif pasted.strip():
+        content, file_name = pasted.encode('utf-8'), 'pasted.csv'
+    else:
+        return
+
+    global_index = get_global_plot_index(data_version, tuple(sheet_names), all_sheets)
+    try:
+        list_rows, found, not_found = run_bulk_lookup(
+            data_version, content, file_name, t['list_row'], t['source_sheet'], all_sheets, global_index
+        )
+    except Exception as e:
+        st.error(f"{t['bulk_error']}: {e}")
+        return
+
+    not_found = not_found.rename(columns={'vdc': t['vdc'], 'ward': t['ward'], 'plot': t['kit_number']})
+    st.write(t['bulk_summary'].format(
+        rows=list_rows, found=list_rows - len(not_found), missing=len(not_found), matches=len(found)
+    ))
+    export_buttons(t, "kitta_results", lambda: export.sheet_export(found))
+    if len(not_found):
+        st.download_button(
+            t['download_not_found'],
+            lambda: export.export_buffer(export.sheet_export(not_found), 'csv'),
+            file_name="kitta_not_found.csv",
+            mime=export.MIME_TYPES['csv'],
+            on_click="ignore"
+        )
+
+    start, end = page_bounds(len(found), t, reset_key=f"bulk|{hash(content)}")
+    show_table(found.iloc[start:end])
+    if len(not_found):
+        st.subheader(t['not_found'])
+        # The download has all of them
+        st.dataframe(not_found.head(PAGE_SIZES[-1]), use_container_width=True, hide_index=True)
+
 def main():
     # Button to switch language
     # Start with Nepali language
@@ -132,389 +815,17 @@ def main():
     lang_code = 'NP' if lang_choice == "नेपाली" else 'EN'
     t = TRANSLATIONS[lang_code]
 
-    # Dynamic animation name to force re-triggering on language change
-    anim_name = f"textFadeIn_{lang_code}"
-    
-    # Define theme colors based on state
-    if st.session_state.dark_mode:
-        bg_color = "#0E1117"
-        sidebar_bg = "#262730"
-        text_color = "#FAFAFA"
-        input_bg = "#2C2F36"
-        card_bg = "#1E1E1E"
-    else:
-        bg_color = "#FFFFFF"
-        sidebar_bg = "#F0F2F6"
-        text_color = "#31333F"
-        input_bg = "#FFFFFF"
-        card_bg = "#FFFFFF"
-
-    # Custom CSS for UI Animations & Theme Toggle
-    st.markdown(f"""
-    <style>
-        /* Theme Colors */
-        .stApp {{
-            background-color: {bg_color};
-            color: {text_color};
-            animation: fadeIn 0.8s ease-in-out;
-            transition: background-color 0.3s ease, color 0.3s ease;
-        }}
-        
-        @keyframes fadeIn {{
-            0% {{ opacity: 0; }}
-            100% {{ opacity: 1; }}
-        }}
-        
-        section[data-testid="stSidebar"] {{
-            background-color: {sidebar_bg};
-            transition: all 0.3s ease;
-        }}
-        
-        /* Text colors - comprehensive coverage */
-        h1, h2, h3, h4, h5, h6, p, span, label, div, li, a {{
-            color: {text_color} !important;
-        }}
-        
-        /* Ensure markdown text is visible */
-        .stMarkdown, .stMarkdown p, .stMarkdown span {{
-            color: {text_color} !important;
-        }}
-        
-        /* Input fields - background and text */
-        div[data-baseweb="select"] > div,
-        div[data-baseweb="input"] > div {{
-            background-color: {input_bg} !important;
-            color: {text_color} !important;
-            transition: background-color 0.3s ease;
-            border-color: {text_color}40 !important;
-        }}
-        
-        /* Dropdown menu items */
-        div[data-baseweb="select"] ul {{
-            background-color: {input_bg} !important;
-        }}
-        
-        div[data-baseweb="select"] li {{
-            background-color: {input_bg} !important;
-            color: {text_color} !important;
-            opacity: 1 !important;
-        }}
-        
-        div[data-baseweb="select"] li span {{
-            color: {text_color} !important;
-            opacity: 1 !important;
-        }}
-        
-        div[data-baseweb="select"] li:hover {{
-            background-color: {text_color}20 !important;
-        }}
-        
-        /* Selected option in dropdown */
-        div[data-baseweb="select"] [aria-selected="true"] {{
-            background-color: #4CAF50 !important;
-            color: #FFFFFF !important;
-        }}
-        
-        /* Currently displayed value in dropdown input */
-        div[data-baseweb="select"] input {{
-            color: {text_color} !important;
-        }}
-        
-        /* Input placeholder text */
-        input::placeholder, textarea::placeholder {{
-            color: {text_color}60 !important;
-        }}
-        
-        /* DataFrame/Table text visibility */
-        div[data-testid="stDataFrame"] {{
-            color: {text_color} !important;
-            background-color: {bg_color} !important;
-        }}
-        
-        div[data-testid="stDataFrame"] table {{
-            color: {text_color} !important;
-            background-color: {bg_color} !important;
-        }}
-        
-        div[data-testid="stDataFrame"] th,
-        div[data-testid="stDataFrame"] td {{
-            color: {text_color} !important;
-            background-color: {bg_color} !important;
-        }}
-        
-        /* Force table container backgrounds */
-        div[data-testid="stDataFrame"] > div {{
-            background-color: {bg_color} !important;
-        }}
-        
-        /* Table header row */
-        div[data-testid="stDataFrame"] thead {{
-            background-color: {bg_color} !important;
-        }}
-        
-        div[data-testid="stDataFrame"] thead th {{
-            background-color: {bg_color} !important;
-            color: {text_color} !important;
-        }}
-        
-        /* Table body */
-        div[data-testid="stDataFrame"] tbody {{
-            background-color: {bg_color} !important;
-        }}
-        
-        div[data-testid="stDataFrame"] tbody tr {{
-            background-color: {bg_color} !important;
-        }}
-        
-        /* Warning and info boxes */
-        .stAlert {{
-            background-color: {card_bg} !important;
-            color: {text_color} !important;
-        }}
-        
-        /* Radio button labels */
-        div[role="radiogroup"] label {{
-            color: {text_color} !important;
-        }}
-        
-        /* Ensure button text is always visible */
-        button {{
-            color: white !important;
-        }}
-        
-        /* Tooltip text - make it darker in light mode */
-        div[data-baseweb="tooltip"] {{
-            color: #000000 !important;
-            opacity: 1 !important;
-        }}
-        
-        div[data-baseweb="tooltip"] * {{
-            color: #000000 !important;
-            opacity: 1 !important;
-        }}
-        
-        /* Sidebar text elements */
-        section[data-testid="stSidebar"] * {{
-            color: {text_color} !important;
-        }}
-        
-        /* Toggle Switch Container - Top Right */
-        .theme-toggle-container {{
-            position: fixed;
-            top: 20px;
-            right: 20px;
-            z-index: 999999;
-            display: flex;
-            align-items: center;
-            gap: 10px;
-        }}
-        
-        /* Toggle Switch */
-        .theme-switch {{
-            position: relative;
-            display: inline-block;
-            width: 60px;
-            height: 30px;
-        }}
-        
-        .theme-switch input {{
-            opacity: 0;
-            width: 0;
-            height: 0;
-        }}
-        
-        .slider {{
-            position: absolute;
-            cursor: pointer;
-            top: 0;
-            left: 0;
-            right: 0;
-            bottom: 0;
-            background-color: #ccc;
-            transition: 0.3s;
-            border-radius: 30px;
-        }}
-        
-        .slider:before {{
-            position: absolute;
-            content: "";
-            height: 22px;
-            width: 22px;
-            left: 4px;
-            bottom: 4px;
-            background-color: white;
-            transition: 0.3s;
-            border-radius: 50%;
-        }}
-        
-        input:checked + .slider {{
-            background-color: #2196F3;
-        }}
-        
-        input:checked + .slider:before {{
-            transform: translateX(30px);
-        }}
-        
-        /* Icons in toggle */
-        .slider:after {{
-            content: '☀️';
-            position: absolute;
-            left: 8px;
-            top: 4px;
-            font-size: 16px;
-        }}
-        
-        input:checked + .slider:after {{
-            content: '🌙';
-            left: auto;
-            right: 8px;
-        }}
-        
-        /* Style the theme toggle button */
-        button[key="theme_toggle"] {{
-            position: fixed !important;
-            top: 10px !important;
-            right: 10px !important;
-            z-index: 999999 !important;
-            background: linear-gradient(135deg, #667eea 0%, #764ba2 100%) !important;
-            border: none !important;
-            border-radius: 50px !important;
-            width: 50px !important;
-            height: 50px !important;
-            font-size: 24px !important;
-            cursor: pointer !important;
-            box-shadow: 0 4px 15px rgba(0,0,0,0.2) !important;
-            transition: all 0.3s ease !important;
-        }}
-        
-        button[key="theme_toggle"]:hover {{
-            transform: scale(1.1) !important;
-            box-shadow: 0 6px 20px rgba(0,0,0,0.3) !important;
-        }}
-
-        /* Smooth Transitions for Buttons */
-        div.stButton > button {{
-            transition: all 0.3s ease !important;
-            border-radius: 8px !important;
-        }}
-        div.stButton > button:hover {{
-            transform: scale(1.02);
-            box-shadow: 0 4px 12px rgba(0,0,0,0.1);
-        }}
-
-        /* Dropdown & Input Animation */
-        div[data-baseweb="select"] > div,
-        div[data-baseweb="input"] > div {{
-            transition: border-color 0.2s ease, box-shadow 0.2s ease, transform 0.2s ease !important;
-        }}
-        div[data-baseweb="select"]:hover,
-        div[data-baseweb="input"]:hover {{
-            transform: translateY(-1px);
-        }}
-
-        /* Dropdown Menu Items (Popovers) */
-        li[data-baseweb="menu-item"], div[data-baseweb="menu-item"] {{
-            transition: background-color 0.2s ease !important;
-        }}
-
-        /* DataFrame/Table styling - Subtler, Faster Animation for "Reflow" feel */
-        div[data-testid="stDataFrame"] {{
-            transition: opacity 0.3s ease;
-            animation: slideUp 0.4s ease-out;
-        }}
-        @keyframes slideUp {{
-            0% {{ transform: translateY(10px); opacity: 0; }}
-            100% {{ transform: translateY(0); opacity: 1; }}
-        }}
-
-        /* Metric/Card hover effects */
-        div[data-testid="metric-container"] {{
-            transition: transform 0.2s ease;
-        }}
-        div[data-testid="metric-container"]:hover {{
-            transform: translateY(-2px);
-        }}
-
-        /* Smooth Text Transitions for Language Change */
-        /* We change the animation name based on language to FORCE it to replay */
-        h1, h2, h3, h4, h5, h6, p, label, .stMarkdown, .stButton button, div[data-baseweb="select"] div, span {{
-            animation: {anim_name} 0.6s ease-in-out;
-        }}
-
-        @keyframes {anim_name} {{
-            0% {{ opacity: 0; }}
-            100% {{ opacity: 1; }}
-        }}
-
-        /* Smooth transition for the whole sidebar */
-        section[data-testid="stSidebar"] > div {{
-             transition: all 0.5s ease-in-out;
-        }}
-
-        /* Header Image Styling */
-        [data-testid="stHeader"] {{
-            background: rgba(0,0,0,0);
-        }}
-        .block-container {{
-            padding-top: 1rem !important;
-        }}
-        /* Header Image Styling - Final Centering Attempt */
-        .header-wrapper {{
-            text-align: center !important;
-            width: 100% !important;
-            margin-top: -4.5rem !important;
-            margin-bottom: 0.5rem !important;
-            display: block !important;
-        }}
-        
-        /* Force the Streamlit image container to be inline-block so it centers via text-align */
-        .header-wrapper [data-testid="stImage"] {{
-            display: inline-block !important;
-            margin: 0 auto !important;
-        }}
-
-        .header-wrapper img {{
-            border-radius: 12px;
-            box-shadow: 0 4px 15px rgba(0,0,0,0.15);
-            max-height: 160px !important;
-            width: auto !important;
-            object-fit: contain;
-        }}
-
-        /* Adjust main title margin and centering */
-        .main-title {{
-            margin-top: 0.5rem !important;
-            text-align: center;
-            width: 100%;
-        }}
-        
-        .header-container-final {{
-            display: flex !important;
-            justify-content: center !important;
-            align-items: center !important;
-            width: 100% !important;
-            margin-top: -1.5rem !important; /* Moved down from -4.5rem */
-            margin-bottom: 0.5rem !important;
-        }}
-        
-        .header-img-final {{
-            width: 500px !important;
-            max-height: 160px !important;
-            object-fit: contain;
-            border-radius: 0 !important; /* Removed rounded corners */
-            box-shadow: none !important; /* Removed shadow */
-        }}
-    </style>
-""", unsafe_allow_html=True)
-
+    # Page stylesheet (same for everyone) and the colors of the chosen theme
+    st.markdown(get_page_style(), unsafe_allow_html=True)
+    st.markdown(get_theme_style(st.session_state.dark_mode, lang_code), unsafe_allow_html=True)
 
     # Display Header Image using direct HTML for perfect centering
-    header_base64 = get_image_base64("static/header.jpeg")
-    if header_base64:
+    header_src = get_header_src()
+    if header_src:
         st.markdown(
             f'''
             <div class="header-container-final">
-                <img src="data:image/jpeg;base64,{header_base64}" class="header-img-final">
+                <img src="{header_src}" class="header-img-final">
             </div>
             ''',
             unsafe_allow_html=True
@@ -535,48 +846,100 @@ def main():
 
     # Get the data now
     with st.spinner(t['loading_msg']):
-        all_sheets = load_all_sheets()
+        snapshot = load_all_sheets()
+
+    if snapshot:
+        all_sheets = snapshot['sheets']
+        data_version = snapshot['version']
 
-    if all_sheets:
         # Side menu for options
         st.sidebar.title(t['sidebar_title'])
         
         # Sheet Selection
         # Skip the first sheet (Cover Page)
-        sheet_names = list(all_sheets.keys())[1:] if len(all_sheets) > 1 else list(all_sheets.keys())
-        selected_sheet_name = st.sidebar.selectbox(
-            t['select_sheet'],
-            sheet_names,
-            index=0 if len(sheet_names) == 1 else None,
-            placeholder=t['select_placeholder']
-        )
+        sheet_names = refresh.data_sheet_names(all_sheets)
+        bulk_mode = st.sidebar.toggle(t['bulk_lookup'])
+        search_all = False if bulk_mode else st.sidebar.toggle(t['global_search'])
+        summary_mode = False if (bulk_mode or search_all) else st.sidebar.toggle(t['land_use_summary'])
+        changes_mode = False if (bulk_mode or search_all or summary_mode) else st.sidebar.toggle(t['recent_changes'])
+        selected_sheet_name = None
+        if not (bulk_mode or search_all):
+            # In the summary and the changes, no VDC means all of them
+            selected_sheet_name = st.sidebar.selectbox(
+                t['select_sheet'],
+                sheet_names,
+                index=0 if len(sheet_names) == 1 else None,
+                format_func=sheet_label,
+                placeholder=t['summary_all_sheets'] if (summary_mode or changes_mode) else t['select_placeholder']
+            )
 
         # Button to get new data
         if st.sidebar.button(t['refresh_button'], type="primary", use_container_width=True):
-            st.cache_data.clear()
-            st.rerun()
+            # Revalidate in the background, everyone keeps the current data meanwhile
+            refresh.start_refresh(get_workbook_state(), force=True)
+
+        workbook_state = get_workbook_state()
+        if workbook_state['refreshing']:
+            st.sidebar.caption(t['refreshing_msg'])
+        elif workbook_state['refreshed_at']:
+            st.sidebar.caption(t['data_status'].format(
+                minutes=int((time.time() - workbook_state['refreshed_at']) // 60),
+                duration=workbook_state['refresh_duration']
+            ))
+        if workbook_state['last_error']:
+            st.sidebar.caption(f"⚠️ {workbook_state['last_error']}")
+        if ADMIN_TOKEN and st.query_params.get('admin') == ADMIN_TOKEN:
+            show_admin_panel(t, all_sheets)
 
         st.sidebar.divider()
 
-        if selected_sheet_name:
-            df = all_sheets[selected_sheet_name].copy()
-            
-            # Find the correct header row
-            header_row_idx = find_header_row(df)
-            
-            # Re-assign data and headers
-            new_header = df.iloc[header_row_idx]
-            df = df.iloc[header_row_idx + 1:].reset_index(drop=True)
-            df.columns = new_header
-            
-            # Fix column names, remove spaces
-            df.columns = df.columns.astype(str).str.strip()
-            
-            # Delete bad columns starting with Unnamed or nan
-            df = df.loc[:, ~(df.columns.str.contains('^Unnamed') | (df.columns == 'nan'))]
-            
-            # Dynamically identify columns
-            col_mapping = identify_columns(df)
+        if bulk_mode:
+            show_bulk_lookup(t, all_sheets, data_version, sheet_names)
+
+        elif search_all:
+            global_index = get_global_plot_index(data_version, tuple(sheet_names), all_sheets)
+            search_plot, match_mode = plot_search_inputs(t)
+            if search_plot:
+                # Shared by all sessions (and reruns that only change the theme or language)
+                found = records.cached_global_plot_rows(
+                    workbook_state['result_cache'], data_version, global_index, search_plot, match_mode
+                )
+                st.write(f"जम्मा नतिजा (Total Results): {len(found)}")
+                export_buttons(
+                    t,
+                    f"kitta_{search_plot}",
+                    lambda: export.global_export(global_index, all_sheets, found, t['source_sheet'])
+                )
+                start, end = page_bounds(len(found), t, reset_key=f"all|{search_plot}|{match_mode}")
+                results = records.global_results(global_index, all_sheets, found[start:end], t['source_sheet'])
+                show_table(results)
+            else:
+                st.info(t['global_search_hint'])
+
+        elif summary_mode:
+            st.subheader(t['land_use_summary'])
+            if selected_sheet_name:
+                prepared = all_sheets[selected_sheet_name]
+                selected_ward, selected_sheet = ward_sheet_inputs(t, prepared)
+                if prepared['land_use_summary'] is None:
+                    st.warning(f"केही स्तम्भहरू फेला परेनन् (Some columns missing): {t['land_use']}")
+                else:
+                    # Re-slices the counts made with the sheet, the rows are not scanned again
+                    counts = records.land_use_counts(prepared['land_use_summary'], selected_ward, selected_sheet)
+                    show_land_use_counts(t, counts, t['ward'], f"land_use_{selected_sheet_name}")
+            else:
+                totals = get_land_use_totals(data_version, tuple(sheet_names), all_sheets)
+                show_land_use_counts(t, totals, t['source_sheet'], "land_use_all")
+
+        elif changes_mode:
+            st.subheader(t['recent_changes'])
+            show_recent_changes(t, workbook_state['journal'], selected_sheet_name)
+
+        elif selected_sheet_name:
+            prepared = all_sheets[selected_sheet_name]
+            df = prepared['df']
+
+            col_mapping = prepared['col_mapping']
             col_vdc = col_mapping['vdc']
             col_ward = col_mapping['ward']
             col_sheet = col_mapping['sheet_no']
@@ -585,51 +948,29 @@ def main():
             
             available_columns = df.columns.tolist()
 
-            # Make filters work
-            filtered_df = df.copy()
-
-            # 1. Filter for Ward
-            if col_ward:
-                ward_options = sorted(df[col_ward].dropna().astype(str).unique().tolist())
-                selected_ward = st.sidebar.selectbox(
-                    t['ward'], 
-                    ward_options, 
-                    index=None, 
-                    placeholder=t['select_placeholder']
-                )
-                if selected_ward:
-                    filtered_df = filtered_df[filtered_df[col_ward].astype(str) == selected_ward]
-            
-            # 2. Filter for Sheet No (depends on Ward)
-            if col_sheet:
-                sheet_options = sorted(filtered_df[col_sheet].dropna().astype(str).unique().tolist())
-                selected_sheet = st.sidebar.selectbox(
-                    t['sheet_no'], 
-                    sheet_options, 
-                    index=None, 
-                    placeholder=t['select_placeholder']
-                )
-                if selected_sheet:
-                    filtered_df = filtered_df[filtered_df[col_sheet].astype(str) == selected_sheet]
-            
+            # Make filters work, using the prebuilt index (no scans over the rows here)
+            selected_ward, selected_sheet = ward_sheet_inputs(t, prepared)
+            search_plot = None
+            match_mode = None
+
             # 3. Filter for Plot (Text Input)
             if col_plot:
-                search_plot = st.sidebar.text_input(
-                    t['kit_number'],
-                    placeholder=t['search_placeholder']
-                )
-                if search_plot:
-                    filtered_df = filtered_df[filtered_df[col_plot].astype(str).str.contains(search_plot, case=False, na=False)]
-            
-            # Put important columns first
-            found_cols = [c for c in [col_plot, col_ward, col_sheet] if c]
-            other_cols = [c for c in filtered_df.columns if c not in found_cols]
-            final_cols = found_cols + other_cols
-            filtered_df = filtered_df[final_cols]
-
-            # Show the table
-            st.write(f"जम्मा नतिजा (Total Results): {len(filtered_df)}")
-            st.dataframe(filtered_df, use_container_width=True, hide_index=True, height=520)
+                search_plot, match_mode = plot_search_inputs(t)
+
+            rows = records.cached_filter_rows(
+                workbook_state['result_cache'], snapshot['sheet_versions'][selected_sheet_name], selected_sheet_name, prepared,
+                selected_ward, selected_sheet, search_plot, match_mode
+            )
+
+            # Show the table, one page at a time
+            total = len(df) if rows is None else len(rows)
+            st.write(f"जम्मा नतिजा (Total Results): {total}")
+            export_buttons(t, selected_sheet_name, lambda: export.sheet_export(df, rows))
+            start, end = page_bounds(
+                total, t, reset_key=f"{selected_sheet_name}|{selected_ward}|{selected_sheet}|{search_plot}|{match_mode}"
+            )
+            page_df = df.iloc[start:end] if rows is None else df.iloc[rows[start:end]]
+            show_table(page_df)
             
             # Help fix if columns missing
             missing_cols = []
@@ -645,4 +986,6 @@ def main():
             st.info("कृपया डेटा हेर्नको लागि एउटा साविक गा.वि.स. चयन गर्नुहोस्। (Please select a VDC to view data.)")
 
 if __name__ == "__main__":
-    main()
+    # A whole rerun of the page, from the first widget to the last table
+    with metrics.timer('app_run'):
+        main()
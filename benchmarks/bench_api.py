@@ -0,0 +1,110 @@
+"""
+Requests per second of the JSON API (api.py) on a synthetic workbook.
+
+    python benchmarks/bench_api.py
+    python benchmarks/bench_api.py --clients 8 --seconds 10 --batch 100
+
+Starts api.py in this process against a generated workbook served from a local HTTP server,
+then `--clients` threads send kitta lookups over keep-alive connections for `--seconds`.
+With --batch N every request carries N lookups (POST /query).
+"""
+import argparse
+import http.client
+import json
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from synthetic import make_workbook, serve  # noqa: E402
+
+
+def client(port, sheet_names, batch, deadline, latencies, rng):
+    connection = http.client.HTTPConnection('127.0.0.1', port)
+    while time.perf_counter() < deadline:
+        queries = [
+            {'sheet': rng.choice(sheet_names), 'plot': str(rng.randint(1, 9999))} if rng.random() < 0.5
+            else {'plot': str(rng.randint(1, 9999))}
+            for _ in range(batch)
+        ]
+        started = time.perf_counter()
+        if batch == 1:
+            q = queries[0]
+            path = f"/query?plot={q['plot']}" + (f"&sheet={q['sheet']}" if 'sheet' in q else '')
+            connection.request('GET', path)
+        else:
+            connection.request('POST', '/query', json.dumps({'queries': queries}),
+                               {'Content-Type': 'application/json'})
+        response = connection.getresponse()
+        response.read()
+        if response.status != 200:
+            raise RuntimeError(f'HTTP {response.status}')
+        latencies.append(time.perf_counter() - started)
+    connection.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--sheets', type=int, default=5)
+    parser.add_argument('--rows', type=int, default=100_000, help='rows over all sheets')
+    parser.add_argument('--clients', type=int, default=4)
+    parser.add_argument('--seconds', type=float, default=5)
+    parser.add_argument('--batch', type=int, default=1, help='lookups per request')
+    parser.add_argument('--output', help='also write the results to this JSON file')
+    args = parser.parse_args()
+
+    folder = tempfile.mkdtemp(prefix='land-record-api-')
+    sheet_names = make_workbook(folder, args.sheets, args.rows)[1:]
+    data_server = serve(folder)
+    os.environ['LAND_RECORD_DATA_URL'] = f'http://127.0.0.1:{data_server.server_address[1]}/workbook.xlsx'
+    os.environ['LAND_RECORD_SNAPSHOT_DIR'] = ''
+
+    sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+    import api
+
+    server = api.make_server(port=0)
+    started = time.perf_counter()
+    # Load every sheet and the cross-sheet index before measuring
+    server.queries.answer([{'plot': '1'}] + [{'sheet': name, 'plot': '1'} for name in sheet_names])
+    print(f'Loaded {args.sheets} sheets / {args.rows} rows in {time.perf_counter() - started:.1f} s')
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    latencies = []
+    deadline = time.perf_counter() + args.seconds
+    threads = [
+        threading.Thread(target=client, args=(server.server_address[1], sheet_names, args.batch,
+                                              deadline, latencies, random.Random(i)))
+        for i in range(args.clients)
+    ]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+    server.shutdown()
+    data_server.shutdown()
+
+    latencies.sort()
+    result = {
+        'clients': args.clients,
+        'batch': args.batch,
+        'requests': len(latencies),
+        'requests_per_second': round(len(latencies) / elapsed, 1),
+        'lookups_per_second': round(len(latencies) * args.batch / elapsed, 1),
+        'p50_ms': round(latencies[len(latencies) // 2] * 1000, 2),
+        'p95_ms': round(latencies[int(len(latencies) * 0.95)] * 1000, 2),
+        'p99_ms': round(latencies[int(len(latencies) * 0.99)] * 1000, 2)
+    }
+    print(json.dumps(result, indent=2))
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(result, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
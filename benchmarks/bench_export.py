@@ -0,0 +1,138 @@
+"""
+Time and memory of exporting a whole VDC sheet with export.py (chunked, straight to a file),
+against the usual pandas way of building the file in memory (df.iloc[rows].to_csv() /
+.to_excel()), for 100k, 500k and 1M rows.
+
+    python benchmarks/bench_export.py
+    python benchmarks/bench_export.py --rows 100000 --formats csv
+
+Every run is a separate process. "extra MB" is the highest RSS seen while exporting
+(sampled every 10 ms) minus the RSS just before, i.e. the memory the export itself needs.
+"""
+import argparse
+import io
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import export  # noqa: E402
+import records  # noqa: E402
+from synthetic import LAND_USES  # noqa: E402
+
+PAGE_SIZE = os.sysconf('SC_PAGE_SIZE')
+
+
+def rss_bytes():
+    with open('/proc/self/statm') as f:
+        return int(f.read().split()[1]) * PAGE_SIZE
+
+
+def make_sheet(rows):
+    # A prepared sheet like the ones in the app, made directly with numpy (no XLSX parsing)
+    rng = np.random.default_rng(42)
+    plots = rng.integers(1, 9999, rows).astype(str).astype(object)
+    split = rng.random(rows) < 0.2
+    plots[split] = [f'{p}/{s}' for p, s in zip(plots[split], rng.integers(1, 9, split.sum()))]
+    raw = pd.DataFrame({
+        0: ['सि.नं.'] + list(range(1, rows + 1)),
+        1: ['साविक गा.वि.स.'] + ['VDC01'] * rows,
+        2: ['वडा नं.'] + list(rng.integers(1, 10, rows)),
+        3: ['सिट नं.'] + list(rng.integers(1, 41, rows)),
+        4: ['कित्ता नं.'] + list(plots),
+        5: ['भूउपयोग क्षेत्र'] + list(rng.choice(LAND_USES, rows))
+    })
+    return records.prepare_sheet(raw)
+
+
+def run_export(rows, file_format, method):
+    """
+    Export every row of a generated sheet in this process and return time and memory numbers.
+    """
+    df = make_sheet(rows)['df']
+    path = os.path.join(tempfile.mkdtemp(prefix='land-record-export-'), f'out.{file_format}')
+
+    before = rss_bytes()
+    peak = [before]
+    done = threading.Event()
+
+    def sample():
+        while not done.wait(0.01):
+            peak[0] = max(peak[0], rss_bytes())
+
+    sampler = threading.Thread(target=sample, daemon=True)
+    sampler.start()
+    started = time.perf_counter()
+    if method == 'chunked':
+        with open(path, 'wb') as f:
+            for block in export.export_blocks(export.sheet_export(df, np.arange(len(df))), file_format):
+                f.write(block)
+    else:
+        # The usual st.download_button recipe: a filtered copy, then the whole file in memory
+        filtered_df = df.iloc[np.arange(len(df))]
+        if file_format == 'csv':
+            data = filtered_df.to_csv(index=False).encode('utf-8-sig')
+        else:
+            buffer = io.BytesIO()
+            filtered_df.to_excel(buffer, index=False, engine='openpyxl')
+            data = buffer.getvalue()
+        with open(path, 'wb') as f:
+            f.write(data)
+    seconds = time.perf_counter() - started
+    done.set()
+    sampler.join()
+    peak[0] = max(peak[0], rss_bytes())
+
+    return {
+        'rows': rows,
+        'format': file_format,
+        'method': method,
+        'seconds': round(seconds, 2),
+        'file_mb': round(os.path.getsize(path) / 1e6, 1),
+        'sheet_mb': round(df.memory_usage(deep=True).sum() / 1e6, 1),
+        'extra_mb': round((peak[0] - before) / 1e6, 1)
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--rows', type=int, nargs='+', default=[100_000, 500_000, 1_000_000])
+    parser.add_argument('--formats', nargs='+', default=['csv', 'xlsx'], choices=list(export.MIME_TYPES))
+    parser.add_argument('--methods', nargs='+', default=['chunked', 'pandas'], choices=['chunked', 'pandas'])
+    parser.add_argument('--output', help='also write the results to this JSON file')
+    parser.add_argument('--run', nargs=3, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run:
+        print(json.dumps(run_export(int(args.run[0]), args.run[1], args.run[2])))
+        return
+
+    results = []
+    print(f"{'rows':>9} {'format':>6} {'method':>8} {'seconds':>8} {'file MB':>8} {'sheet MB':>9} {'extra MB':>9}")
+    for rows in args.rows:
+        for file_format in args.formats:
+            for method in args.methods:
+                output = subprocess.run(
+                    [sys.executable, __file__, '--run', str(rows), file_format, method],
+                    check=True, capture_output=True, text=True
+                ).stdout
+                result = json.loads(output.strip().splitlines()[-1])
+                results.append(result)
+                print(f"{rows:>9} {file_format:>6} {method:>8} {result['seconds']:>8.2f} {result['file_mb']:>8.1f} "
+                      f"{result['sheet_mb']:>9.1f} {result['extra_mb']:>9.1f}")
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
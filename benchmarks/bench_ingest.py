@@ -0,0 +1,99 @@
+"""
+Compare the ingest.py engines on a synthetic workbook (default: 20 sheets, 500k rows in total).
+
+    python benchmarks/bench_ingest.py
+    python benchmarks/bench_ingest.py --sheets 5 --rows 50000 --workers 4
+
+Each engine runs in its own process so the peak memory (RSS) numbers do not mix.
+The CSV engine downloads the per-sheet CSV files from a local HTTP server.
+"""
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import ingest  # noqa: E402
+from synthetic import make_workbook, serve  # noqa: E402
+
+
+def read_csv_sheets(url_template, sheet_names, workers):
+    # Download and parse the CSV export of each sheet, several at a time, like the 'csv' engine
+    files = ingest.download_csv_sheets(url_template, sheet_names, workers=workers)
+    return {name: ingest.read_csv_sheet(content) for name, content in files.items()}
+
+
+def run_engine(folder, engine, workers):
+    """
+    Parse the workbook in this process and return timing, row count and peak RSS.
+    """
+    started = time.perf_counter()
+    if engine == 'csv':
+        server = serve(folder)
+        names = [f[:-4] for f in sorted(os.listdir(folder)) if f.endswith('.csv')]
+        template = f'http://127.0.0.1:{server.server_address[1]}/{{sheet}}.csv'
+        sheets = read_csv_sheets(template, names, max(workers, 4))
+        server.shutdown()
+    else:
+        with open(os.path.join(folder, 'workbook.xlsx'), 'rb') as f:
+            content = f.read()
+        sheets = ingest.read_xlsx_sheets(content, engine=engine, workers=workers)
+        del content
+
+    return {
+        'engine': engine,
+        'workers': workers,
+        'seconds': round(time.perf_counter() - started, 3),
+        'sheets': len(sheets),
+        'rows': int(sum(len(df) for df in sheets.values())),
+        # ru_maxrss is in kilobytes on Linux
+        'peak_rss_mb': round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--sheets', type=int, default=20)
+    parser.add_argument('--rows', type=int, default=500_000, help='rows over all sheets')
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1)
+    parser.add_argument('--folder', help='reuse or keep the generated files here')
+    parser.add_argument('--output', help='also write the results to this JSON file')
+    parser.add_argument('--run-engine', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run_engine:
+        print(json.dumps(run_engine(args.folder, args.run_engine, args.workers)))
+        return
+
+    folder = args.folder or tempfile.mkdtemp(prefix='land-record-bench-')
+    if not os.path.exists(os.path.join(folder, 'workbook.xlsx')):
+        os.makedirs(folder, exist_ok=True)
+        started = time.perf_counter()
+        make_workbook(folder, args.sheets, args.rows)
+        print(f'Generated {args.sheets} sheets / {args.rows} rows in {time.perf_counter() - started:.1f} s')
+    print(f"workbook.xlsx: {os.path.getsize(os.path.join(folder, 'workbook.xlsx')) / 1e6:.1f} MB in {folder}")
+
+    runs = [('pandas', 1), ('streaming', 1), ('streaming', args.workers), ('csv', args.workers)]
+    results = []
+    for engine, workers in runs:
+        output = subprocess.run(
+            [sys.executable, __file__, '--folder', folder, '--run-engine', engine, '--workers', str(workers)],
+            check=True, capture_output=True, text=True
+        ).stdout
+        result = json.loads(output.strip().splitlines()[-1])
+        results.append(result)
+        print(f"{engine:>10} x{workers:<3} {result['seconds']:>8.2f} s  {result['rows']:>9} rows  "
+              f"peak {result['peak_rss_mb']:>7.1f} MB")
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
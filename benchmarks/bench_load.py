@@ -0,0 +1,256 @@
+"""
+How many clerks one app process can serve: many sessions clicking through app.py at the same time.
+
+    python benchmarks/bench_load.py
+    python benchmarks/bench_load.py --sessions 1 4 16 32 --seconds 60 --think 1.0 --output load.json
+
+Every session is a headless browser tab (streamlit.testing AppTest) in its own thread, all in one
+process like the sessions of one `streamlit run`, sharing its data and caches. A session opens the
+page, then over and over picks a VDC, a ward, sometimes a sheet no., and types a kitta number one
+keystroke at a time, waiting --think seconds on average between actions (0: as fast as it can).
+The workbook is made up (synthetic.py) and served from a local HTTP server, so nothing needs the
+internet. Each --sessions level runs for --seconds after every sheet was opened once.
+
+Reported per level: reruns per second over all sessions, rerun latency (p50 / p95 / p99 / max)
+as a session sees it, the app's own time per rerun (the app_run timer of metrics.py, without
+AppTest's work of reading the result), the memory of the process and how much it grew, and errors.
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import resource
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from synthetic import make_workbook, serve  # noqa: E402
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+APP = os.path.join(ROOT, 'app.py')
+
+
+def rss_mb():
+    # Resident memory of this process now (Linux), else its peak so far
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / 1024 / (1024 if sys.platform == 'darwin' else 1)
+
+
+def share_app_test_runtime():
+    """
+    AppTest runs one test at a time: every run compiles the script again and installs (then removes)
+    its own stand-in for the Streamlit runtime. Make concurrent sessions share one compiled script
+    and one runtime instead, as the sessions of a real server do.
+    """
+    from streamlit import config, logger
+    from streamlit.runtime import Runtime
+    from streamlit.runtime.scriptrunner.script_cache import ScriptCache
+    from streamlit.testing.v1 import app_test, local_script_runner
+
+    script_cache = ScriptCache()
+    app_test.ScriptCache = lambda: script_cache
+    local_script_runner.ScriptCache = lambda: script_cache
+
+    # The first runtime AppTest installs stays, also while another session's run is removing its own
+    shared = []
+
+    def instance(cls):
+        if not shared and cls._instance is not None:
+            shared.append(cls._instance)
+        if not shared:
+            raise RuntimeError("Runtime hasn't been created!")
+        return shared[0]
+
+    Runtime.instance = classmethod(instance)
+    Runtime.exists = classmethod(lambda cls: bool(shared) or cls._instance is not None)
+    # Each run patches this option on and off again; with runs overlapping, keep it on for good
+    config.set_option('global.appTest', True)
+    # Only errors: the app's warnings would be printed once per rerun of every session
+    logger.set_log_level('error')
+
+
+class Session:
+    """
+    One clerk: a browser tab on the app, and the time every rerun it caused took.
+    """
+    def __init__(self, sheet_names, think, rng):
+        self.sheet_names = sheet_names
+        self.think = think
+        self.rng = rng
+        self.latencies = {}
+        self.errors = []
+        self.at = None
+
+    def run(self, action, step):
+        # One interaction and the rerun it causes, timed
+        started = time.perf_counter()
+        action().run()
+        seconds = time.perf_counter() - started
+        if self.at.exception:
+            raise RuntimeError(f'{step}: {self.at.exception[0].value}')
+        self.latencies.setdefault(step, []).append(seconds)
+        if self.think:
+            time.sleep(self.rng.expovariate(1 / self.think))
+
+    def open_page(self):
+        from streamlit.testing.v1 import AppTest
+
+        self.at = AppTest.from_file(APP, default_timeout=300)
+        self.run(lambda: self.at, 'open the page')
+
+    def look_up_one_kitta(self):
+        # Pick a VDC and a ward (sometimes a sheet no. too), then type a kitta number key by key
+        self.run(lambda: self.at.sidebar.selectbox[0].select(self.rng.choice(self.sheet_names)), 'select a VDC')
+        self.run(lambda: self.at.sidebar.selectbox[1].select(self.rng.choice(self.at.sidebar.selectbox[1].options)),
+                 'select a ward')
+        if self.rng.random() < 0.5:
+            self.run(
+                lambda: self.at.sidebar.selectbox[2].select(self.rng.choice(self.at.sidebar.selectbox[2].options)),
+                'select a sheet no.'
+            )
+        kitta = str(self.rng.randint(1, 9999))
+        for end in range(1, len(kitta) + 1):
+            self.run(lambda: self.at.sidebar.text_input[0].input(kitta[:end]), 'type a kitta digit')
+        self.run(lambda: self.at.sidebar.text_input[0].input(''), 'clear the kitta')
+
+    def loop(self, deadline):
+        # Look kittas up until the deadline; after an error start again with a new tab
+        time.sleep(self.rng.uniform(0, self.think))
+        while time.perf_counter() < deadline:
+            try:
+                if self.at is None:
+                    self.open_page()
+                self.look_up_one_kitta()
+            except Exception as e:
+                self.errors.append(str(e))
+                self.at = None
+
+
+def percentiles_ms(latencies):
+    # p50 / p95 / p99 / max of a list of seconds, in milliseconds
+    latencies = sorted(latencies)
+    if not latencies:
+        return {}
+    result = {
+        f'p{q}_ms': round(latencies[min(len(latencies) - 1, int(len(latencies) * q / 100))] * 1000, 1)
+        for q in (50, 95, 99)
+    }
+    result['max_ms'] = round(latencies[-1] * 1000, 1)
+    return result
+
+
+def run_level(count, seconds, think, sheet_names, seed):
+    """
+    `count` sessions at the same time for `seconds`. Returns the numbers of this level.
+    """
+    import metrics
+
+    metrics.reset()
+    memory_before = rss_mb()
+    sessions = [Session(sheet_names, think, random.Random(seed * 1000 + i)) for i in range(count)]
+    started = time.perf_counter()
+    deadline = started + seconds
+    threads = [threading.Thread(target=session.loop, args=(deadline,), daemon=True) for session in sessions]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+    # Measured while every session is still open, as on a server with that many tabs
+    memory_after = rss_mb()
+
+    by_step = {}
+    for session in sessions:
+        for step, latencies in session.latencies.items():
+            by_step.setdefault(step, []).extend(latencies)
+    everything = [seconds for latencies in by_step.values() for seconds in latencies]
+    app_run = next((row for row in metrics.stage_summary() if row['stage'] == 'app_run'), {})
+    errors = [error for session in sessions for error in session.errors]
+    return {
+        'sessions': count,
+        'seconds': round(elapsed, 1),
+        'reruns': len(everything),
+        'reruns_per_second': round(len(everything) / elapsed, 2),
+        'latency': percentiles_ms(everything),
+        'latency_by_step': {step: dict(percentiles_ms(latencies), reruns=len(latencies))
+                            for step, latencies in by_step.items()},
+        'app_run': {key: app_run[key] for key in ('p50_ms', 'p95_ms', 'p99_ms', 'max_ms') if key in app_run},
+        'rss_mb': round(memory_after, 1),
+        'rss_growth_mb': round(memory_after - memory_before, 1),
+        'errors': len(errors),
+        'first_errors': errors[:3]
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--sessions', type=int, nargs='+', default=[1, 2, 4, 8], help='sessions at the same time, per level')
+    parser.add_argument('--seconds', type=float, default=30, help='length of every level')
+    parser.add_argument('--think', type=float, default=0.5, help='average seconds between the actions of a session')
+    parser.add_argument('--sheets', type=int, default=10)
+    parser.add_argument('--rows', type=int, default=100_000, help='rows over all sheets')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--output', help='also write the results to this JSON file')
+    args = parser.parse_args()
+
+    folder = tempfile.mkdtemp(prefix='land-record-load-')
+    sheet_names = make_workbook(folder, args.sheets, args.rows, args.seed)[1:]
+    server = serve(folder)
+    os.environ['LAND_RECORD_DATA_URL'] = f'http://127.0.0.1:{server.server_address[1]}/workbook.xlsx'
+    os.environ['LAND_RECORD_SNAPSHOT_DIR'] = ''
+
+    # Streamlit reads .streamlit/config.toml from the working directory, like `streamlit run`
+    os.chdir(ROOT)
+    sys.path.insert(0, ROOT)
+    share_app_test_runtime()
+
+    # Load the data and open every sheet once, so the levels measure clerks, not the first download
+    memory_start = rss_mb()
+    started = time.perf_counter()
+    warm_up = Session(sheet_names, 0, random.Random(args.seed))
+    warm_up.open_page()
+    for name in sheet_names:
+        warm_up.run(lambda name=name: warm_up.at.sidebar.selectbox[0].select(name), 'select a VDC')
+    print(f"Loaded and opened {len(sheet_names)} sheets / {args.rows} rows in {time.perf_counter() - started:.1f} s"
+          f" ({rss_mb() - memory_start:+.0f} MB)")
+
+    print(f"{'sessions':>8} {'reruns/s':>9} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'max ms':>8}"
+          f" {'app p95':>8} {'RSS MB':>7} {'grew MB':>8} {'errors':>6}")
+    levels = []
+    for count in args.sessions:
+        level = run_level(count, args.seconds, args.think, sheet_names, args.seed + count)
+        levels.append(level)
+        latency = level['latency']
+        print(f"{count:>8} {level['reruns_per_second']:>9} {latency.get('p50_ms', '-'):>8}"
+              f" {latency.get('p95_ms', '-'):>8} {latency.get('p99_ms', '-'):>8} {latency.get('max_ms', '-'):>8}"
+              f" {level['app_run'].get('p95_ms', '-'):>8} {level['rss_mb']:>7} {level['rss_growth_mb']:>8}"
+              f" {level['errors']:>6}")
+        for error in level['first_errors']:
+            print(f"         error: {error}")
+    server.shutdown()
+
+    if args.output:
+        import streamlit
+
+        run = {
+            'meta': dict(vars(args), created=time.strftime('%Y-%m-%d %H:%M:%S'), python=platform.python_version(),
+                         streamlit=streamlit.__version__, cpus=os.cpu_count()),
+            'levels': levels
+        }
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(run, f, indent=2, ensure_ascii=False)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,114 @@
+"""
+Measure how many bytes the server sends to the browser on each rerun of app.py.
+
+    python benchmarks/bench_rerun_payload.py
+    python benchmarks/bench_rerun_payload.py --app path/to/other/app.py
+
+The app runs headless (streamlit.testing AppTest) against a small synthetic workbook served
+from a local HTTP server. Every message the script produces is counted twice: its full size,
+and the size actually sent when the browser already has the big messages it saw earlier in
+the session (Streamlit then sends only a short reference to them).
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from synthetic import make_workbook, serve  # noqa: E402
+
+
+class PayloadCounter:
+    """
+    Wraps ScriptRunContext.enqueue and adds up the message sizes of the current rerun.
+    """
+    def __init__(self):
+        self.seen_hashes = set()
+        self.reset()
+
+    def reset(self):
+        self.raw_bytes = 0
+        self.sent_bytes = 0
+        self.messages = 0
+
+    def install(self):
+        from streamlit.runtime.forward_msg_cache import create_reference_msg, populate_hash_if_needed
+        from streamlit.runtime.scriptrunner_utils.script_run_context import ScriptRunContext
+
+        original = ScriptRunContext.enqueue
+        counter = self
+
+        def enqueue(ctx, msg):
+            populate_hash_if_needed(msg)
+            size = msg.ByteSize()
+            counter.raw_bytes += size
+            counter.messages += 1
+            if msg.metadata.cacheable and msg.hash in counter.seen_hashes:
+                # The browser still has it, only the reference goes over the wire
+                counter.sent_bytes += create_reference_msg(msg).ByteSize()
+            else:
+                counter.sent_bytes += size
+                if msg.metadata.cacheable:
+                    counter.seen_hashes.add(msg.hash)
+            return original(ctx, msg)
+
+        ScriptRunContext.enqueue = enqueue
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--app', default=os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'app.py'))
+    parser.add_argument('--sheets', type=int, default=3)
+    parser.add_argument('--rows', type=int, default=3000, help='rows over all sheets')
+    parser.add_argument('--output', help='also write the results to this JSON file')
+    args = parser.parse_args()
+
+    folder = tempfile.mkdtemp(prefix='land-record-payload-')
+    sheet_names = make_workbook(folder, args.sheets, args.rows)
+    server = serve(folder)
+    os.environ['LAND_RECORD_DATA_URL'] = f'http://127.0.0.1:{server.server_address[1]}/workbook.xlsx'
+    os.environ['LAND_RECORD_SNAPSHOT_DIR'] = ''
+
+    # Streamlit reads .streamlit/config.toml from the working directory, like `streamlit run`
+    app = os.path.abspath(args.app)
+    os.chdir(os.path.dirname(app))
+
+    from streamlit.testing.v1 import AppTest
+
+    counter = PayloadCounter()
+    counter.install()
+    at = AppTest.from_file(app, default_timeout=120)
+
+    steps = [
+        ('open the page', lambda: at),
+        ('select a VDC', lambda: at.sidebar.selectbox[0].select(sheet_names[1])),
+        ('type a plot number', lambda: at.sidebar.text_input[0].input('12')),
+        ('type one more digit', lambda: at.sidebar.text_input[0].input('123')),
+        ('toggle dark mode', lambda: at.button(key='theme_toggle').click()),
+        ('switch to English', lambda: at.sidebar.radio[0].set_value('English')),
+    ]
+    results = []
+    print(f"{'step':<22} {'messages':>8} {'all bytes':>10} {'sent bytes':>11}")
+    for name, action in steps:
+        counter.reset()
+        action().run()
+        if at.exception:
+            raise SystemExit(f'{name}: {at.exception[0].value}')
+        results.append({
+            'step': name,
+            'messages': counter.messages,
+            'raw_bytes': counter.raw_bytes,
+            'sent_bytes': counter.sent_bytes
+        })
+        print(f'{name:<22} {counter.messages:>8} {counter.raw_bytes:>10} {counter.sent_bytes:>11}')
+
+    server.shutdown()
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,143 @@
+"""
+Memory of N app / API processes holding the same data: every process loading the workbook itself,
+against the shared mode (one loader.py, N workers memory-mapping its snapshot).
+
+    python benchmarks/bench_shared.py
+    python benchmarks/bench_shared.py --workers 8 --rows 500000
+
+Every worker opens all sheets and the cross-sheet plot index and answers a few queries, then
+waits while its memory is read from /proc/<pid>/smaps_rollup. PSS splits pages shared by several
+processes between them, so the PSS of all workers added up is what they cost together.
+"data MB" is that total less the same number of processes that only imported the code.
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from synthetic import make_workbook, serve  # noqa: E402
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+
+def memory_mb(pid):
+    # Rss, Pss and private (anonymous) memory of a process, in MB
+    values = {}
+    with open(f'/proc/{pid}/smaps_rollup') as f:
+        for line in f:
+            parts = line.split()
+            if parts[0] in ('Rss:', 'Pss:', 'Anonymous:'):
+                values[parts[0][:-1].lower()] = int(parts[1]) / 1024
+    return values
+
+
+def run_worker(load):
+    # One worker process: load everything (or only import the code), then wait to be measured
+    sys.path.insert(0, ROOT)
+    import records
+    import refresh
+
+    if load:
+        state = refresh.new_workbook_state()
+        snapshot = refresh.get_snapshot(state)
+        if snapshot is None:
+            raise SystemExit(state['last_error'])
+        workbook = snapshot['sheets']
+        names = refresh.data_sheet_names(workbook)
+        workbook.load(names)
+        global_index = workbook.global_plot_index(names)
+        for plot in ('1', '12', '123'):
+            records.query_records(workbook, {'plot': plot, 'mode': 'prefix'}, global_index)
+            records.query_records(workbook, {'sheet': names[0], 'ward': '3', 'plot': plot}, global_index)
+    print('ready', flush=True)
+    sys.stdin.readline()
+
+
+def measure(count, env, load=True):
+    """
+    Start `count` workers one after the other, and return their memory added up once all are loaded.
+    """
+    workers = []
+    started = time.perf_counter()
+    for _ in range(count):
+        worker = subprocess.Popen(
+            [sys.executable, os.path.abspath(__file__), '--worker', 'load' if load else 'import'],
+            stdin=subprocess.PIPE, stdout=subprocess.PIPE, text=True, env=env
+        )
+        if worker.stdout.readline().strip() != 'ready':
+            raise SystemExit('A worker failed to start')
+        workers.append(worker)
+    seconds = time.perf_counter() - started
+
+    total = {'rss': 0, 'pss': 0, 'anonymous': 0}
+    for worker in workers:
+        for key, value in memory_mb(worker.pid).items():
+            total[key] += value
+    for worker in workers:
+        worker.stdin.write('\n')
+        worker.stdin.flush()
+        worker.wait()
+    total['seconds'] = seconds
+    return total
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--sheets', type=int, default=5)
+    parser.add_argument('--rows', type=int, default=200_000, help='rows over all sheets')
+    parser.add_argument('--output', help='also write the results to this JSON file')
+    parser.add_argument('--worker', choices=['load', 'import'], help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        run_worker(args.worker == 'load')
+        return
+
+    folder = tempfile.mkdtemp(prefix='land-record-shared-')
+    make_workbook(folder, args.sheets, args.rows)
+    server = serve(folder)
+    env = dict(os.environ, LAND_RECORD_DATA_URL=f'http://127.0.0.1:{server.server_address[1]}/workbook.xlsx')
+    env.pop('LAND_RECORD_SHARED', None)
+
+    # Every process downloads, parses and keeps the data itself (memory only)
+    own_env = dict(env, LAND_RECORD_SNAPSHOT_DIR='')
+    # One loader publishes the snapshot, the workers attach to it
+    shared_env = dict(env, LAND_RECORD_SNAPSHOT_DIR=os.path.join(folder, 'snapshot'), LAND_RECORD_SHARED='worker')
+    started = time.perf_counter()
+    subprocess.run([sys.executable, os.path.join(ROOT, 'loader.py'), '--once'], env=shared_env, check=True,
+                   capture_output=True)
+    print(f'loader.py published the snapshot in {time.perf_counter() - started:.1f} s')
+
+    baseline = measure(args.workers, own_env, load=False)
+    results = []
+    print(f"{'mode':<10} {'workers':>7} {'start s':>8} {'RSS MB':>8} {'PSS MB':>8} {'private MB':>11} {'data MB':>8}")
+    for mode, mode_env in (('own copy', own_env), ('shared', shared_env)):
+        total = measure(args.workers, mode_env)
+        result = {
+            'mode': mode,
+            'workers': args.workers,
+            'rows': args.rows,
+            'start_seconds': round(total['seconds'], 1),
+            'rss_mb': round(total['rss'], 1),
+            'pss_mb': round(total['pss'], 1),
+            'private_mb': round(total['anonymous'], 1),
+            'data_mb': round(total['pss'] - baseline['pss'], 1)
+        }
+        results.append(result)
+        print(f"{mode:<10} {args.workers:>7} {result['start_seconds']:>8.1f} {result['rss_mb']:>8.1f} "
+              f"{result['pss_mb']:>8.1f} {result['private_mb']:>11.1f} {result['data_mb']:>8.1f}")
+
+    server.shutdown()
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,102 @@
+"""
+Refresh time with several source workbooks (LAND_RECORD_SOURCES), downloaded one after the other
+against all at the same time, from local HTTP servers that answer slowly like a spreadsheet export.
+
+    python benchmarks/bench_sources.py
+    python benchmarks/bench_sources.py --sources 8 --delay 2 --flaky
+
+Every source is a small synthetic workbook (synthetic.py) behind its own server. With --flaky
+every server first answers 503 once, so each download needs one retry. The second refresh of
+each run is a conditional request (If-Modified-Since), answered with 304 Not Modified.
+"""
+import argparse
+import os
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from synthetic import QuietHandler, make_workbook, serve  # noqa: E402
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+sys.path.insert(0, ROOT)
+
+import refresh  # noqa: E402
+
+
+def slow_handler(delay, flaky):
+    """
+    A file handler that waits `delay` seconds before every answer and, if `flaky`, answers the
+    first request for each file with 503.
+    """
+    failed = set()
+    lock = threading.Lock()
+
+    class SlowHandler(QuietHandler):
+        def do_GET(self):
+            time.sleep(delay)
+            with lock:
+                fail = flaky and self.path not in failed
+                failed.add(self.path)
+            if fail:
+                self.send_error(503)
+                return
+            super().do_GET()
+
+    return SlowHandler
+
+
+def refresh_seconds(sources, workers):
+    # Seconds of a first and a second (unchanged) refresh with `workers` downloads at a time
+    refresh.FETCH_WORKERS = workers
+    state = refresh.new_workbook_state()
+    started = time.perf_counter()
+    refresh.refresh_workbook(state, sources, folder=None)
+    first = time.perf_counter() - started
+    if state['source_errors']:
+        raise SystemExit(f"Download failed: {state['source_errors']}")
+    started = time.perf_counter()
+    changed = refresh.refresh_workbook(state, sources, folder=None)
+    second = time.perf_counter() - started
+    return first, second, changed, state['snapshot']
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--sources', type=int, default=6)
+    parser.add_argument('--sheets', type=int, default=3, help='VDC sheets per source')
+    parser.add_argument('--rows', type=int, default=5000, help='rows per source')
+    parser.add_argument('--delay', type=float, default=1.0, help='seconds each server waits before answering')
+    parser.add_argument('--flaky', action='store_true', help='answer the first request of each file with 503')
+    args = parser.parse_args()
+
+    folder = tempfile.mkdtemp(prefix='land-record-sources-')
+    folders = []
+    for i in range(args.sources):
+        folders.append(os.path.join(folder, f'source{i + 1}'))
+        os.makedirs(folders[-1])
+        make_workbook(folders[-1], args.sheets, args.rows, seed=i)
+
+    print(f"{args.sources} sources, {args.delay} s per answer{', first answer 503' if args.flaky else ''}")
+    print(f"{'downloads at a time':<20} {'first refresh s':>16} {'unchanged s':>12}")
+    for workers in (1, args.sources):
+        # New servers for every run, so --flaky fails the first request of each run
+        servers = [serve(source_folder, slow_handler(args.delay, args.flaky)) for source_folder in folders]
+        sources = {
+            f'Municipality{i + 1}': f'http://127.0.0.1:{server.server_address[1]}/workbook.xlsx'
+            for i, server in enumerate(servers)
+        }
+        first, second, changed, snapshot = refresh_seconds(sources, workers)
+        print(f"{workers:<20} {first:>16.2f} {second:>12.2f}")
+        for server in servers:
+            server.shutdown()
+
+    names = refresh.data_sheet_names(snapshot['sheets'])
+    print(f"\nOne snapshot: {len(snapshot['sheets'])} sheets, {len(names)} searched, e.g. {names[0]}"
+          f" ({'changed' if changed else 'unchanged'} on the second refresh)")
+
+
+if __name__ == '__main__':
+    main()
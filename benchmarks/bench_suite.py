@@ -0,0 +1,312 @@
+"""
+One benchmark run over the whole pipeline, saved as JSON so versions of the app can be compared.
+
+    python benchmarks/bench_suite.py --output before.json
+    python benchmarks/bench_suite.py --output after.json --compare before.json
+    python benchmarks/bench_suite.py --sheets 20 --rows 500000 --skip render
+
+Everything runs offline on a synthetic workbook (synthetic.py; the same seed gives the same data),
+read from a local file, and served to the app from a local HTTP server. Stages:
+
+    ingest       read every sheet of workbook.xlsx with the configured engine
+    detect       detect_structure (header row, columns) on every raw sheet, without and with its cache
+    prepare      prepare_sheet (header, compact types, indexes) on every raw sheet
+    cascade      records.filter_rows per query: ward, ward + sheet no., ward + sheet no. + kitta
+    plot_search  one kitta in one sheet (exact, prefix, contains) and in all sheets
+    diff         changes.diff_sheets of every sheet against an edited copy (rows reordered, 1% removed,
+                 1% with another land use), as after a refresh
+    render       app.py reruns (AppTest) for the same cascade: seconds, and bytes sent to the browser
+
+Short stages are repeated (--repeat) and their median is kept.
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from synthetic import make_workbook, serve  # noqa: E402
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+sys.path.insert(0, ROOT)
+
+import changes  # noqa: E402
+import ingest  # noqa: E402
+import records  # noqa: E402
+import refresh  # noqa: E402
+
+STAGES = ('ingest', 'detect', 'prepare', 'cascade', 'plot_search', 'diff', 'render')
+
+
+def median_seconds(run, repeat):
+    # Median and fastest time of `repeat` calls of run()
+    times = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        run()
+        times.append(time.perf_counter() - started)
+    return {'seconds': round(statistics.median(times), 4), 'fastest_seconds': round(min(times), 4)}
+
+
+def per_query_us(run, queries, repeat):
+    # Median time of run(query) over all queries, in microseconds per query
+    times = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        for query in queries:
+            run(query)
+        times.append((time.perf_counter() - started) / len(queries))
+    return round(statistics.median(times) * 1e6, 1)
+
+
+def cascade_queries(prepared_sheets, count, rng):
+    """
+    (sheet, ward, sheet no., kitta) of `count` random records, as the app's dropdowns give them.
+    """
+    queries = []
+    names = [name for name, prepared in prepared_sheets.items() if all(prepared['col_mapping'].values())]
+    while len(queries) < count:
+        prepared = prepared_sheets[rng.choice(names)]
+        df = prepared['df']
+        col_mapping = prepared['col_mapping']
+        row = rng.randrange(len(df))
+        values = [df[col_mapping[key]].iloc[row] for key in ('ward', 'sheet_no', 'plot')]
+        if any(value is None or value != value for value in values):
+            continue
+        queries.append((prepared, *(str(value) for value in values)))
+    return queries
+
+
+def edited_sheet(prepared, rng):
+    """
+    A prepared sheet as it could look after the owner edited it: rows in another order,
+    1% of them removed and 1% with the land use of another row.
+    """
+    df = prepared['df']
+    col_land_use = prepared['col_mapping']['land_use']
+    rows = list(range(len(df)))
+    rng.shuffle(rows)
+    edited = df.iloc[rows[len(df) // 100:]].reset_index(drop=True)
+    if col_land_use:
+        changed = rng.sample(range(len(edited)), len(edited) // 100)
+        edited.loc[changed, col_land_use] = edited[col_land_use].iloc[0]
+    return records.build_prepared_sheet(edited, prepared['col_mapping'])
+
+
+def run_render(query_path, sheet_name, ward, sheet_no, plot):
+    """
+    Time the app's reruns for one ward -> sheet no. -> kitta cascade, and count the bytes sent.
+    Runs in its own process, started with LAND_RECORD_DATA_URL set to the local workbook.
+    """
+    from bench_rerun_payload import PayloadCounter
+    from streamlit.testing.v1 import AppTest
+
+    # Streamlit reads .streamlit/config.toml from the working directory, like `streamlit run`
+    os.chdir(ROOT)
+
+    counter = PayloadCounter()
+    counter.install()
+    at = AppTest.from_file(os.path.join(ROOT, 'app.py'), default_timeout=600)
+    steps = [
+        ('open the page', lambda: at),
+        ('select a VDC', lambda: at.sidebar.selectbox[0].select(sheet_name)),
+        ('select a ward', lambda: at.sidebar.selectbox[1].select(ward)),
+        ('select a sheet no.', lambda: at.sidebar.selectbox[2].select(sheet_no)),
+        ('type a kitta', lambda: at.sidebar.text_input[0].input(plot)),
+        ('search all VDCs', lambda: at.sidebar.toggle[1].set_value(True))
+    ]
+    results = {}
+    for name, action in steps:
+        counter.reset()
+        started = time.perf_counter()
+        action().run()
+        seconds = time.perf_counter() - started
+        if at.exception:
+            raise SystemExit(f'{name}: {at.exception[0].value}')
+        results[name] = {
+            'seconds': round(seconds, 4),
+            'messages': counter.messages,
+            'sent_bytes': counter.sent_bytes
+        }
+    with open(query_path, 'w', encoding='utf-8') as f:
+        json.dump(results, f)
+
+
+def version_info():
+    # What was measured: the code version and the libraries
+    import pandas as pd
+    import pyarrow as pa
+
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, capture_output=True,
+                                text=True, check=True).stdout.strip()
+        changed = bool(subprocess.run(['git', 'status', '--porcelain', '--untracked-files=no'], cwd=ROOT,
+                                      capture_output=True, text=True, check=True).stdout.strip())
+    except (OSError, subprocess.CalledProcessError):
+        commit, changed = None, None
+    return {
+        'commit': commit,
+        'uncommitted_changes': changed,
+        'python': platform.python_version(),
+        'pandas': pd.__version__,
+        'pyarrow': pa.__version__,
+        'machine': platform.machine(),
+        'cpus': os.cpu_count(),
+        'ingest_engine': refresh.INGEST_ENGINE
+    }
+
+
+def flatten(results, prefix=''):
+    # {'cascade': {'ward_us': 1}} -> {'cascade.ward_us': 1}, numbers only
+    values = {}
+    for key, value in results.items():
+        if isinstance(value, dict):
+            values.update(flatten(value, f'{prefix}{key}.'))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            values[f'{prefix}{key}'] = value
+    return values
+
+
+def compare(old, new):
+    """
+    Print every number of two runs side by side, with the change in percent.
+    """
+    old_values = flatten(old['results'])
+    new_values = flatten(new['results'])
+    print(f"\nAgainst {old['meta'].get('commit')} ({old['meta'].get('created')}):")
+    print(f"{'metric':<48} {'before':>12} {'after':>12} {'change':>8}")
+    for key, value in new_values.items():
+        before = old_values.get(key)
+        change = f'{(value - before) / before * 100:+.0f}%' if before else ''
+        print(f"{key:<48} {'' if before is None else before:>12} {value:>12} {change:>8}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--sheets', type=int, default=10)
+    parser.add_argument('--rows', type=int, default=100_000, help='rows over all sheets')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--queries', type=int, default=200, help='queries per filter / search benchmark')
+    parser.add_argument('--skip', nargs='*', default=[], choices=STAGES)
+    parser.add_argument('--folder', help='reuse or keep the generated workbook here')
+    parser.add_argument('--output', help='write the results to this JSON file')
+    parser.add_argument('--compare', help='print the change against an earlier JSON file')
+    parser.add_argument('--render', nargs=5, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.render:
+        run_render(*args.render)
+        return
+
+    folder = args.folder or tempfile.mkdtemp(prefix='land-record-suite-')
+    workbook_path = os.path.join(folder, 'workbook.xlsx')
+    if not os.path.exists(workbook_path):
+        os.makedirs(folder, exist_ok=True)
+        make_workbook(folder, args.sheets, args.rows, args.seed)
+    with open(workbook_path, 'rb') as f:
+        content = f.read()
+
+    results = {}
+    rng = random.Random(args.seed)
+
+    started = time.perf_counter()
+    raw_sheets = ingest.read_xlsx_sheets(content, engine=refresh.INGEST_ENGINE, workers=refresh.INGEST_WORKERS)
+    if 'ingest' not in args.skip:
+        results['ingest'] = {
+            'seconds': round(time.perf_counter() - started, 3),
+            'raw_rows': int(sum(len(df) for df in raw_sheets.values())),
+            'file_mb': round(len(content) / 1e6, 2)
+        }
+    data_sheets = {name: raw_sheets[name] for name in refresh.data_sheet_names(raw_sheets)}
+
+    if 'detect' not in args.skip:
+        results['detect'] = median_seconds(
+            lambda: [records.detect_structure(raw_df, use_cache=False) for raw_df in data_sheets.values()], args.repeat
+        )
+        results['detect']['cached'] = median_seconds(
+            lambda: [records.detect_structure(raw_df) for raw_df in data_sheets.values()], args.repeat
+        )
+    if 'prepare' not in args.skip:
+        results['prepare'] = median_seconds(
+            lambda: [records.prepare_sheet(raw_df) for raw_df in data_sheets.values()], max(1, args.repeat // 2)
+        )
+    prepared_sheets = {name: records.prepare_sheet(raw_df) for name, raw_df in data_sheets.items()}
+    queries = cascade_queries(prepared_sheets, args.queries, rng)
+
+    if 'cascade' not in args.skip:
+        results['cascade'] = {
+            'ward_us': per_query_us(lambda q: records.filter_rows(q[0], q[1]), queries, args.repeat),
+            'ward_sheet_us': per_query_us(lambda q: records.filter_rows(q[0], q[1], q[2]), queries, args.repeat),
+            'ward_sheet_kitta_us': per_query_us(lambda q: records.filter_rows(*q), queries, args.repeat),
+            # The table page the app then shows (first 50 rows of the ward)
+            'ward_page_us': per_query_us(
+                lambda q: q[0]['df'].iloc[records.filter_rows(q[0], q[1])[:50]], queries, args.repeat
+            )
+        }
+
+    if 'plot_search' not in args.skip:
+        global_index = records.build_global_plot_index(prepared_sheets)
+        results['plot_search'] = {
+            f'{mode}_us': per_query_us(
+                lambda q, mode=mode: records.search_plot_rows(q[0]['plot_index'], q[3][:3] if mode != 'exact' else q[3], mode),
+                queries, args.repeat
+            )
+            for mode in records.PLOT_MATCH_MODES
+        }
+        results['plot_search']['all_sheets_exact_us'] = per_query_us(
+            lambda q: records.global_plot_rows(global_index, q[3]), queries, args.repeat
+        )
+
+    if 'diff' not in args.skip:
+        edited = {name: edited_sheet(prepared, rng) for name, prepared in prepared_sheets.items()}
+        results['diff'] = median_seconds(
+            lambda: [changes.diff_sheets(prepared, edited[name]) for name, prepared in prepared_sheets.items()],
+            args.repeat
+        )
+        diffs = [changes.diff_sheets(prepared, edited[name]) for name, prepared in prepared_sheets.items()]
+        results['diff']['removed'] = sum(len(diff['removed']) for diff in diffs)
+        results['diff']['changed'] = sum(len(diff['changed'][0]) for diff in diffs)
+
+    if 'render' not in args.skip:
+        # In its own process: the app loads the workbook itself, like on a server
+        server = serve(folder)
+        prepared, ward, sheet_no, plot = queries[0]
+        sheet_name = next(name for name, p in prepared_sheets.items() if p is prepared)
+        output_path = os.path.join(folder, 'render.json')
+        env = dict(
+            os.environ,
+            LAND_RECORD_DATA_URL=f'http://127.0.0.1:{server.server_address[1]}/workbook.xlsx',
+            LAND_RECORD_SNAPSHOT_DIR=''
+        )
+        subprocess.run(
+            [sys.executable, os.path.abspath(__file__), '--render', output_path, sheet_name, ward, sheet_no, plot],
+            check=True, env=env
+        )
+        server.shutdown()
+        with open(output_path, encoding='utf-8') as f:
+            results['render'] = json.load(f)
+
+    run = {
+        'meta': dict(version_info(), created=time.strftime('%Y-%m-%d %H:%M:%S'), sheets=args.sheets,
+                     rows=args.rows, seed=args.seed, repeat=args.repeat, queries=args.queries),
+        'results': results
+    }
+    print(json.dumps(run, indent=2, ensure_ascii=False))
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(run, f, indent=2, ensure_ascii=False)
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            compare(json.load(f), run)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,138 @@
+"""
+Made-up land record workbooks for the benchmarks, shaped like the real Google Sheet: a cover
+sheet, then one sheet per VDC with a few title / blank rows above a Devanagari header row,
+some spelling differences in the headers, blank cells and sheets of different sizes.
+
+    python benchmarks/synthetic.py /tmp/land-records --sheets 20 --rows 500000
+
+The same arguments and seed always give the same workbook. Next to workbook.xlsx every sheet
+is also written as <sheet>.csv (like the per-sheet CSV export of Google Sheets).
+"""
+import argparse
+import csv
+import functools
+import http.server
+import os
+import random
+import threading
+
+LAND_USES = ['आवासीय', 'कृषि', 'व्यावसायिक', 'वन', 'सार्वजनिक', 'औद्योगिक']
+# Spellings of the same header seen in different sheets (identify_columns must find all of them)
+HEADERS = {
+    'serial': ['सि.नं.', 'सि.नं', 'क्र.सं.'],
+    'vdc': ['साविक गा.वि.स.', 'साविक गा.वि.स', 'साविक गाउँ विकास समिति'],
+    'ward': ['वडा नं.', 'वडा नं', 'वडा'],
+    'sheet_no': ['सिट नं.', 'सिट नं', 'नक्सा सिट नं.'],
+    'plot': ['कित्ता नं.', 'कित्ता नं', 'कित्ता'],
+    'area': ['क्षेत्रफल (व.मि.)'],
+    'land_use': ['भूउपयोग क्षेत्र', 'भूउपयोग']
+}
+REMARKS = ['', '', '', '', '', '', '', 'सडक', 'कुलो', 'विवादित']
+
+
+def sheet_sizes(rng, sheets, rows):
+    # Rows per sheet: uneven like real VDCs, adding up to `rows`
+    weights = [rng.uniform(0.4, 1.6) for _ in range(sheets)]
+    sizes = [int(rows * w / sum(weights)) for w in weights]
+    sizes[-1] += rows - sum(sizes)
+    return sizes
+
+
+def sheet_rows(rng, name, size):
+    """
+    The rows of one VDC sheet: title rows, the header row, then `size` records.
+    """
+    title = [['भू-उपयोग क्षेत्र वर्गीकरण विवरण']]
+    extra = [['जिल्ला: काठमाडौं', '', f'गा.वि.स.: {name}'], [], ['(स्रोत: नापी कार्यालय)']]
+    # find_header_row looks at the first 10 rows
+    top = title + rng.sample(extra, rng.randint(0, len(extra)))
+    header = [rng.choice(HEADERS[key]) for key in ('serial', 'vdc', 'ward', 'sheet_no', 'plot', 'area', 'land_use')]
+    with_remarks = rng.random() < 0.5
+    if with_remarks:
+        header.append('कैफियत')
+
+    # Most plots are in a few wards
+    wards = list(range(1, rng.randint(5, 12)))
+    ward_weights = [rng.uniform(0.2, 1.0) ** 2 for _ in wards]
+    rows = top + [header]
+    for r in range(size):
+        plot = rng.randint(1, 9999)
+        row = [
+            r + 1,
+            name,
+            rng.choices(wards, ward_weights)[0],
+            rng.randint(1, 40),
+            plot if rng.random() < 0.8 else f'{plot}/{rng.randint(1, 9)}',
+            round(rng.uniform(20, 5000), 2),
+            rng.choice(LAND_USES)
+        ]
+        if rng.random() < 0.002:
+            row[4] = None
+        if rng.random() < 0.01:
+            row[6] = None
+        if with_remarks:
+            row.append(rng.choice(REMARKS) or None)
+        rows.append(row)
+    return rows
+
+
+def make_workbook(folder, sheets, rows, seed=42):
+    """
+    Write workbook.xlsx (cover sheet + `sheets` VDC sheets, `rows` records in all) and one CSV
+    per sheet into `folder`. Returns the sheet names, cover sheet first.
+    """
+    import openpyxl
+
+    rng = random.Random(seed)
+    workbook = openpyxl.Workbook(write_only=True)
+    cover = workbook.create_sheet('Cover')
+    cover.append(['भू-उपयोग क्षेत्र वर्गीकरण'])
+    cover.append([])
+    cover.append(['यो तालिका नमुना तथ्याङ्क हो।'])
+
+    names = [f'VDC{s + 1:02d}' for s in range(sheets)]
+    for name, size in zip(names, sheet_sizes(rng, sheets, rows)):
+        data = sheet_rows(rng, name, size)
+        worksheet = workbook.create_sheet(name)
+        for row in data:
+            worksheet.append(row)
+        # Like Google's CSV export, every row has the same number of fields
+        width = max(len(row) for row in data)
+        with open(os.path.join(folder, f'{name}.csv'), 'w', newline='', encoding='utf-8') as f:
+            csv.writer(f).writerows(
+                ['' if value is None else value for value in row] + [''] * (width - len(row)) for row in data
+            )
+
+    workbook.save(os.path.join(folder, 'workbook.xlsx'))
+    return ['Cover'] + names
+
+
+class QuietHandler(http.server.SimpleHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+
+def serve(folder, handler=QuietHandler):
+    """
+    Serve the files in `folder` over HTTP on a free local port, in a background thread.
+    """
+    server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), functools.partial(handler, directory=folder))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('folder')
+    parser.add_argument('--sheets', type=int, default=20)
+    parser.add_argument('--rows', type=int, default=500_000, help='rows over all sheets')
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+
+    os.makedirs(args.folder, exist_ok=True)
+    names = make_workbook(args.folder, args.sheets, args.rows, args.seed)
+    print(f"{len(names) - 1} sheets / {args.rows} rows in {os.path.join(args.folder, 'workbook.xlsx')}")
+
+
+if __name__ == '__main__':
+    main()
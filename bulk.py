@@ -0,0 +1,195 @@
+"""
+Bulk kitta lookup: reading a pasted or uploaded list of "VDC, ward, kitta" lines and finding all
+of them at once in the cross-sheet plot index (records.build_global_plot_index).
+"""
+import csv
+import io
+import re
+
+import numpy as np
+import pandas as pd
+
+import export
+import fuzzy
+import records
+
+# Characters of a pasted or uploaded kitta list looked at to tell its separator
+LOOKUP_SNIFF_BYTES = 4096
+
+
+def _match_key(value):
+    # Text to compare a ward from a kitta list with: trimmed, lower case, ASCII digits, 3.0 -> 3
+    if value is None or (isinstance(value, float) and np.isnan(value)):
+        return None
+    if isinstance(value, float) and value.is_integer():
+        value = int(value)
+    text = re.sub(r'\s+', ' ', fuzzy.fold(str(value)).strip().lower())
+    text = re.sub(r'^(\d+)\.0+$', r'\1', text)
+    return text or None
+
+
+def _name_match_key(value):
+    # Text to compare a VDC name with, in either script (see fuzzy.name_key)
+    text = _match_key(value)
+    return (fuzzy.name_key(text) or text) if text else None
+
+
+def _vdc_names(workbook, sheet_names):
+    # The VDC names of some sheets: their names (without the source) and the values of their VDC column
+    names = {sheet_name.rpartition('/')[2] for sheet_name in sheet_names}
+    for sheet_name in sheet_names:
+        prepared = workbook[sheet_name]
+        if prepared['col_mapping']['vdc']:
+            df = prepared['df']
+            values = df.iloc[:, df.columns.tolist().index(prepared['col_mapping']['vdc'])].dropna()
+            names.update(str(value) for value in pd.unique(values.to_numpy(dtype=object)))
+    return names
+
+
+def read_lookup_list(content, file_name=''):
+    """
+    Read a kitta list (an uploaded CSV/XLSX file, or pasted text, as bytes) into a DataFrame
+    with 'vdc', 'ward' and 'plot' columns; vdc and ward may be empty.
+
+    A first row naming the columns (e.g. "साविक गा.वि.स., वडा नं., कित्ता नं.") is used when
+    present. Otherwise columns are taken by position: kitta; ward, kitta; or VDC, ward, kitta.
+    Raises ValueError if there is no kitta in it.
+    """
+    if file_name.lower().endswith(('.xlsx', '.xls')):
+        raw = pd.read_excel(io.BytesIO(content), header=None, dtype=object)
+    else:
+        # Comma, tab or semicolon separated (quoted or not), lines may have different numbers of values
+        text = content.decode('utf-8-sig')
+        try:
+            dialect = csv.Sniffer().sniff(text[:LOOKUP_SNIFF_BYTES], delimiters=',\t;')
+        except csv.Error:
+            # One value per line
+            dialect = csv.excel
+        lines = [[value.strip() for value in line] for line in csv.reader(io.StringIO(text), dialect)]
+        raw = pd.DataFrame([line for line in lines if any(line)])
+        raw = raw.replace('', np.nan)
+    raw = raw.dropna(how='all').reset_index(drop=True)
+    filled_cols = np.flatnonzero(raw.notna().any(axis=0).to_numpy())
+    if raw.empty or len(filled_cols) == 0:
+        raise ValueError("The list is empty")
+    # Empty columns at the end only; one in the middle is a blank VDC or ward
+    raw = raw.iloc[:, :filled_cols[-1] + 1]
+
+    # Header row?
+    header = raw.iloc[0].fillna('').astype(str).str.strip().tolist()
+    mapping = records.identify_columns(pd.DataFrame(columns=header))
+    if mapping['plot']:
+        positions = {key: header.index(mapping[key]) if mapping[key] else None for key in ('vdc', 'ward', 'plot')}
+        raw = raw.iloc[1:]
+    else:
+        # The kitta is the last value of a line, so "123" next to "VDC01, 3, 124" is a kitta too
+        values = raw.to_numpy(dtype=object)
+        filled = pd.notna(values)
+        last = values.shape[1] - 1 - np.argmax(filled[:, ::-1], axis=1)
+        for shift in np.unique(values.shape[1] - 1 - last):
+            if shift:
+                lines = np.flatnonzero(last == values.shape[1] - 1 - shift)
+                values[lines] = np.roll(values[lines], shift, axis=1)
+        raw = pd.DataFrame(values[:, -3:])
+        keys = {1: ('plot',), 2: ('ward', 'plot')}.get(raw.shape[1], ('vdc', 'ward', 'plot'))
+        positions = {key: keys.index(key) if key in keys else None for key in ('vdc', 'ward', 'plot')}
+
+    lookup = pd.DataFrame({
+        key: raw.iloc[:, i].to_numpy(dtype=object) if i is not None else None
+        for key, i in positions.items()
+    })
+    lookup = lookup[lookup['plot'].map(records.normalize_plot_number).fillna('') != ''].reset_index(drop=True)
+    if lookup.empty:
+        raise ValueError("No kitta numbers found in the list")
+    return lookup
+
+
+def bulk_lookup(workbook, global_index, lookup, row_label='List row', source_label='Sheet'):
+    """
+    Find every kitta of a lookup list (read_lookup_list) in one pass.
+
+    The whole list is joined with the cross-sheet plot index at once; a VDC in the list must
+    match the sheet name or the sheet's VDC column (in either script, see fuzzy.name_key; a VDC
+    that matches none is taken as the name it is most like, see fuzzy.closest_name), and a ward
+    the ward column.
+    Returns (found, not_found): the matching rows with the list row number and source sheet
+    first, and the list rows that matched nothing.
+    """
+    lookup = lookup.reset_index(drop=True)
+    vdc_text = lookup['vdc'].map(_match_key)
+    requests_df = pd.DataFrame({
+        'list_row': np.arange(1, len(lookup) + 1),
+        'key': lookup['plot'].map(records.normalize_plot_number).to_numpy(dtype=object),
+        'vdc_text': vdc_text.to_numpy(dtype=object),
+        'vdc': vdc_text.map(_name_match_key).to_numpy(dtype=object),
+        'ward': lookup['ward'].map(_match_key).to_numpy(dtype=object)
+    })
+    index_df = pd.DataFrame({
+        'key': global_index['keys'].to_numpy(zero_copy_only=False),
+        'sheet': pd.Categorical.from_codes(global_index['sheet'], categories=global_index['sheet_names']),
+        'row': global_index['row']
+    })
+    hits = requests_df.merge(index_df, on='key', how='inner', sort=False)
+
+    # VDCs of the list that no sheet has, as the name they are most like (romanized differently)
+    if hits['vdc'].notna().any():
+        names = _vdc_names(workbook, hits['sheet'].unique().tolist())
+        known = {_name_match_key(name) for name in names}
+        closest = {}
+        for text in pd.unique(hits['vdc_text'].dropna().to_numpy(dtype=object)):
+            if _name_match_key(text) not in known:
+                name = fuzzy.closest_name(names, text)
+                if name is not None:
+                    closest[text] = _name_match_key(name)
+        if closest:
+            hits['vdc'] = [closest.get(text, key) for text, key in zip(hits['vdc_text'], hits['vdc'])]
+
+    found_hits = []
+    list_rows = []
+    for sheet_name, group in hits.groupby('sheet', observed=True, sort=False):
+        prepared = workbook[sheet_name]
+        df = prepared['df']
+        col_mapping = prepared['col_mapping']
+        # Key columns by position (the first of a repeated name, like col_mapping)
+        names = df.columns.tolist()
+        rows = group['row'].to_numpy()
+        keep = np.ones(len(group), dtype=bool)
+
+        # VDC: the sheet name or the VDC column
+        wanted_vdc = group['vdc'].to_numpy(dtype=object)
+        has_vdc = pd.notna(wanted_vdc)
+        if has_vdc.any():
+            # Without the source of the sheet ("<source>/<sheet>")
+            vdc_ok = wanted_vdc == _name_match_key(sheet_name.rpartition('/')[2])
+            if col_mapping['vdc']:
+                values = df.iloc[rows, names.index(col_mapping['vdc'])].map(_name_match_key).to_numpy(dtype=object)
+                vdc_ok |= wanted_vdc == values
+            keep &= ~has_vdc | vdc_ok
+
+        # Ward
+        wanted_ward = group['ward'].to_numpy(dtype=object)
+        has_ward = pd.notna(wanted_ward)
+        if has_ward.any():
+            if col_mapping['ward']:
+                values = df.iloc[rows, names.index(col_mapping['ward'])].map(_match_key).to_numpy(dtype=object)
+                keep &= ~has_ward | (wanted_ward == values)
+            else:
+                keep &= ~has_ward
+
+        if keep.any():
+            found_hits.append((sheet_name, rows[keep]))
+            list_rows.append(group['list_row'].to_numpy()[keep])
+
+    if found_hits:
+        # Columns lined up by position like the export (column names can repeat, see export.hits_export)
+        _, chunks = export.hits_export(workbook, found_hits, source_label, chunk_rows=len(hits))
+        found = pd.concat(list(chunks), ignore_index=True)
+        found.insert(0, row_label, np.concatenate(list_rows))
+        found = found.sort_values(row_label, kind='stable', ignore_index=True)
+    else:
+        found = pd.DataFrame(columns=[row_label, source_label])
+
+    missing = ~requests_df['list_row'].isin(found[row_label])
+    not_found = lookup[missing.to_numpy()].dropna(axis=1, how='all')
+    not_found.insert(0, row_label, requests_df['list_row'][missing].to_numpy())
+    return found, not_found.reset_index(drop=True)
@@ -0,0 +1,227 @@
+"""
+What changed between two versions of a sheet: records added, removed or changed, found by
+hashing every row (vectorized, no loop over the rows), and the journal file they are kept in.
+
+    diff = changes.diff_sheets(old_prepared, new_prepared)
+    diff['added'], diff['removed']          # row positions in the new / old sheet
+    diff['changed']                         # (old rows, new rows) of records whose values changed
+    entries = changes.journal_entries('VDC01', old_prepared, new_prepared, diff, at, version)
+    changes.append_journal('journal.jsonl', entries)
+
+A record is known by its ward, sheet no. and kitta (the VDC is its sheet). Used by refresh.py
+after every refresh, the entries are shown by app.py as recent changes.
+"""
+import json
+from collections import deque
+
+import numpy as np
+import pandas as pd
+
+import export
+
+# Columns that identify a record within its sheet
+KEY_COLUMNS = ('ward', 'sheet_no', 'plot')
+
+# Hash of a blank cell
+BLANK = np.uint64(0)
+
+
+def value_hashes(series):
+    """
+    A uint64 hash of every cell of a column. Numbers hash the same whatever the column type
+    (5, 5.0 and '5'), since a sheet stores a column as numbers or text depending on its other cells.
+    """
+    if isinstance(series.dtype, pd.CategoricalDtype):
+        # Hash every category once; code -1 (blank) picks the BLANK at the end
+        categories = value_hashes(pd.Series(series.cat.categories))
+        return np.append(categories, BLANK)[series.cat.codes.to_numpy()]
+
+    blank = series.isna().to_numpy()
+    numbers = pd.to_numeric(series, errors='coerce').to_numpy(dtype=float, na_value=np.nan)
+    hashes = pd.util.hash_array(numbers)
+    is_text = np.isnan(numbers) & ~blank
+    if is_text.any():
+        hashes[is_text] = pd.util.hash_array(series[is_text].astype(str).to_numpy(dtype=object))
+    hashes[blank] = BLANK
+    return hashes
+
+
+def combine_hashes(columns, length):
+    # One hash per row from the hashes of its cells (a list of uint64 arrays, in order)
+    if not columns:
+        return np.zeros(length, dtype=np.uint64)
+    return pd.util.hash_pandas_object(pd.DataFrame(dict(enumerate(columns))), index=False).to_numpy()
+
+
+def column_label(key):
+    # Name of a column key in the journal: the name, numbered from its second time on ('कैफियत (2)')
+    name, repeat = key
+    return str(name) if repeat == 0 else f'{name} ({repeat + 1})'
+
+
+def record_keys(prepared, cell_hashes):
+    # A hash of every row's ward, sheet no. and kitta (cell_hashes by column key, see export.column_keys)
+    col_mapping = prepared['col_mapping']
+    columns = [cell_hashes[(col_mapping[key], 0)] for key in KEY_COLUMNS if col_mapping[key]]
+    return combine_hashes(columns, len(prepared['df']))
+
+
+def match_keys(old_keys, new_keys):
+    """
+    Pair equal keys of two arrays, as (old positions, new positions). A key found several times
+    is paired in order: the n-th in the old array with the n-th in the new one.
+    """
+    def numbered(keys):
+        repeat = pd.Series(keys).groupby(keys, sort=False).cumcount().to_numpy()
+        return combine_hashes([keys, repeat.astype(np.uint64)], len(keys))
+
+    old_keys, new_keys = numbered(old_keys), numbered(new_keys)
+    if len(old_keys) == 0:
+        return np.array([], dtype=np.intp), np.array([], dtype=np.intp)
+    # Every new key looked up in the sorted old keys
+    order = np.argsort(old_keys, kind='stable')
+    positions = np.searchsorted(old_keys[order], new_keys).clip(max=len(order) - 1)
+    matched = old_keys[order][positions] == new_keys
+    return order[positions[matched]], np.flatnonzero(matched)
+
+
+def diff_sheets(old, new):
+    """
+    Compare two prepared versions of a sheet record by record. Returns
+    {'added': new rows, 'removed': old rows, 'changed': (old rows, new rows), 'columns': [...],
+    'changed_cells': bool array (changed records x columns)}, where 'columns' are the column keys
+    (export.column_keys) of both versions that were compared. Columns are read by position, as a name
+    can repeat.
+
+    Rows with the same values in both versions are paired first, so records are found however the
+    rows were reordered; of the rest, those with the same ward, sheet no. and kitta have changed.
+    """
+    old_df, new_df = old['df'], new['df']
+    old_keys, new_keys = export.column_keys(old_df.columns), export.column_keys(new_df.columns)
+    columns = new_keys + [key for key in old_keys if key not in set(new_keys)]
+    old_cells = {key: value_hashes(old_df.iloc[:, i]) for i, key in enumerate(old_keys)}
+    new_cells = {key: value_hashes(new_df.iloc[:, i]) for i, key in enumerate(new_keys)}
+    # A column missing on one side is blank there
+    blank_old = np.full(len(old_df), BLANK)
+    blank_new = np.full(len(new_df), BLANK)
+    old_cells = [old_cells.get(key, blank_old) for key in columns]
+    new_cells = [new_cells.get(key, blank_new) for key in columns]
+
+    # Unchanged records: the whole row is the same
+    same_old, same_new = match_keys(combine_hashes(old_cells, len(old_df)), combine_hashes(new_cells, len(new_df)))
+    old_rest = np.ones(len(old_df), dtype=bool)
+    old_rest[same_old] = False
+    old_rest = np.flatnonzero(old_rest)
+    new_rest = np.ones(len(new_df), dtype=bool)
+    new_rest[same_new] = False
+    new_rest = np.flatnonzero(new_rest)
+
+    # Changed records: the same key, other values
+    old_keys = record_keys(old, dict(zip(columns, old_cells)))[old_rest]
+    new_keys = record_keys(new, dict(zip(columns, new_cells)))[new_rest]
+    paired_old, paired_new = match_keys(old_keys, new_keys)
+    old_rows, new_rows = old_rest[paired_old], new_rest[paired_new]
+    changed_cells = np.column_stack([
+        old_column[old_rows] != new_column[new_rows] for old_column, new_column in zip(old_cells, new_cells)
+    ]) if columns else np.zeros((len(new_rows), 0), dtype=bool)
+
+    return {
+        'added': np.delete(new_rest, paired_new),
+        'removed': np.delete(old_rest, paired_old),
+        'changed': (old_rows, new_rows),
+        'columns': columns,
+        'changed_cells': changed_cells
+    }
+
+
+def _json_value(value):
+    # A cell as a JSON value: blank cells as None, numpy numbers as Python numbers
+    if pd.api.types.is_scalar(value) and pd.isna(value):
+        return None
+    if isinstance(value, np.generic):
+        return value.item()
+    return value if isinstance(value, (int, float, str)) else str(value)
+
+
+def _key_values(df, col_mapping, row):
+    # Ward, sheet no. and kitta of a row, as text (the first column of a repeated name, like col_mapping)
+    names = df.columns.tolist()
+    values = {}
+    for key in KEY_COLUMNS:
+        value = _json_value(df.iloc[row, names.index(col_mapping[key])]) if col_mapping[key] else None
+        values[key] = None if value is None else str(value)
+    return values
+
+
+def journal_entries(sheet_name, old, new, diff, at, version, limit=None):
+    """
+    Journal entries (dicts) for the records of one sheet in a diff_sheets result: added and
+    removed records with their values, changed ones with {column: [old, new]} of the cells
+    that changed. With a `limit` (records of each kind), one 'more' entry counts the ones left out.
+    """
+    base = {'at': at, 'version': version, 'sheet': sheet_name}
+    old_df, new_df = old['df'], new['df']
+    entries = []
+
+    old_positions = {key: i for i, key in enumerate(export.column_keys(old_df.columns))}
+    new_positions = {key: i for i, key in enumerate(export.column_keys(new_df.columns))}
+    old_labels = [column_label(key) for key in old_positions]
+    new_labels = [column_label(key) for key in new_positions]
+
+    def row_values(df, labels, row):
+        return {label: _json_value(value) for label, value in zip(labels, df.iloc[row].tolist())}
+
+    for row in diff['added'][:limit]:
+        entries.append(dict(base, change='added', **_key_values(new_df, new['col_mapping'], row),
+                            values=row_values(new_df, new_labels, row)))
+    for row in diff['removed'][:limit]:
+        entries.append(dict(base, change='removed', **_key_values(old_df, old['col_mapping'], row),
+                            values=row_values(old_df, old_labels, row)))
+    old_rows, new_rows = diff['changed']
+    for old_row, new_row, cells in list(zip(old_rows, new_rows, diff['changed_cells']))[:limit]:
+        values = {}
+        for key in [key for key, changed in zip(diff['columns'], cells) if changed]:
+            before = _json_value(old_df.iloc[old_row, old_positions[key]]) if key in old_positions else None
+            after = _json_value(new_df.iloc[new_row, new_positions[key]]) if key in new_positions else None
+            values[column_label(key)] = [before, after]
+        entries.append(dict(base, change='changed', **_key_values(new_df, new['col_mapping'], new_row),
+                            values=values))
+
+    if limit is not None:
+        left_out = sum(max(0, count - limit) for count in (len(diff['added']), len(diff['removed']), len(old_rows)))
+        if left_out:
+            entries.append(dict(base, change='more', rows=left_out))
+    return entries
+
+
+def sheet_entry(sheet_name, change, at, version):
+    # Journal entry for a whole sheet that was added ('sheet_added') or removed ('sheet_removed')
+    return {'at': at, 'version': version, 'sheet': sheet_name, 'change': change}
+
+
+def append_journal(path, entries):
+    """
+    Append entries to a journal file, one JSON object per line. Lines are only ever added.
+    """
+    with open(path, 'a', encoding='utf-8') as f:
+        for entry in entries:
+            f.write(json.dumps(entry, ensure_ascii=False) + '\n')
+
+
+def read_journal(path, size):
+    """
+    The last `size` entries of a journal file, oldest first ([] if there is no file).
+    A line that cannot be read (e.g. cut off while being written) is skipped.
+    """
+    try:
+        with open(path, encoding='utf-8') as f:
+            lines = deque(f, maxlen=size)
+    except FileNotFoundError:
+        return []
+    entries = []
+    for line in lines:
+        try:
+            entries.append(json.loads(line))
+        except ValueError:
+            continue
+    return entries
@@ -0,0 +1,182 @@
+"""
+Write search results to CSV or XLSX a chunk of rows at a time, so exporting a whole VDC never
+holds a second copy of it in memory: only one chunk of rows is converted at a time, and XLSX
+uses openpyxl's write-only mode.
+
+Results are given as (columns, chunks of rows), see sheet_export(), hits_export() and global_export().
+This file has no Streamlit code, app.py and api.py both use it.
+"""
+import io
+import tempfile
+
+import openpyxl
+import pandas as pd
+
+# Rows converted at a time
+CHUNK_ROWS = 20_000
+# Rows per XLSX sheet (Excel's limit less the header row); more rows continue on a new sheet
+XLSX_MAX_ROWS = 1_048_575
+# Bytes per block when reading an export back
+FILE_BLOCK = 1024 * 1024
+
+MIME_TYPES = {
+    'csv': 'text/csv',
+    'xlsx': 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+}
+
+
+def sheet_chunks(df, rows=None, chunk_rows=CHUNK_ROWS):
+    """
+    Rows `rows` (positions, None for all) of one sheet, `chunk_rows` at a time.
+    """
+    total = len(df) if rows is None else len(rows)
+    for start in range(0, total, chunk_rows):
+        end = min(start + chunk_rows, total)
+        yield df.iloc[start:end] if rows is None else df.iloc[rows[start:end]]
+
+
+def sheet_export(df, rows=None, chunk_rows=CHUNK_ROWS):
+    # (columns, chunks) of a one-sheet result
+    return df.columns.tolist(), sheet_chunks(df, rows, chunk_rows)
+
+
+def column_keys(columns):
+    # (name, how many columns before it have the same name) of every column, so repeated names stay apart
+    seen = {}
+    keys = []
+    for name in columns:
+        keys.append((name, seen.get(name, 0)))
+        seen[name] = keys[-1][1] + 1
+    return keys
+
+
+def hits_export(prepared_sheets, hits, source_label='Sheet', chunk_rows=CHUNK_ROWS):
+    """
+    (columns, chunks) of a result spread over sheets, given as [(sheet name, row positions), ...]
+    (see records.query_hits): the source sheet first, then the columns of every sheet with rows.
+    Columns are matched by name, a repeated name by how often it came before (see column_keys).
+    """
+    keys = []
+    for name, _ in hits:
+        keys += [key for key in column_keys(prepared_sheets[name]['df'].columns) if key not in keys]
+    columns = [source_label] + [name for name, _ in keys]
+
+    def chunks():
+        for name, rows in hits:
+            df = prepared_sheets[name]['df']
+            # Positions of the output columns in this sheet; two columns added at the end of every
+            # chunk hold the sheet name and blanks for the columns this sheet does not have
+            positions = {key: i for i, key in enumerate(column_keys(df.columns))}
+            width = df.shape[1]
+            indexer = [width + 1] + [positions.get(key, width) for key in keys]
+            for chunk in sheet_chunks(df, rows, chunk_rows):
+                chunk = chunk.set_axis(range(width), axis=1)
+                chunk[width] = None
+                chunk[width + 1] = name
+                yield chunk.iloc[:, indexer].set_axis(columns, axis=1)
+
+    return columns, chunks()
+
+
+def global_hits(global_index, found):
+    # [(sheet name, row positions)] of cross-sheet index positions, sheets in order of first match
+    sheets = global_index['sheet'][found]
+    rows = global_index['row'][found]
+    names = global_index['sheet_names']
+    return [(names[code], rows[sheets == code]) for code in pd.unique(sheets)]
+
+
+def global_export(global_index, prepared_sheets, found, source_label='Sheet', chunk_rows=CHUNK_ROWS):
+    """
+    (columns, chunks) of cross-sheet index positions `found` (see records.global_plot_rows),
+    in the order of records.global_results().
+    """
+    return hits_export(prepared_sheets, global_hits(global_index, found), source_label, chunk_rows)
+
+
+def _plain_values(chunk):
+    # Python values for the writers, blank cells as None
+    values = chunk.to_numpy(dtype=object)
+    values[pd.isna(values)] = None
+    return values
+
+
+def iter_csv(chunks, columns):
+    """
+    Yield a UTF-8 CSV (with a byte order mark, so Excel shows Devanagari) as one bytes block per chunk.
+    """
+    yield pd.DataFrame(columns=columns).to_csv(index=False).encode('utf-8-sig')
+    for chunk in chunks:
+        yield chunk.to_csv(index=False, header=False).encode('utf-8')
+
+
+def write_xlsx(chunks, columns, file, sheet_title='Results'):
+    """
+    Write the chunks to `file` (path or binary file object) as an XLSX workbook in write-only mode.
+    """
+    workbook = openpyxl.Workbook(write_only=True)
+    header = [str(c) for c in columns]
+    worksheet = None
+    written = XLSX_MAX_ROWS
+    sheet_count = 0
+    for chunk in chunks:
+        values = _plain_values(chunk)
+        start = 0
+        while start < len(values):
+            if written == XLSX_MAX_ROWS:
+                sheet_count += 1
+                worksheet = workbook.create_sheet(sheet_title if sheet_count == 1 else f'{sheet_title} ({sheet_count})')
+                worksheet.append(header)
+                written = 0
+            end = min(len(values), start + XLSX_MAX_ROWS - written)
+            for row in values[start:end]:
+                worksheet.append(row.tolist())
+            written += end - start
+            start = end
+    if worksheet is None:
+        workbook.create_sheet(sheet_title).append(header)
+    workbook.save(file)
+
+
+def iter_file(file, block=FILE_BLOCK):
+    # A file object's content from the start, block by block
+    file.seek(0)
+    while True:
+        data = file.read(block)
+        if not data:
+            return
+        yield data
+
+
+def iter_xlsx(chunks, columns, sheet_title='Results'):
+    """
+    Yield an XLSX workbook block by block. The workbook is written to a temporary file first,
+    since the XLSX (zip) format can only be finished at the end.
+    """
+    with tempfile.TemporaryFile() as file:
+        write_xlsx(chunks, columns, file, sheet_title)
+        yield from iter_file(file)
+
+
+def export_blocks(result, file_format):
+    # The export of a (columns, chunks) result as an iterator of bytes blocks
+    columns, chunks = result
+    if file_format == 'xlsx':
+        return iter_xlsx(chunks, columns)
+    return iter_csv(chunks, columns)
+
+
+def export_buffer(result, file_format):
+    """
+    The whole export in a BytesIO, for st.download_button (which needs the file in one piece).
+    Still written chunk by chunk: only the finished file and one chunk are in memory.
+    """
+    columns, chunks = result
+    buffer = io.BytesIO()
+    if file_format == 'xlsx':
+        write_xlsx(chunks, columns, buffer)
+    else:
+        for block in iter_csv(chunks, columns):
+            buffer.write(block)
+    buffer.seek(0)
+    return buffer
@@ -0,0 +1,203 @@
+"""
+Text folding and fuzzy matching for searches typed in either script: Devanagari digits (१२३)
+and ASCII digits (123) compare equal, text is compared in Unicode NFC, Nepali names get a rough
+romanization so 'Bhaktapur' finds 'भक्तपुर', and bigram indexes rank near misses ('1235' for '1234').
+
+    index = fuzzy.build_ngram_index(['1234', '1235', '99/2'])
+    fuzzy.rank(index, '1234')              # [('1234', 1.0), ('1235', 0.6)]
+    fuzzy.name_key('चितवन') == fuzzy.name_key('Chitwan')
+    fuzzy.closest_name(['काठमाडौं', 'ललितपुर'], 'Kathmandu')   # 'काठमाडौं'
+
+Plain Python and numpy, used by records.py, bulk.py and app.py.
+"""
+import re
+import unicodedata
+
+import numpy as np
+
+# Devanagari digits as ASCII
+DIGITS = str.maketrans('०१२३४५६७८९', '0123456789')
+
+# Devanagari letters as Latin, roughly as Nepali names are usually spelled in English
+CONSONANTS = {
+    'क': 'k', 'ख': 'kh', 'ग': 'g', 'घ': 'gh', 'ङ': 'ng', 'च': 'ch', 'छ': 'chh', 'ज': 'j', 'झ': 'jh',
+    'ञ': 'n', 'ट': 't', 'ठ': 'th', 'ड': 'd', 'ढ': 'dh', 'ण': 'n', 'त': 't', 'थ': 'th', 'द': 'd',
+    'ध': 'dh', 'न': 'n', 'प': 'p', 'फ': 'ph', 'ब': 'b', 'भ': 'bh', 'म': 'm', 'य': 'y', 'र': 'r',
+    'ल': 'l', 'व': 'w', 'श': 'sh', 'ष': 'sh', 'स': 's', 'ह': 'h'
+}
+VOWELS = {
+    'अ': 'a', 'आ': 'aa', 'इ': 'i', 'ई': 'ee', 'उ': 'u', 'ऊ': 'oo', 'ऋ': 'ri', 'ए': 'e', 'ऐ': 'ai',
+    'ओ': 'o', 'औ': 'au'
+}
+VOWEL_SIGNS = {
+    'ा': 'aa', 'ि': 'i', 'ी': 'ee', 'ु': 'u', 'ू': 'oo', 'ृ': 'ri', 'े': 'e', 'ै': 'ai', 'ो': 'o',
+    'ौ': 'au'
+}
+# Signs after a vowel (the inherent 'a' of a consonant too): anusvara, chandrabindu, visarga
+NASALS = {'ं': 'n', 'ँ': 'n', 'ः': 'h'}
+VIRAMA = '्'
+NUKTA = '़'
+
+# Spelling differences of romanized names, folded away by name_key
+SPELLINGS = [('chh', 'ch'), ('sh', 's'), ('ph', 'f'), ('w', 'b'), ('v', 'b'), ('ee', 'i'), ('oo', 'u')]
+
+# Lowest bigram similarity (0..1) rank() returns
+MIN_SCORE = 0.4
+# Lowest bigram similarity of two names in different scripts that closest_name() takes as the same
+NAME_MIN_SCORE = 0.55
+
+
+def fold(text):
+    """
+    Text in Unicode NFC with Devanagari digits as ASCII digits. ASCII text is returned as is.
+    """
+    if text.isascii():
+        return text
+    return unicodedata.normalize('NFC', text).translate(DIGITS)
+
+
+def _inherent_vowels(text):
+    """
+    For every character of a Devanagari text, whether it is a consonant spoken with its inherent
+    'a'. As in spoken Nepali it is left out at the end of a word, and in the middle of a word
+    between two voiced syllables ('ललितपुर' -> lalitpur, 'नगरकोट' -> nagarkot), from right to left.
+    """
+    def letter(i):
+        return 0 <= i < len(text) and (text[i] in CONSONANTS or text[i] in VOWELS)
+
+    inherent = [
+        ch in CONSONANTS and (letter(i + 1) or text[i + 1:i + 2] in NASALS)
+        for i, ch in enumerate(text)
+    ]
+
+    def voiced(i):
+        # A vowel is spoken at i: a vowel sign or letter, or a consonant with its 'a'
+        return 0 <= i < len(text) and (text[i] in VOWEL_SIGNS or text[i] in VOWELS or inherent[i])
+
+    for i in range(len(text) - 2, 0, -1):
+        # The next consonant has a vowel of its own
+        followed = text[i + 1] in CONSONANTS and (inherent[i + 1] or text[i + 2:i + 3] in VOWEL_SIGNS)
+        if inherent[i] and voiced(i - 1) and followed:
+            inherent[i] = False
+    return inherent
+
+
+def romanize(text):
+    """
+    Devanagari as plain Latin letters ('भक्तपुर' -> 'bhaktapur'); other characters are kept.
+    """
+    text = fold(text).replace(NUKTA, '')
+    inherent = _inherent_vowels(text)
+    out = []
+    for i, ch in enumerate(text):
+        if ch in CONSONANTS:
+            out.append(CONSONANTS[ch] + ('a' if inherent[i] else ''))
+        elif ch in VOWELS:
+            out.append(VOWELS[ch])
+        elif ch in VOWEL_SIGNS:
+            out.append(VOWEL_SIGNS[ch])
+        elif ch in NASALS:
+            out.append(NASALS[ch])
+        elif ch != VIRAMA:
+            out.append(ch)
+    return ''.join(out)
+
+
+def latin(text):
+    """
+    Devanagari the way names are usually written in English: romanized, long vowels as one
+    letter, words capitalized ('काठमाडौं' -> 'Kathmadaun'). Text without Devanagari is kept.
+    """
+    if text.isascii():
+        return text
+    spelled = romanize(text).replace('aa', 'a').replace('ee', 'i').replace('oo', 'u')
+    return spelled.title()
+
+
+def name_key(text):
+    """
+    A VDC (or other) name reduced for comparing: romanized, lower case, letters and digits only,
+    common spelling differences (sh/s, w/v/b, ee/i, oo/u, doubled letters) folded.
+    """
+    key = romanize(str(text)).lower()
+    for spelling, folded in SPELLINGS:
+        key = key.replace(spelling, folded)
+    key = re.sub(r'[^a-z0-9]+', '', key)
+    return re.sub(r'(.)\1+', r'\1', key)
+
+
+def ngrams(text):
+    # The distinct bigrams of a text, with its start and end marked ('12' -> ^1, 12, 2$)
+    padded = f'\x02{text}\x03'
+    return {padded[i:i + 2] for i in range(len(padded) - 1)}
+
+
+def build_ngram_index(keys):
+    """
+    A bigram index over `keys` (strings) for rank(): for every bigram the ids of the keys that
+    contain it, plus the number of bigrams and the length of every key.
+    """
+    postings = {}
+    sizes = np.empty(len(keys), dtype=np.int32)
+    for i, key in enumerate(keys):
+        grams = ngrams(key)
+        sizes[i] = len(grams)
+        for gram in grams:
+            postings.setdefault(gram, []).append(i)
+    return {
+        'keys': keys,
+        'postings': {gram: np.array(ids, dtype=np.int32) for gram, ids in postings.items()},
+        'sizes': sizes,
+        'lengths': np.array([len(key) for key in keys], dtype=np.int32)
+    }
+
+
+def rank(index, query, limit=None, min_score=MIN_SCORE):
+    """
+    Keys of a bigram index (build_ngram_index) similar to `query`, as [(key, score), ...],
+    best first. The score is the Dice coefficient of their bigrams: 1.0 for the same bigrams,
+    0 for none in common. Equal scores are ordered by how close the key length is to the query's.
+    """
+    grams = ngrams(query)
+    found = [index['postings'][gram] for gram in grams if gram in index['postings']]
+    if not found:
+        return []
+    # Bigrams in common with the query, for every key that has any
+    common = np.bincount(np.concatenate(found), minlength=len(index['keys']))
+    candidates = np.flatnonzero(common)
+    scores = 2 * common[candidates] / (len(grams) + index['sizes'][candidates])
+    keep = scores >= min_score
+    candidates, scores = candidates[keep], scores[keep]
+    order = np.lexsort((np.abs(index['lengths'][candidates] - len(query)), -scores))[:limit]
+    return [(index['keys'][candidates[i]], round(float(scores[i]), 2)) for i in order]
+
+
+def is_devanagari(text):
+    # Whether a text has any Devanagari letters or signs
+    return re.search('[\u0900-\u097f]', text) is not None
+
+
+def closest_name(names, name, min_score=NAME_MIN_SCORE):
+    """
+    The one of `names` that is `name` written in the other script but romanized differently
+    ('काठमाडौं' -> 'kathmadaun' for 'Kathmandu', 'पोखरा' -> 'pokhra' for 'Pokhara'), or None.
+    For when no name has the same name_key: only names in the other script with the same digits
+    count, and the most similar one must have a bigram similarity of at least `min_score` and be
+    more similar than all others.
+    """
+    name = str(name)
+    key = name_key(name)
+    digits = re.sub(r'[^0-9]', '', key)
+    by_key = {}
+    for other in names:
+        other = str(other)
+        other_key = name_key(other)
+        if is_devanagari(other) != is_devanagari(name) and re.sub(r'[^0-9]', '', other_key) == digits:
+            by_key.setdefault(other_key, []).append(other)
+    if not key or not by_key:
+        return None
+    ranked = rank(build_ngram_index(list(by_key)), key, limit=2, min_score=min_score)
+    if not ranked or (len(ranked) > 1 and ranked[1][1] == ranked[0][1]):
+        return None
+    same = list(dict.fromkeys(by_key[ranked[0][0]]))
+    return same[0] if len(same) == 1 else None
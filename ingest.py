@@ -0,0 +1,134 @@
+"""
+Ways of turning the downloaded workbook into raw DataFrames (read without header, like
+pd.read_excel(..., header=None)), so app.py can pick the fastest one.
+
+- 'streaming': openpyxl in read-only mode, rows read as plain values (default)
+- 'pandas': pd.read_excel, the original way
+- 'csv': one CSV export per sheet, which parses much faster than XLSX
+
+This file has no Streamlit code so it can also run in worker processes.
+"""
+import io
+import os
+import tempfile
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from itertools import repeat
+from multiprocessing import get_context
+from urllib.parse import quote
+
+import numpy as np
+import openpyxl
+import pandas as pd
+import requests
+
+ENGINES = ('streaming', 'pandas', 'csv')
+
+
+def check_engine(engine):
+    # An engine name from a setting, ValueError unless it is one of ENGINES
+    if engine not in ENGINES:
+        raise ValueError(f"Unknown ingest engine {engine!r}, use one of: {', '.join(ENGINES)}")
+    return engine
+
+
+def _sheet_frame(worksheet):
+    # Plain values, no per-cell conversion
+    worksheet.reset_dimensions()
+    df = pd.DataFrame(list(worksheet.iter_rows(values_only=True)))
+    df = df.fillna(np.nan)
+
+    # Like pd.read_excel, drop empty rows and columns at the end
+    filled_rows = np.flatnonzero(df.notna().any(axis=1).to_numpy())
+    filled_cols = np.flatnonzero(df.notna().any(axis=0).to_numpy())
+    if len(filled_rows) == 0:
+        return pd.DataFrame()
+    return df.iloc[:filled_rows[-1] + 1, :filled_cols[-1] + 1]
+
+
+def _open(source):
+    # File bytes or a path to the file
+    return io.BytesIO(source) if isinstance(source, bytes) else source
+
+
+def _read_sheets_streaming(source, sheet_names):
+    workbook = openpyxl.load_workbook(_open(source), read_only=True, data_only=True, keep_links=False)
+    try:
+        names = workbook.sheetnames if sheet_names is None else sheet_names
+        return {name: _sheet_frame(workbook[name]) for name in names}
+    finally:
+        workbook.close()
+
+
+def _read_sheet_from_file(path, sheet_name):
+    # Runs in a worker process, which opens the workbook file on its own
+    return _read_sheets_streaming(path, [sheet_name])[sheet_name]
+
+
+def sheet_names_of(source):
+    """
+    Names of the sheets in an XLSX file (bytes or path), in workbook order, without reading any cells.
+    """
+    workbook = openpyxl.load_workbook(_open(source), read_only=True, keep_links=False)
+    try:
+        return workbook.sheetnames
+    finally:
+        workbook.close()
+
+
+def read_xlsx_sheets(source, sheet_names=None, engine='streaming', workers=1):
+    """
+    Parse the given sheets (all when None) of an XLSX file (bytes or path) into raw DataFrames.
+
+    With workers > 1 the 'streaming' engine parses sheets in parallel processes; bytes are
+    written to a temporary file once so they are not copied to every worker.
+    The caller can drop the bytes as soon as this returns, nothing keeps a reference to them.
+    """
+    if engine == 'pandas':
+        return pd.read_excel(_open(source), sheet_name=sheet_names, header=None)
+
+    if sheet_names is None:
+        sheet_names = sheet_names_of(source)
+    if workers <= 1 or len(sheet_names) <= 1:
+        return _read_sheets_streaming(source, sheet_names)
+
+    if isinstance(source, bytes):
+        fd, path = tempfile.mkstemp(suffix='.xlsx')
+        with os.fdopen(fd, 'wb') as f:
+            f.write(source)
+    else:
+        path = source
+    try:
+        # spawn, not fork: the app runs threads, and forking a threaded process is unsafe
+        with ProcessPoolExecutor(min(workers, len(sheet_names)), mp_context=get_context('spawn')) as pool:
+            frames = pool.map(_read_sheet_from_file, repeat(path), sheet_names)
+            return dict(zip(sheet_names, frames))
+    finally:
+        if path is not source:
+            os.remove(path)
+
+
+def csv_export_url(url_template, sheet_name):
+    """
+    URL of one sheet's CSV export; `url_template` has a {sheet} placeholder, e.g.
+    https://docs.google.com/spreadsheets/d/<id>/gviz/tq?tqx=out:csv&headers=0&sheet={sheet}
+    """
+    return url_template.format(sheet=quote(sheet_name))
+
+
+def download_csv_sheets(url_template, sheet_names, timeout=60, workers=4, session=requests):
+    """
+    Download the CSV export of each sheet, several at a time: {sheet name: bytes}.
+    `session` is a requests session (or the requests module), so pooled connections and retries apply.
+    """
+    def download_one(sheet_name):
+        response = session.get(csv_export_url(url_template, sheet_name), timeout=timeout)
+        response.raise_for_status()
+        return response.content
+
+    with ThreadPoolExecutor(max(1, min(workers, len(sheet_names)))) as pool:
+        return dict(zip(sheet_names, pool.map(download_one, sheet_names)))
+
+
+def read_csv_sheet(source):
+    # One downloaded CSV export (bytes or a path to the file) as a raw DataFrame
+    return pd.read_csv(_open(source), header=None, dtype=object)
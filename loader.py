@@ -0,0 +1,59 @@
+"""
+Keep the shared data snapshot up to date for several app / API processes (shared mode).
+
+    LAND_RECORD_SNAPSHOT_DIR=/srv/land-records python loader.py
+    LAND_RECORD_SNAPSHOT_DIR=/srv/land-records LAND_RECORD_SHARED=worker streamlit run app.py
+    LAND_RECORD_SNAPSHOT_DIR=/srv/land-records LAND_RECORD_SHARED=worker python api.py
+
+The loader is the only process that downloads the workbook. It prepares every sheet and saves it
+with its indexes (and the cross-sheet plot index) as memory-mappable Arrow files in the snapshot
+folder, then replaces manifest.json. Workers only read that folder: they memory-map the same files,
+so the operating system keeps one copy of the data for all of them, and they switch to a new
+snapshot within a few seconds of the manifest changing (refresh.SHARED_POLL).
+"""
+import argparse
+import logging
+import time
+
+import metrics
+import refresh
+
+logger = logging.getLogger('loader')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--interval', type=float, default=refresh.REFRESH_TTL,
+                        help='seconds between checks for a new workbook (default: %(default)s)')
+    parser.add_argument('--once', action='store_true', help='publish one snapshot and exit')
+    args = parser.parse_args()
+    if not refresh.SNAPSHOT_DIR:
+        raise SystemExit('Set LAND_RECORD_SNAPSHOT_DIR to the folder the workers read')
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s %(message)s')
+
+    state = refresh.new_workbook_state()
+    # Start from the last published snapshot: the first check is then a conditional request
+    try:
+        refresh.load_snapshot(state)
+    except Exception as e:
+        logger.warning("Could not load the data snapshot: %s", e)
+
+    while True:
+        started = time.time()
+        try:
+            changed = refresh.publish_snapshot(state)
+            logger.info("%s %s (%d sheets) in %.1f s", 'Published' if changed else 'Checked',
+                        state['snapshot']['version'], len(state['snapshot']['sheets']), time.time() - started)
+            logger.info("Metrics: %s", metrics.log_line())
+        except Exception as e:
+            if args.once:
+                raise
+            # Workers keep serving the last snapshot meanwhile
+            logger.error("Could not refresh the data: %s", e)
+        if args.once:
+            return
+        time.sleep(max(0, args.interval - (time.time() - started)))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,157 @@
+"""
+Timings, counters and sizes of this process, to see where the time goes under real load.
+Shown in the admin panel of the app (app.py) and as Prometheus text on GET /metrics (api.py).
+
+    with metrics.timer('download'):
+        ...
+    metrics.count('sheet_cache_hit')
+    metrics.set_value('sheet_cache_rows', 123456)
+
+Every stage keeps its number of runs, total and longest time, and its last RECENT durations
+for the percentiles. Everything is in memory and per process.
+"""
+import re
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+# Durations kept per stage for the percentiles
+RECENT = 1000
+# Percentiles shown for every stage
+QUANTILES = (0.5, 0.95, 0.99)
+
+_lock = threading.Lock()
+_stages = {}
+_counters = {}
+_values = {}
+
+
+def record(stage, seconds):
+    # Add one run of a stage that took `seconds`
+    with _lock:
+        entry = _stages.get(stage)
+        if entry is None:
+            entry = _stages[stage] = {'count': 0, 'total': 0.0, 'max': 0.0, 'recent': deque(maxlen=RECENT)}
+        entry['count'] += 1
+        entry['total'] += seconds
+        entry['max'] = max(entry['max'], seconds)
+        entry['recent'].append(seconds)
+
+
+@contextmanager
+def timer(stage):
+    """
+    Time the code in the `with` block as one run of `stage` (also when it raises).
+    """
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        record(stage, time.perf_counter() - started)
+
+
+def count(name, amount=1):
+    # Add to an event counter (cache hits, downloads, ...)
+    with _lock:
+        _counters[name] = _counters.get(name, 0) + amount
+
+
+def set_value(name, value):
+    # Set a current value (rows, bytes, ...)
+    with _lock:
+        _values[name] = value
+
+
+def _quantile(durations, q):
+    return durations[min(len(durations) - 1, int(q * len(durations)))]
+
+
+def stage_summary():
+    """
+    One dict per stage (stage, count, total_s, mean_ms, p50_ms, p95_ms, p99_ms, max_ms), in name order.
+    """
+    with _lock:
+        stages = {name: dict(entry, recent=sorted(entry['recent'])) for name, entry in _stages.items()}
+    summary = []
+    for name in sorted(stages):
+        entry = stages[name]
+        row = {
+            'stage': name,
+            'count': entry['count'],
+            'total_s': round(entry['total'], 3),
+            'mean_ms': round(entry['total'] / entry['count'] * 1000, 2)
+        }
+        for q in QUANTILES:
+            row[f'p{int(q * 100)}_ms'] = round(_quantile(entry['recent'], q) * 1000, 2)
+        row['max_ms'] = round(entry['max'] * 1000, 2)
+        summary.append(row)
+    return summary
+
+
+def counters():
+    with _lock:
+        return dict(sorted(_counters.items()))
+
+
+def values():
+    with _lock:
+        return dict(sorted(_values.items()))
+
+
+def reset():
+    # Forget everything (e.g. between benchmark runs)
+    with _lock:
+        _stages.clear()
+        _counters.clear()
+        _values.clear()
+
+
+def _label(value):
+    # A label value in the Prometheus text format: backslash, double quote and newline escaped
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _metric_name(name):
+    # Only letters, digits, _ and : are allowed in a metric name
+    return re.sub(r'[^a-zA-Z0-9_:]', '_', str(name))
+
+
+def prometheus_text(prefix='land_record'):
+    """
+    Everything in the Prometheus text format: stages as summaries (seconds), counters as
+    <prefix>_events_total{event=...} and values as gauges.
+    """
+    lines = [
+        f'# HELP {prefix}_stage_seconds Time spent per stage',
+        f'# TYPE {prefix}_stage_seconds summary'
+    ]
+    with _lock:
+        stages = {name: dict(entry, recent=sorted(entry['recent'])) for name, entry in _stages.items()}
+        counter_items = sorted(_counters.items())
+        value_items = sorted(_values.items())
+    for name in sorted(stages):
+        entry = stages[name]
+        stage = _label(name)
+        for q in QUANTILES:
+            lines.append(f'{prefix}_stage_seconds{{stage="{stage}",quantile="{q}"}} {_quantile(entry["recent"], q):.6f}')
+        lines.append(f'{prefix}_stage_seconds_sum{{stage="{stage}"}} {entry["total"]:.6f}')
+        lines.append(f'{prefix}_stage_seconds_count{{stage="{stage}"}} {entry["count"]}')
+
+    lines += [f'# HELP {prefix}_events_total Events counted', f'# TYPE {prefix}_events_total counter']
+    lines += [f'{prefix}_events_total{{event="{_label(name)}"}} {value}' for name, value in counter_items]
+
+    for name, value in value_items:
+        name = _metric_name(f'{prefix}_{name}')
+        lines += [f'# TYPE {name} gauge', f'{name} {value}']
+    return '\n'.join(lines) + '\n'
+
+
+def log_line():
+    """
+    A one-line summary (stage=count/p95 ms, counters, values) for a log file.
+    """
+    parts = [f"{row['stage']}={row['count']}x/p95 {row['p95_ms']}ms" for row in stage_summary()]
+    parts += [f'{name}={value}' for name, value in counters().items()]
+    parts += [f'{name}={value}' for name, value in values().items()]
+    return ' '.join(parts)
@@ -0,0 +1,826 @@
+"""
+The land records behind the app, without any Streamlit code: preparing sheets (header row,
+column mapping, compact types, indexes) and the ward -> sheet no. -> plot queries over them.
+Downloading, refreshing and saving the workbook is in refresh.py, kitta lists in bulk.py.
+
+Used by app.py for the website and by api.py for the JSON API.
+"""
+import hashlib
+import re
+import threading
+from bisect import bisect_left, bisect_right
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+
+import export
+import fuzzy
+import metrics
+
+# One key in this many is kept as a Python string to speed up plot searches (see plot_index_from_keys)
+FENCE_STEP = 64
+
+# Words that mark the header row (find_header_row) and each column (identify_columns)
+HEADER_KEYWORDS = ['कित्ता', 'साविक', 'वडा', 'सिट', 'भूउपयोग', 'सि.नं.', 'Plot', 'Ward', 'Sheet', 'VDC']
+COLUMN_KEYWORDS = {
+    'vdc': ['साविक गा', 'साविक', 'गा.वि.स', 'VDC', 'Municipality', 'Gapa', 'Napa'],
+    'ward': ['वडा', 'वडा नं', 'Ward', 'Ward No'],
+    'sheet_no': ['सिट नं', 'सिट', 'Sheet', 'Sheet No'],
+    'plot': ['कित्ता', 'कित्ता नं', 'Plot', 'Kitta', 'Kitta No'],
+    'land_use': ['भूउपयोग क्षेत्र', 'भूउपयोग', 'Land Use', 'Classification']
+}
+# Rows searched for the header
+HEADER_SEARCH_ROWS = 10
+# Sheet layouts remembered by detect_structure
+STRUCTURE_CACHE_SIZE = 256
+
+
+def _keyword_pattern(keywords):
+    # One matcher for all the keywords: lower case, literal
+    return '|'.join(re.escape(k.lower()) for k in keywords)
+
+
+HEADER_PATTERN = _keyword_pattern(HEADER_KEYWORDS)
+COLUMN_PATTERNS = {key: _keyword_pattern(patterns) for key, patterns in COLUMN_KEYWORDS.items()}
+
+_structure_cache = OrderedDict()
+_structure_lock = threading.Lock()
+
+
+def _cell_text(values):
+    # The cells of an object array as text, blank cells as ''
+    return np.where(pd.isna(values), '', values).astype(str)
+
+
+def _keyword_matches(texts, pattern):
+    # Lower case all the texts once and match all the keywords in one pass: a bool per text
+    lowered = pc.utf8_lower(pa.array(texts.ravel(), type=pa.string()))
+    return pc.match_substring_regex(lowered, pattern).to_numpy(zero_copy_only=False)
+
+
+def _header_row_from_text(text):
+    # Count the cells matching a keyword in every row; the first row with at least 2, or None
+    if text.size == 0:
+        return None
+    counts = _keyword_matches(text, HEADER_PATTERN).reshape(text.shape).sum(axis=1)
+    rows = np.flatnonzero(counts >= 2)
+    return int(rows[0]) if len(rows) else None
+
+
+def find_header_row(df):
+    """
+    Search first 10 rows to find a row that looks like a header (contains at least 2 keywords).
+    """
+    header_row = _header_row_from_text(_cell_text(df.iloc[:HEADER_SEARCH_ROWS].to_numpy(dtype=object)))
+    return 0 if header_row is None else header_row
+
+
+def _column_matches(names):
+    # For every column key, the positions of the names that contain one of its keywords
+    names = np.array([str(name).strip() for name in names], dtype=str)
+    return {key: np.flatnonzero(_keyword_matches(names, pattern)) for key, pattern in COLUMN_PATTERNS.items()}
+
+
+def identify_columns(df):
+    """
+    Heuristically identify required columns from the dataframe (the first column matching each key).
+    """
+    cols = df.columns.tolist()
+    return {key: cols[found[0]] if len(found) else None for key, found in _column_matches(cols).items()}
+
+
+def _column_confidence(name, key, matching_columns):
+    """
+    0..1: how much of the column name the longest matching keyword covers, shared between all
+    the columns that match the same key.
+    """
+    lowered = str(name).strip().lower()
+    longest = max(len(k) for k in COLUMN_KEYWORDS[key] if k.lower() in lowered)
+    return round(min(1.0, longest / max(1, len(lowered))) / matching_columns, 2)
+
+
+def detect_structure(raw_df, use_cache=True):
+    """
+    Where the data of a raw sheet (read without header) is:
+    {'header_row', 'columns' (header names), 'keep' (columns to keep), 'col_mapping', 'confidence'}.
+
+    confidence has one 0..1 score per column key (None when not found, see _column_confidence)
+    and 'header', the share of column keys found in the header row.
+
+    Results are cached by the content of the rows down to the header row: they decide everything
+    here, so VDC sheets made from the same template are only looked at once.
+    """
+    values = raw_df.iloc[:HEADER_SEARCH_ROWS].to_numpy(dtype=object)
+    text = _cell_text(values)
+    # Hash of rows 0..i for every i, so a cached header at row i is found whatever follows it
+    digest = hashlib.sha1()
+    prefix_keys = []
+    for row in text.tolist():
+        digest.update('\x1f'.join(row).encode() + b'\x1e')
+        prefix_keys.append(digest.hexdigest())
+
+    if use_cache:
+        with _structure_lock:
+            for key in prefix_keys:
+                if key in _structure_cache:
+                    _structure_cache.move_to_end(key)
+                    metrics.count('structure_cache_hit')
+                    return _structure_cache[key]
+        metrics.count('structure_cache_miss')
+
+    found_row = _header_row_from_text(text)
+    header_row = 0 if found_row is None else found_row
+    columns = [str(c).strip() for c in values[header_row]] if len(values) else []
+    # Delete bad columns starting with Unnamed or nan
+    keep = [not (c.startswith('Unnamed') or c == 'nan') for c in columns]
+    kept = [c for c, k in zip(columns, keep) if k]
+    matches = _column_matches(kept)
+    col_mapping = {key: kept[found[0]] if len(found) else None for key, found in matches.items()}
+    confidence = {
+        key: _column_confidence(col_mapping[key], key, len(found)) if len(found) else None
+        for key, found in matches.items()
+    }
+    confidence['header'] = round(sum(1 for c in col_mapping.values() if c) / len(col_mapping), 2)
+    structure = {
+        'header_row': header_row,
+        'columns': columns,
+        'keep': keep,
+        'col_mapping': col_mapping,
+        'confidence': confidence
+    }
+
+    # Without a header row (0 is used then) all the searched rows decided it: only remember that
+    # for a sheet with all HEADER_SEARCH_ROWS rows, as a longer sheet starting alike could have one
+    if found_row is not None:
+        key = prefix_keys[found_row]
+    elif len(prefix_keys) == HEADER_SEARCH_ROWS:
+        key = prefix_keys[-1]
+    else:
+        key = None
+    if use_cache and key:
+        with _structure_lock:
+            _structure_cache[key] = structure
+            if len(_structure_cache) > STRUCTURE_CACHE_SIZE:
+                _structure_cache.popitem(last=False)
+    return structure
+
+
+def prepare_sheet(raw_df):
+    """
+    Turn a raw sheet (read without header) into a clean DataFrame plus its column mapping.
+    """
+    # Find the correct header row and the columns (cached for sheets laid out the same way)
+    with metrics.timer('detect_structure'):
+        structure = detect_structure(raw_df)
+
+    if structure['confidence']['header'] < 1:
+        metrics.count('structure_columns_missing')
+
+    # Re-assign data and headers
+    df = raw_df.iloc[structure['header_row'] + 1:].reset_index(drop=True)
+    df.columns = structure['columns']
+    df = df.loc[:, structure['keep']]
+
+    # Important columns first and compact types, once here instead of on every rerun
+    col_mapping = dict(structure['col_mapping'])
+    with metrics.timer('compact_sheet'):
+        df = compact_sheet(order_columns(df, col_mapping), col_mapping)
+
+    with metrics.timer('build_indexes'):
+        return build_prepared_sheet(df, col_mapping, confidence=structure['confidence'])
+
+
+def _whole_numbers(series):
+    # The column as nullable integers if every value in it is a whole number, else None
+    values = series.dropna()
+    if len(values) == 0:
+        return None
+    if not pd.api.types.is_numeric_dtype(values):
+        is_number = values.map(lambda v: isinstance(v, (int, float, np.number)) and not isinstance(v, bool))
+        if not is_number.all():
+            return None
+        values = pd.to_numeric(values)
+    if pd.api.types.is_bool_dtype(values) or not (values % 1 == 0).all():
+        return None
+
+    low, high = values.min(), values.max()
+    dtype = 'Int32' if -2**31 <= low and high < 2**31 else 'Int64'
+    return pd.to_numeric(series).astype(dtype)
+
+
+def compact_column(series, categorical=False):
+    """
+    Smaller types for a sheet column: whole numbers become nullable integers, other numbers
+    floats, text that mixes with numbers becomes text, and repeated values (VDC names, land use...)
+    become categoricals, which store every distinct string once.
+    """
+    integers = _whole_numbers(series)
+    if integers is not None:
+        return integers.astype('category') if categorical else integers
+
+    if series.dtype == object:
+        values = series.dropna()
+        kinds = values.map(lambda v: 'bool' if isinstance(v, (bool, np.bool_)) else
+                           'text' if isinstance(v, str) else
+                           'number' if isinstance(v, (int, float, np.number)) else 'other')
+        if kinds.isin(['bool', 'other']).any():
+            # Yes/no cells, dates and the like stay as they are
+            return series
+        if not categorical and len(values) and (kinds == 'number').all():
+            # Areas and the like: numbers, but not all whole (key columns stay text, see _text_keys)
+            return pd.to_numeric(series).astype(float)
+        series = series.astype(str).where(series.notna())
+
+    if pd.api.types.is_string_dtype(series) and (categorical or series.nunique() <= len(series) // 2):
+        return series.astype('category')
+    return series
+
+
+def compact_sheet(df, col_mapping):
+    """
+    Compact every column of a prepared sheet (see compact_column).
+    VDC, ward, sheet no. and land use are always categoricals.
+    """
+    if df.shape[1] == 0:
+        return df
+    names = df.columns.tolist()
+    categorical = {names.index(col_mapping[key]) for key in ('vdc', 'ward', 'sheet_no', 'land_use') if col_mapping[key]}
+    columns = [compact_column(df.iloc[:, i], i in categorical) for i in range(df.shape[1])]
+    compacted = pd.concat(columns, axis=1, ignore_index=True)
+    compacted.columns = df.columns
+    return compacted
+
+
+def build_prepared_sheet(df, col_mapping, filter_index=None, plot_index=None, confidence=None):
+    """
+    A clean sheet with its column mapping, how sure the mapping is (detect_structure's
+    confidence, None if unknown) and lookup indexes (built here unless given).
+    Prepared sheets are shared between sessions: do not modify them.
+    """
+    return {
+        'df': df,
+        'col_mapping': col_mapping,
+        'confidence': confidence,
+        'filter_index': filter_index or build_filter_index(df, col_mapping),
+        'plot_index': plot_index or build_plot_index(df, col_mapping),
+        'land_use_summary': build_land_use_summary(df, col_mapping)
+    }
+
+
+def _text_keys(series):
+    # Same text the filters compare against (str of the cell), missing cells stay missing
+    return series.astype(str).where(series.notna())
+
+
+def pack_groups(groups):
+    """
+    {key: row positions} as one int32 array of all the positions plus [key, start, end] bounds,
+    so a group index can be written to a file (see unpack_groups).
+    """
+    bounds = []
+    start = 0
+    for key in sorted(groups):
+        bounds.append([list(key) if isinstance(key, tuple) else key, start, start + len(groups[key])])
+        start += len(groups[key])
+    rows = np.concatenate([groups[key] for key in sorted(groups)]) if groups else np.array([])
+    return rows.astype(np.int32), bounds
+
+
+def unpack_groups(rows, bounds):
+    # The groups of pack_groups again, as views into `rows` (no copies)
+    return {tuple(key) if isinstance(key, list) else key: rows[start:end] for key, start, end in bounds}
+
+
+def filter_index_from_groups(ward_rows, sheet_rows, ward_sheet_rows):
+    # Dropdown options of the filter cascade, from the row positions of each ward / sheet no.
+    index = {
+        'ward_options': sorted(ward_rows),
+        'ward_rows': ward_rows,
+        'sheet_options': sorted(sheet_rows),
+        'sheet_rows': sheet_rows,
+        'ward_sheet_options': {},
+        'ward_sheet_rows': ward_sheet_rows
+    }
+    for ward, sheet in sorted(ward_sheet_rows):
+        index['ward_sheet_options'].setdefault(ward, []).append(sheet)
+    return index
+
+
+def build_filter_index(df, col_mapping):
+    """
+    Precompute dropdown options and row positions for the ward -> sheet no. filter cascade.
+    Row positions of a ward (sheet no., ward and sheet no.) are int32 views into one array.
+    """
+    col_ward = col_mapping['ward']
+    col_sheet = col_mapping['sheet_no']
+    groups = {'ward_rows': {}, 'sheet_rows': {}, 'ward_sheet_rows': {}}
+
+    if col_ward:
+        ward_keys = _text_keys(df[col_ward])
+        groups['ward_rows'] = ward_keys.groupby(ward_keys).indices
+
+    if col_sheet:
+        sheet_keys = _text_keys(df[col_sheet])
+        groups['sheet_rows'] = sheet_keys.groupby(sheet_keys).indices
+
+    if col_ward and col_sheet:
+        pairs = pd.DataFrame({'ward': ward_keys, 'sheet': sheet_keys})
+        groups['ward_sheet_rows'] = pairs.groupby(['ward', 'sheet']).indices
+
+    return filter_index_from_groups(**{key: unpack_groups(*pack_groups(rows)) for key, rows in groups.items()})
+
+
+def build_land_use_summary(df, col_mapping):
+    """
+    Kitta counts per land use, as ward x land use pivots: one for the whole sheet ('by_ward')
+    and one per ward and sheet no. ('by_ward_sheet'). Built once with the sheet, so the summary
+    view only slices these small tables (see land_use_counts). None without a land use column.
+    Wards and sheet nos. are the same text keys as in the filter index; blank cells count as ''.
+    """
+    col_land_use = col_mapping['land_use']
+    if not col_land_use:
+        return None
+
+    # Group on the (categorical) columns as they are, then turn the few group labels into text
+    blank = pd.Series('', index=df.index)
+    columns = [col_mapping['ward'], col_mapping['sheet_no'], col_land_use]
+    counts = pd.concat([df[col] if col else blank for col in columns], axis=1, keys=range(3)) \
+        .groupby(list(range(3)), observed=True, dropna=False).size()
+    counts.index = pd.MultiIndex.from_arrays(
+        [counts.index.get_level_values(i).map(lambda v: '' if pd.isna(v) else str(v)) for i in range(3)],
+        names=['ward', 'sheet', 'land_use']
+    )
+    counts = counts.groupby(level=[0, 1, 2]).sum()
+    by_ward_sheet = counts.unstack('land_use', fill_value=0).sort_index()
+    # Most common land use first
+    by_ward_sheet = by_ward_sheet[by_ward_sheet.sum().sort_values(ascending=False, kind='stable').index]
+    by_ward_sheet.columns.name = None
+    return {
+        'by_ward': by_ward_sheet.groupby(level='ward').sum(),
+        'by_ward_sheet': by_ward_sheet
+    }
+
+
+def land_use_counts(summary, ward=None, sheet_no=None):
+    """
+    Ward x land use kitta counts for the ward / sheet no. filters, sliced from a precomputed
+    summary (build_land_use_summary). Land uses with no kitta in the selection are left out.
+    """
+    if sheet_no is None:
+        counts = summary['by_ward']
+        if ward is not None:
+            counts = counts[counts.index == ward]
+    else:
+        table = summary['by_ward_sheet']
+        keep = table.index.get_level_values('sheet') == sheet_no
+        if ward is not None:
+            keep &= table.index.get_level_values('ward') == ward
+        counts = table[keep].groupby(level='ward').sum()
+    return counts.loc[:, counts.sum() > 0]
+
+
+def build_land_use_totals(prepared_sheets):
+    """
+    Sheet x land use kitta counts over every sheet with a land use column (from their summaries).
+    """
+    totals = {
+        name: prepared['land_use_summary']['by_ward'].sum()
+        for name, prepared in prepared_sheets.items()
+        if prepared['land_use_summary'] is not None
+    }
+    if not totals:
+        return pd.DataFrame()
+    table = pd.DataFrame(totals).T.fillna(0).astype('int64')
+    return table[table.sum().sort_values(ascending=False, kind='stable').index]
+
+
+def normalize_plot_number(value):
+    """
+    Normalize a plot/kitta number so that '123 / 4', '123-4', '123/4' and '१२३/४' (or '123-Ka') compare equal.
+    """
+    if value is None or (isinstance(value, float) and np.isnan(value)):
+        return None
+    # Excel gives whole numbers as floats when the column has blanks (123.0)
+    if isinstance(value, float) and value.is_integer():
+        value = int(value)
+    text = fuzzy.fold(str(value)).strip().lower()
+    text = re.sub(r'\s*[/\\_-]\s*', '/', text)
+    return re.sub(r'\s+', '', text)
+
+
+def plot_index_from_keys(keys, order=None):
+    """
+    A plot index over normalized keys (an Arrow text array, one per row, missing for blank cells):
+    the keys plus the row positions in key order. Both are plain arrays, so an index can be
+    written to a file and memory-mapped (see refresh.save_prepared_sheet); pass the saved order to skip sorting.
+    """
+    if order is None:
+        # Missing keys sort last
+        order = pc.sort_indices(keys).to_numpy()
+        order = order[:len(keys) - keys.null_count].astype(np.int32)
+    return {
+        'keys': keys,
+        'order': order,
+        # Every FENCE_STEP-th key in order, as Python strings: a search narrows down to one block first
+        'fence': keys.take(order[::FENCE_STEP]).to_pylist()
+    }
+
+
+def build_plot_index(df, col_mapping):
+    """
+    Precompute normalized plot numbers and their sort order (binary search for exact and prefix).
+    """
+    col_plot = col_mapping['plot']
+    if not col_plot:
+        return None
+
+    keys = df[col_plot].map(normalize_plot_number).to_numpy(dtype=object)
+    return plot_index_from_keys(pa.array(keys, type=pa.large_string(), from_pandas=True))
+
+
+def plot_key_range(plot_index, low, high=None):
+    """
+    (start, end) in plot_index['order'] of the keys equal to `low`, or from `low` up to `high`.
+    """
+    keys = plot_index['keys']
+    order = plot_index['order']
+    fence = plot_index['fence']
+
+    def key(row):
+        return keys[int(row)].as_py()
+
+    def position(value, bisect):
+        # The fence gives the block, only the keys of that block are read from the array
+        block = bisect(fence, value)
+        lo = max(0, (block - 1) * FENCE_STEP)
+        return bisect(order, value, lo=lo, hi=min(len(order), block * FENCE_STEP), key=key)
+
+    start = position(low, bisect_left)
+    return start, position(low, bisect_right) if high is None else position(high, bisect_left)
+
+
+def fuzzy_plot_index(plot_index):
+    """
+    The bigram index (fuzzy.build_ngram_index) over the distinct keys of a plot index, built on
+    the first fuzzy search and kept with the plot index.
+    """
+    if 'fuzzy' not in plot_index:
+        with metrics.timer('build_fuzzy_index'):
+            keys = pc.unique(plot_index['keys'].drop_null()).to_pylist()
+            plot_index['fuzzy'] = fuzzy.build_ngram_index(keys)
+    return plot_index['fuzzy']
+
+
+def fuzzy_plot_rows(plot_index, query, rows=None):
+    """
+    Row positions of the FUZZY_LIMIT plot numbers most like the query (a normalized key), best
+    match first. If rows is given, only plot numbers found in those rows count.
+    """
+    if rows is not None:
+        allowed = np.zeros(len(plot_index['keys']), dtype=bool)
+        allowed[rows] = True
+    parts = []
+    for key, score in fuzzy.rank(fuzzy_plot_index(plot_index), query):
+        start, end = plot_key_range(plot_index, key)
+        found = np.sort(plot_index['order'][start:end])
+        if rows is not None:
+            found = found[allowed[found]]
+        if len(found):
+            parts.append(found)
+            if len(parts) == FUZZY_LIMIT:
+                break
+    return np.concatenate(parts) if parts else np.array([], dtype=np.int32)
+
+
+def search_plot_rows(plot_index, query, mode='exact', rows=None):
+    """
+    Row positions whose plot number matches the query.
+    mode is 'exact' or 'prefix' (binary search over the sorted keys), 'contains' (literal substring
+    scan) or 'fuzzy' (the most similar plot numbers, best first, see fuzzy_plot_rows).
+    If rows is given, only those row positions are searched.
+    """
+    query = normalize_plot_number(query)
+    if not query:
+        return np.arange(len(plot_index['keys'])) if rows is None else rows
+
+    if mode == 'fuzzy':
+        return fuzzy_plot_rows(plot_index, query, rows)
+
+    if mode == 'contains':
+        keys = plot_index['keys'] if rows is None else plot_index['keys'].take(rows)
+        matches = pc.match_substring(keys, query).fill_null(False)
+        found = np.flatnonzero(matches.to_numpy(zero_copy_only=False))
+        return found if rows is None else rows[found]
+
+    # Every key starting with the query sorts between it and the query plus the highest character
+    start, end = plot_key_range(plot_index, query, query + '\U0010ffff' if mode == 'prefix' else None)
+    found = np.sort(plot_index['order'][start:end])
+
+    return found if rows is None else np.intersect1d(rows, found, assume_unique=True)
+
+
+def order_columns(df, col_mapping):
+    # Put important columns first (by position, column names can repeat)
+    names = df.columns.tolist()
+    first = [names.index(c) for c in [col_mapping['plot'], col_mapping['ward'], col_mapping['sheet_no']] if c]
+    return df.iloc[:, first + [i for i in range(len(names)) if i not in first]]
+
+
+def build_global_plot_index(prepared_sheets):
+    """
+    One plot index over all sheets, each key tagged with its source sheet (a position in
+    'sheet_names') and row position.
+    """
+    names = []
+    keys = []
+    for sheet_name, prepared in prepared_sheets.items():
+        if prepared['plot_index'] is not None:
+            names.append(sheet_name)
+            keys.append(prepared['plot_index']['keys'])
+
+    sizes = [len(k) for k in keys]
+    index = plot_index_from_keys(pa.concat_arrays(keys) if keys else pa.array([], type=pa.large_string()))
+    index['sheet'] = np.repeat(np.arange(len(names), dtype=np.int32), sizes)
+    index['sheet_names'] = names
+    index['row'] = np.concatenate([np.arange(n, dtype=np.int32) for n in sizes]) if sizes else np.array([], dtype=np.int32)
+    return index
+
+
+def global_plot_rows(global_index, query, mode='exact'):
+    """
+    Positions in the cross-sheet index of the plots matching the query, in every sheet at once.
+    Raises ValueError for a blank query (it would match every row of every sheet).
+    """
+    query = normalize_plot_number(query)
+    if not query:
+        raise ValueError("plot is required when no sheet is given")
+    return search_plot_rows(global_index, query, mode)
+
+
+def global_results(global_index, prepared_sheets, found, source_label='Sheet'):
+    """
+    Rows for the cross-sheet index positions `found`, as one table with a source sheet column first.
+    Columns are lined up by position like the export (column names can repeat, see export.hits_export).
+    """
+    hits = export.global_hits(global_index, found)
+    columns, chunks = export.hits_export(prepared_sheets, hits, source_label, chunk_rows=max(1, len(found)))
+    results = list(chunks)
+    if not results:
+        return pd.DataFrame(columns=columns)
+    return pd.concat(results, ignore_index=True)
+
+
+# How a plot number is matched, see search_plot_rows
+PLOT_MATCH_MODES = ('exact', 'prefix', 'contains', 'fuzzy')
+# Most plot numbers a fuzzy search returns (each with all its rows)
+FUZZY_LIMIT = 20
+
+# Rows returned per query unless it asks for another limit
+QUERY_LIMIT = 100
+# Types a query's fields may have (check_query)
+QUERY_FIELD_TYPES = {
+    'sheet': (str,),
+    'mode': (str,),
+    'ward': (str, int, float),
+    'sheet_no': (str, int, float),
+    'plot': (str, int, float),
+    'limit': (str, int),
+    'offset': (str, int)
+}
+
+
+def filter_rows(prepared, ward=None, sheet_no=None, plot=None, mode='exact'):
+    """
+    Row positions of a prepared sheet that match the ward -> sheet no. -> plot filters, or None
+    for all rows. Empty filters, and filters on columns the sheet does not have, are skipped.
+    Uses the prebuilt indexes only, no scans over the rows (except 'contains' plot searches).
+    """
+    col_mapping = prepared['col_mapping']
+    filter_index = prepared['filter_index']
+    no_rows = np.array([], dtype=np.intp)
+    ward = str(ward) if col_mapping['ward'] and ward not in (None, '') else None
+    sheet_no = str(sheet_no) if col_mapping['sheet_no'] and sheet_no not in (None, '') else None
+    rows = None
+
+    # 1. Ward
+    if ward:
+        with metrics.timer('filter_ward'):
+            rows = filter_index['ward_rows'].get(ward, no_rows)
+
+    # 2. Sheet No (within the ward, if one is given)
+    if sheet_no:
+        with metrics.timer('filter_sheet_no'):
+            if ward:
+                rows = filter_index['ward_sheet_rows'].get((ward, sheet_no), no_rows)
+            else:
+                rows = filter_index['sheet_rows'].get(sheet_no, no_rows)
+
+    # 3. Plot
+    if col_mapping['plot'] and plot not in (None, ''):
+        with metrics.timer(f'filter_plot_{mode}'):
+            rows = search_plot_rows(prepared['plot_index'], plot, mode, rows)
+
+    return rows
+
+
+def _cached_rows(cache, key, compute):
+    """
+    The rows of `key` from the result cache, or compute(narrow) stored under it.
+    For 'contains' searches `narrow` is the cached result of the same query without its last
+    characters (every key containing '1234' contains '123'), so typing on in the plot box only
+    searches the rows found before; otherwise it is None.
+    """
+    rows = cache.get(key)
+    if rows is not None:
+        metrics.count('result_cache_hit')
+        return rows
+    metrics.count('result_cache_miss')
+
+    narrow = None
+    plot, mode = key[-2:]
+    if mode == 'contains':
+        for end in range(len(plot) - 1, 0, -1):
+            narrow = cache.get(key[:-2] + (plot[:end], mode))
+            if narrow is not None:
+                metrics.count('result_cache_narrowed')
+                break
+    rows = compute(narrow)
+    if rows is not None:
+        cache.put(key, rows)
+    return rows
+
+
+def _filter_key(value):
+    # A ward or sheet no. as filter_rows compares it, None for no filter
+    return None if value in (None, '') else str(value)
+
+
+def cached_filter_rows(cache, version, sheet_name, prepared, ward=None, sheet_no=None, plot=None, mode='exact'):
+    """
+    filter_rows through a ResultCache (refresh.py): the same ward / sheet no. / plot on the same data version
+    is searched once for all sessions, also when a rerun only changed the theme or language.
+    `version` is the sheet's own hash (snapshot['sheet_versions']), so its results are still used
+    after a refresh that changed other sheets only.
+    """
+    plot = normalize_plot_number(plot) if prepared['col_mapping']['plot'] else None
+    if not plot and _filter_key(ward) is None and _filter_key(sheet_no) is None:
+        return filter_rows(prepared, ward, sheet_no)
+    key = (version, sheet_name, _filter_key(ward), _filter_key(sheet_no), plot or '', mode if plot else None)
+
+    def compute(narrow):
+        if narrow is not None:
+            return search_plot_rows(prepared['plot_index'], plot, mode, narrow)
+        return filter_rows(prepared, ward, sheet_no, plot, mode)
+
+    return _cached_rows(cache, key, compute)
+
+
+def cached_global_plot_rows(cache, version, global_index, query, mode='exact'):
+    # global_plot_rows through a ResultCache (see cached_filter_rows)
+    plot = normalize_plot_number(query)
+    if not plot:
+        raise ValueError("plot is required when no sheet is given")
+    key = (version, None, None, None, plot, mode)
+    return _cached_rows(cache, key, lambda narrow: search_plot_rows(global_index, plot, mode, narrow))
+
+
+def find_sheet_name(sheet_names, name):
+    """
+    The sheet called `name`, also when it is typed in the other script or spelled a little
+    differently ('Bhaktapur' for 'भक्तपुर', see fuzzy.name_key; 'Kathmandu' for 'काठमाडौं', see
+    fuzzy.closest_name), or without its source when only one source has a sheet of that name
+    ('VDC01' for 'Lalitpur/VDC01').
+    Raises ValueError, naming the most similar sheets, when there is no such sheet.
+    """
+    if not isinstance(name, str):
+        raise ValueError("sheet must be text")
+    if name in sheet_names:
+        return name
+    by_key = {}
+    for sheet_name in sheet_names:
+        by_key.setdefault(fuzzy.name_key(sheet_name), []).append(sheet_name)
+        if '/' in sheet_name:
+            by_key.setdefault(fuzzy.name_key(sheet_name.partition('/')[2]), []).append(sheet_name)
+    same = by_key.get(fuzzy.name_key(name), [])
+    if len(same) == 1:
+        return same[0]
+    if not same:
+        # Romanized differently ('Kathmandu' for 'काठमाडौं', see fuzzy.closest_name)
+        by_label = {}
+        for sheet_name in sheet_names:
+            by_label.setdefault(sheet_name, []).append(sheet_name)
+            if '/' in sheet_name:
+                by_label.setdefault(sheet_name.partition('/')[2], []).append(sheet_name)
+        closest = fuzzy.closest_name(list(by_label), name)
+        if closest is not None and len(by_label[closest]) == 1:
+            return by_label[closest][0]
+
+    ranked = fuzzy.rank(fuzzy.build_ngram_index(list(by_key)), fuzzy.name_key(name), limit=3)
+    similar = list(dict.fromkeys(sheet_name for key, _ in ranked for sheet_name in by_key[key]))
+    hint = f" (did you mean {', '.join(similar)}?)" if similar else ""
+    raise ValueError(f"Unknown sheet: {name}{hint}")
+
+
+def check_query(query):
+    """
+    Raise ValueError unless `query` is a dict (e.g. parsed from JSON) with fields query_hits and
+    query_records can use: sheet and mode text; ward, sheet_no and plot text or numbers;
+    limit and offset whole numbers (or text of one). Every field may be left out or null.
+    """
+    if not isinstance(query, dict):
+        raise ValueError("a query must be a JSON object")
+    for field, types in QUERY_FIELD_TYPES.items():
+        value = query.get(field)
+        # bool is an int to Python, but no ward or kitta is true or false
+        if value is not None and (isinstance(value, bool) or not isinstance(value, types)):
+            kind = 'text' if types == (str,) else 'text or a number'
+            raise ValueError(f"{field} must be {kind}")
+
+
+def query_hits(workbook, query, global_index=None, cache=None, version=None):
+    """
+    The rows matching one query, as [(sheet name, row positions), ...] in result order.
+
+    `query` is a dict with the optional keys sheet, ward, sheet_no, plot and mode.
+    Without a sheet the plot is looked up in every sheet through `global_index`
+    (build_global_plot_index), and ward / sheet no. filter the rows found.
+    With a ResultCache results are reused: those of one sheet while its content stays the same
+    (see cached_filter_rows), those of `global_index` while the data version stays the same.
+    Raises ValueError for a query that cannot be answered.
+    """
+    check_query(query)
+    # Results of a sheet are kept under its own hash; a plain dict of sheets only has the data version
+    sheet_versions = getattr(workbook, 'sheet_versions', {})
+
+    def sheet_rows(name, ward, sheet_no, plot=None, mode='exact'):
+        if cache is None:
+            return filter_rows(workbook[name], ward, sheet_no, plot, mode)
+        sheet_version = sheet_versions.get(name, version)
+        return cached_filter_rows(cache, sheet_version, name, workbook[name], ward, sheet_no, plot, mode)
+
+    sheet = query.get('sheet')
+    ward = query.get('ward')
+    sheet_no = query.get('sheet_no')
+    plot = query.get('plot')
+    mode = query.get('mode') or 'exact'
+    if mode not in PLOT_MATCH_MODES:
+        raise ValueError(f"mode must be one of {', '.join(PLOT_MATCH_MODES)}")
+
+    if sheet:
+        sheet = find_sheet_name(workbook, sheet)
+        rows = sheet_rows(sheet, ward, sheet_no, plot, mode)
+        return [(sheet, np.arange(len(workbook[sheet]['df'])) if rows is None else rows)]
+
+    # Checked after normalizing: a blank plot (' ') would match every row of every sheet
+    if global_index is None or not normalize_plot_number(plot):
+        raise ValueError("plot is required when no sheet is given")
+    with metrics.timer(f'global_search_{mode}'):
+        if cache is None:
+            found = global_plot_rows(global_index, plot, mode)
+        else:
+            found = cached_global_plot_rows(cache, version, global_index, plot, mode)
+    hits = []
+    for name, rows in export.global_hits(global_index, found):
+        if ward not in (None, '') or sheet_no not in (None, ''):
+            allowed = sheet_rows(name, ward, sheet_no)
+            if allowed is not None:
+                rows = rows[np.isin(rows, allowed)]
+        hits.append((name, rows))
+    return hits
+
+
+def query_records(workbook, query, global_index=None, cache=None, version=None):
+    """
+    Answer one query (see query_hits; limit and offset page through the rows).
+    Returns {'total': matching rows, 'matches': [{'sheet', 'columns', 'rows'}, ...]} with at most
+    `limit` rows, grouped by sheet. Raises ValueError for a query that cannot be answered.
+    """
+    check_query(query)
+    try:
+        limit = int(query.get('limit') if query.get('limit') is not None else QUERY_LIMIT)
+        offset = int(query.get('offset') or 0)
+    except ValueError:
+        raise ValueError("limit and offset must be whole numbers")
+    if limit < 0 or offset < 0:
+        raise ValueError("limit and offset must not be negative")
+    hits = query_hits(workbook, query, global_index, cache, version)
+
+    # One page over all the sheets' rows, in order
+    total = sum(len(rows) for _, rows in hits)
+    matches = []
+    skip, left = offset, limit
+    for name, rows in hits:
+        page = rows[skip:skip + left]
+        skip = max(0, skip - len(rows))
+        if len(page) == 0:
+            continue
+        left -= len(page)
+        df = workbook[name]['df']
+        # Plain values, blank cells as None
+        values = df.iloc[page].to_numpy(dtype=object)
+        values[pd.isna(values)] = None
+        matches.append({'sheet': name, 'columns': df.columns.tolist(), 'rows': values.tolist()})
+    return {'total': int(total), 'matches': matches}
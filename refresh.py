@@ -0,0 +1,1154 @@
+"""
+Downloading and refreshing the land record workbook, and keeping it: the prepared sheets of the
+current data version (opened lazily and shared by all sessions), the snapshot folder that makes
+restarts instant, the shared mode of loader.py and the change journal.
+Sheets are prepared and searched by records.py.
+"""
+import hashlib
+import io
+import json
+import logging
+import os
+import re
+import threading
+import time
+import zipfile
+from collections import OrderedDict
+from collections.abc import Mapping
+from concurrent.futures import ThreadPoolExecutor
+from xml.etree import ElementTree
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.feather as feather
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+import changes
+import ingest
+import metrics
+import records
+
+# Fixed values
+# Update to XLSX export URL to support multiple sheets
+DATA_URL = os.environ.get(
+    'LAND_RECORD_DATA_URL',
+    "https://docs.google.com/spreadsheets/d/1lpzFNKk0thSQqS8GQxzwiuLr8T9abM7M/export?format=xlsx"
+)
+# Several workbooks (e.g. one per municipality) as "name=url" pairs separated by ';' or new lines.
+# Their sheets are then called "<name>/<sheet>"; empty: DATA_URL only, sheet names as they are
+SOURCES_SETTING = os.environ.get('LAND_RECORD_SOURCES', '')
+
+# How often (seconds) the workbook is checked for changes
+REFRESH_TTL = 600
+# Workbooks downloaded at the same time during a refresh
+FETCH_WORKERS = int(os.environ.get('LAND_RECORD_FETCH_WORKERS', '8'))
+# Retries of a download (with backoff) after connection errors and 429 / 5xx answers
+FETCH_RETRIES = 3
+# Seconds to wait for a connection, and for the data
+FETCH_TIMEOUT = (10, 60)
+
+# Where the workbook and prepared sheets are kept on disk between restarts (empty: memory only)
+SNAPSHOT_DIR = os.environ.get(
+    'LAND_RECORD_SNAPSHOT_DIR',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), '.snapshot')
+)
+
+# How sheets are parsed, see ingest.py: 'streaming' (default), 'pandas' or 'csv'
+# (checked when the app starts, so a typo is not silently read as 'streaming')
+INGEST_ENGINE = ingest.check_engine(os.environ.get('LAND_RECORD_INGEST_ENGINE', 'streaming'))
+# More than 1 parses sheets in parallel worker processes
+INGEST_WORKERS = int(os.environ.get('LAND_RECORD_INGEST_WORKERS', '1'))
+# Per-sheet CSV export URL with a {sheet} placeholder, used by the 'csv' engine
+CSV_URL_TEMPLATE = os.environ.get('LAND_RECORD_CSV_URL_TEMPLATE')
+# Memory budget (MB) for prepared sheets kept in memory, least recently used go first
+SHEET_CACHE_MB = int(os.environ.get('LAND_RECORD_SHEET_CACHE_MB', '512'))
+# Memory budget (MB) for filter and search results (row positions) shared by all sessions
+RESULT_CACHE_MB = int(os.environ.get('LAND_RECORD_RESULT_CACHE_MB', '64'))
+# Most results kept, whatever their size
+RESULT_CACHE_SIZE = 2000
+# 'worker': never download or parse, serve what loader.py publishes in SNAPSHOT_DIR (several app /
+# API processes then share one copy of the data); empty: this process loads the data itself
+SHARED_MODE = os.environ.get('LAND_RECORD_SHARED', '')
+# How often (seconds) a worker looks for a newer snapshot from the loader
+SHARED_POLL = 5
+# Version of the saved index files, part of their names: older files are rebuilt instead of read
+# (2: plot keys with Devanagari digits folded, see records.normalize_plot_number)
+INDEX_VERSION = 2
+# Version of the saved prepared sheets, part of their names like INDEX_VERSION
+# (2: number columns that are not all whole numbers stay numbers, see records.compact_column)
+SHEET_FILE_VERSION = 2
+# Changed records kept in memory for the recent changes view (journal.jsonl in the snapshot folder has all of them)
+JOURNAL_SIZE = 1000
+# Changed records journaled per sheet, refresh and kind (added, removed, changed); the rest are only counted
+JOURNAL_SHEET_LIMIT = 1000
+
+logger = logging.getLogger(__name__)
+
+
+def parse_sources(setting, default_url=DATA_URL):
+    """
+    {source name: workbook URL} from a LAND_RECORD_SOURCES setting ("Kathmandu=https://...; Lalitpur=https://...").
+    Without any, the one workbook at default_url under the name '' (its sheet names are not prefixed).
+    Raises ValueError for an entry without a name or URL, and for names used twice or containing '/'.
+    """
+    sources = {}
+    for entry in re.split(r'[;\n]+', setting):
+        if not entry.strip():
+            continue
+        name, sep, url = entry.partition('=')
+        name, url = name.strip(), url.strip()
+        # Sheet names cannot contain '/' (Excel does not allow it), so "<name>/<sheet>" is never ambiguous
+        if not sep or not name or not url or '/' in name:
+            raise ValueError(f"Bad source, use name=url (no '/' in the name): {entry.strip()}")
+        if name in sources:
+            raise ValueError(f"Source named twice: {name}")
+        sources[name] = url
+    return sources or {'': default_url}
+
+
+SOURCES = parse_sources(SOURCES_SETTING)
+
+
+def make_http_session(workers=FETCH_WORKERS, retries=FETCH_RETRIES):
+    """
+    A requests session for the downloads: connections are pooled and kept open (one per worker),
+    and failed requests are retried with backoff (0.5 s, 1 s, 2 s, ...).
+    """
+    retry = Retry(
+        total=retries,
+        backoff_factor=0.5,
+        status_forcelist=(429, 500, 502, 503, 504),
+        allowed_methods=('GET',),
+        raise_on_status=False
+    )
+    adapter = HTTPAdapter(pool_connections=workers, pool_maxsize=workers, max_retries=retry)
+    session = requests.Session()
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
+
+
+def sheet_fingerprints(content):
+    """
+    Hash every sheet of an XLSX file without parsing it with pandas.
+    A sheet's hash covers its XML and the shared strings it uses, so editing one sheet
+    does not change the hash of the others.
+    """
+    ns = {
+        'm': 'http://schemas.openxmlformats.org/spreadsheetml/2006/main',
+        'r': 'http://schemas.openxmlformats.org/officeDocument/2006/relationships',
+        'rel': 'http://schemas.openxmlformats.org/package/2006/relationships'
+    }
+    with zipfile.ZipFile(io.BytesIO(content)) as zf:
+        workbook = ElementTree.fromstring(zf.read('xl/workbook.xml'))
+        rels = ElementTree.fromstring(zf.read('xl/_rels/workbook.xml.rels'))
+        targets = {rel.get('Id'): rel.get('Target') for rel in rels.findall('rel:Relationship', ns)}
+
+        shared_strings = []
+        if 'xl/sharedStrings.xml' in zf.namelist():
+            root = ElementTree.fromstring(zf.read('xl/sharedStrings.xml'))
+            for si in root.findall('m:si', ns):
+                shared_strings.append(''.join(node.text or '' for node in si.iter('{%s}t' % ns['m'])))
+        all_strings_hash = hashlib.sha1('\x00'.join(shared_strings).encode()).digest()
+
+        fingerprints = {}
+        for sheet in workbook.find('m:sheets', ns).findall('m:sheet', ns):
+            target = targets[sheet.get('{%s}id' % ns['r'])]
+            path = target.lstrip('/') if target.startswith('/') else 'xl/' + target
+            xml = zf.read(path)
+
+            # Cells of type "s" only store an index into the shared strings, hash their text instead
+            # so a reordered shared string table does not look like a change
+            cell_pattern = rb'(<c\b[^>]*\bt="s"[^>]*>\s*<v>)(\d+)(</v>)'
+            resolved, count = re.subn(
+                cell_pattern,
+                lambda m: m.group(1) + shared_strings[int(m.group(2))].encode() + m.group(3),
+                xml
+            )
+            digest = hashlib.sha1(resolved)
+            if count != len(re.findall(rb'<c\b[^>]*\bt="s"', xml)):
+                # Unusual cell layout: fall back to all shared strings
+                digest.update(all_strings_hash)
+            fingerprints[sheet.get('name')] = digest.hexdigest()
+    return fingerprints
+
+
+def download_workbook(session, url, validators=None, timeout=FETCH_TIMEOUT):
+    """
+    GET one workbook, conditional on the ETag / Last-Modified of its last download (`validators`).
+    Returns None if the server says it did not change, else {'content', 'etag', 'last_modified'}.
+    """
+    headers = {}
+    if validators and validators.get('etag'):
+        headers['If-None-Match'] = validators['etag']
+    if validators and validators.get('last_modified'):
+        headers['If-Modified-Since'] = validators['last_modified']
+
+    with metrics.timer('download'):
+        response = session.get(url, headers=headers, timeout=timeout)
+        if response.status_code == 304 and headers:
+            return None
+        response.raise_for_status()
+        return {
+            'content': response.content,
+            'etag': response.headers.get('ETag'),
+            'last_modified': response.headers.get('Last-Modified')
+        }
+
+
+def fetch_all(fetch, names):
+    """
+    fetch(name) for every name at the same time (up to FETCH_WORKERS threads), so the time taken
+    is that of the slowest one. Returns ({name: result}, {name: exception}).
+    """
+    results = {}
+    errors = {}
+    workers = max(1, min(FETCH_WORKERS, len(names)))
+    try:
+        pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='workbook-fetch') if workers > 1 else None
+        futures = {name: pool.submit(fetch, name) for name in names} if pool else {}
+    except RuntimeError:
+        # No threads here (e.g. the browser build), one after the other instead
+        pool, futures = None, {}
+
+    for name in names:
+        try:
+            results[name] = futures[name].result() if name in futures else fetch(name)
+        except Exception as e:
+            errors[name] = e
+    if pool:
+        pool.shutdown()
+    return results, errors
+
+
+def _sheet_name(source_name, sheet):
+    # Sheets of named sources are called "<source>/<sheet>"
+    return f'{source_name}/{sheet}' if source_name else sheet
+
+
+def _workbook_version(sources):
+    # One source: its file hash, as with a single workbook; several: a hash of their hashes
+    if list(sources) == ['']:
+        return sources['']['version']
+    return hashlib.sha1('\n'.join(f"{name}\t{entry['version']}" for name, entry in sources.items()).encode()).hexdigest()
+
+
+def refresh_workbook(state, sources=SOURCES, timeout=FETCH_TIMEOUT, folder=SNAPSHOT_DIR):
+    """
+    Bring the workbook snapshot in `state` up to date with `sources` ({name: url}, see parse_sources).
+    Returns True if anything changed.
+
+    All sources are downloaded at the same time over one pooled session (fetch_all), each with a
+    conditional request (ETag / Last-Modified); a file whose hash did not change is skipped.
+    A source that cannot be downloaded keeps its last data (state['source_errors'] says why).
+    Nothing is parsed here: the new snapshot is a LazyWorkbook, so sheets whose content did not
+    change keep their prepared data, and changed sheets are read when first opened.
+    """
+    snapshot = state.get('snapshot')
+    known = state['sources'] if snapshot is not None else {}
+
+    def fetch(name):
+        # Conditional only for a source whose data we have, from the same URL
+        entry = known.get(name)
+        if entry and entry.get('url') not in (None, sources[name]):
+            entry = None
+        return download_workbook(state['http'], sources[name], entry, timeout)
+
+    with metrics.timer('download_all'):
+        results, errors = fetch_all(fetch, list(sources))
+
+    entries = {}
+    changed = False
+    for name, url in sources.items():
+        old = known.get(name)
+        if name in errors:
+            logger.warning("Could not download %s: %s", name or url, errors[name])
+            if old is not None:
+                entries[name] = old
+            continue
+        result = results[name]
+        if result is None:
+            metrics.count('download_not_modified')
+            entries[name] = old
+            continue
+
+        content = result.pop('content')
+        version = hashlib.sha1(content).hexdigest()
+        if old is not None and version == old['version']:
+            metrics.count('download_unchanged')
+            entries[name] = dict(old, url=url, **result)
+            continue
+
+        try:
+            with metrics.timer('fingerprint_sheets'):
+                sheet_versions = sheet_fingerprints(content)
+        except Exception:
+            # Not something we can look inside, treat every sheet as changed
+            sheet_versions = {
+                sheet: hashlib.sha1(f'{version}/{sheet}'.encode()).hexdigest() for sheet in ingest.sheet_names_of(content)
+            }
+        csv_sources = {}
+        if uses_csv_engine(name):
+            # The CSV of every searched sheet is downloaded now, with the workbook, and its hash is
+            # the sheet's version: a snapshot never mixes sheets downloaded at different times
+            try:
+                with metrics.timer('download_csv'):
+                    csv_files = ingest.download_csv_sheets(
+                        CSV_URL_TEMPLATE, data_sheet_names(sheet_versions), timeout=timeout,
+                        workers=FETCH_WORKERS, session=state['http']
+                    )
+            except Exception as e:
+                logger.warning("Could not download the CSV sheets of %s: %s", name or url, e)
+                errors[name] = e
+                if old is not None:
+                    entries[name] = old
+                continue
+            sheet_versions.update((sheet, hashlib.sha1(data).hexdigest()) for sheet, data in csv_files.items())
+            csv_sources = {
+                sheet: store_workbook_file(data, sheet_versions[sheet], folder, '.csv') for sheet, data in csv_files.items()
+            }
+            del csv_files
+        metrics.count('download_changed')
+        changed = True
+
+        # Sheets are read from these files when they are first opened
+        entries[name] = dict(
+            result, url=url, version=version, size=len(content), sheet_versions=sheet_versions,
+            source=store_workbook_file(content, version, folder), csv_sources=csv_sources
+        )
+        del content
+
+    state['source_errors'] = {name: str(e) for name, e in errors.items()}
+    if not entries:
+        raise next(iter(errors.values()))
+    metrics.set_value('workbook_bytes', sum(entry.get('size', 0) for entry in entries.values()))
+    # Sources added to or removed from the setting change the snapshot too
+    changed = changed or snapshot is None or list(entries) != list(known)
+    state['sources'] = entries
+    if not changed:
+        return False
+
+    # All sources in one workbook, sheets named by source
+    sheet_versions = {
+        _sheet_name(name, sheet): h for name, entry in entries.items() for sheet, h in entry['sheet_versions'].items()
+    }
+    workbook = LazyWorkbook(
+        sheet_versions, {name: entry['source'] for name, entry in entries.items()}, state['sheet_cache'], folder,
+        csv_sources=_csv_sources(entries)
+    )
+
+    # Changed sheets that were open before are prepared now, before the swap, so nobody waits for them
+    if snapshot is not None:
+        old_versions = snapshot['sheet_versions']
+        warm = [
+            name for name, h in sheet_versions.items()
+            if name in old_versions and old_versions[name] != h and old_versions[name] in state['sheet_cache']
+        ]
+        workbook.load(warm)
+
+    # Swap the snapshot in one assignment, readers always see a consistent workbook
+    metrics.set_value('snapshot_sheets', len(sheet_versions))
+    state['snapshot'] = {
+        'sheets': workbook,
+        'version': _workbook_version(entries),
+        'sheet_versions': sheet_versions,
+        'sources': {name: entry['version'] for name, entry in entries.items()}
+    }
+    return True
+
+
+def store_workbook_file(content, version, folder=SNAPSHOT_DIR, suffix='.xlsx'):
+    """
+    Keep the downloaded workbook (or CSV sheet, suffix '.csv') as <folder>/<version><suffix> and
+    return its path. Without a usable folder the bytes themselves are returned and kept in memory.
+    """
+    if not folder:
+        return content
+    try:
+        os.makedirs(folder, exist_ok=True)
+        path = os.path.join(folder, f'{version}{suffix}')
+        if not os.path.exists(path):
+            with open(path + '.tmp', 'wb') as f:
+                f.write(content)
+            os.replace(path + '.tmp', path)
+        return path
+    except OSError as e:
+        logger.warning("Could not store the workbook file: %s", e)
+        return content
+
+
+def uses_csv_engine(source_name):
+    # The per-sheet CSV exports are only read for the source '' (one workbook, CSV_URL_TEMPLATE)
+    return INGEST_ENGINE == 'csv' and bool(CSV_URL_TEMPLATE) and source_name == ''
+
+
+def _csv_sources(entries):
+    # {sheet name: stored CSV export} of the sources read with the 'csv' engine
+    return {
+        _sheet_name(name, sheet): source
+        for name, entry in entries.items() for sheet, source in entry.get('csv_sources', {}).items()
+    }
+
+
+def read_raw_sheets(source, sheet_names):
+    # Raw sheets (no header yet) of a workbook file with the configured engine (XLSX engines only)
+    return ingest.read_xlsx_sheets(source, sheet_names, INGEST_ENGINE, INGEST_WORKERS)
+
+
+def prepared_sheet_size(prepared):
+    # Rough memory use (bytes) of a prepared sheet: the table, plot keys and row position arrays
+    size = int(prepared['df'].memory_usage(index=True, deep=True).sum())
+    filter_index = prepared['filter_index']
+    for key in ('ward_rows', 'sheet_rows', 'ward_sheet_rows'):
+        size += sum(rows.nbytes for rows in filter_index[key].values())
+    if prepared['plot_index'] is not None:
+        size += prepared['plot_index']['keys'].nbytes + prepared['plot_index']['order'].nbytes
+    if prepared['land_use_summary'] is not None:
+        size += sum(int(table.memory_usage(deep=True).sum()) for table in prepared['land_use_summary'].values())
+    return size
+
+
+class PreparedSheetCache:
+    """
+    Prepared sheets by sheet content hash, least recently used first out when over the memory budget.
+    Shared by all sessions and snapshots of the process, so unchanged sheets survive a refresh.
+    """
+    def __init__(self, budget_bytes):
+        self.budget_bytes = budget_bytes
+        self.total_bytes = 0
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def __contains__(self, key):
+        return key in self.entries
+
+    def __len__(self):
+        return len(self.entries)
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            self.entries.move_to_end(key)
+            return entry[0]
+
+    def peek(self, key):
+        # Like get, without making the sheet the most recently used
+        entry = self.entries.get(key)
+        return None if entry is None else entry[0]
+
+    def put(self, key, prepared):
+        size = prepared_sheet_size(prepared)
+        with self.lock:
+            if key in self.entries:
+                self.total_bytes -= self.entries.pop(key)[1]
+            self.entries[key] = (prepared, size)
+            self.total_bytes += size
+            # Always keep the newest sheet, even when it alone is over the budget
+            while self.total_bytes > self.budget_bytes and len(self.entries) > 1:
+                _, (_, old_size) = self.entries.popitem(last=False)
+                self.total_bytes -= old_size
+                metrics.count('sheet_cache_evicted')
+            metrics.set_value('sheet_cache_bytes', self.total_bytes)
+            metrics.set_value('sheet_cache_sheets', len(self.entries))
+            metrics.set_value('sheet_cache_rows', sum(len(entry[0]['df']) for entry in self.entries.values()))
+
+
+class ResultCache:
+    """
+    Row positions of filter and search results by (data version, sheet, ward, sheet no., plot, mode),
+    least recently used first out when over the memory budget or RESULT_CACHE_SIZE entries.
+    Shared by all sessions of the process, see records.cached_filter_rows.
+    """
+    def __init__(self, budget_bytes, max_entries=RESULT_CACHE_SIZE):
+        self.budget_bytes = budget_bytes
+        self.max_entries = max_entries
+        self.total_bytes = 0
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.entries)
+
+    def get(self, key):
+        with self.lock:
+            rows = self.entries.get(key)
+            if rows is not None:
+                self.entries.move_to_end(key)
+            return rows
+
+    def put(self, key, rows):
+        # Results are shared, nobody may change them
+        rows.flags.writeable = False
+        with self.lock:
+            if key in self.entries:
+                self.total_bytes -= self.entries.pop(key).nbytes
+            self.entries[key] = rows
+            self.total_bytes += rows.nbytes
+            # Always keep the newest result
+            while len(self.entries) > 1 and (
+                self.total_bytes > self.budget_bytes or len(self.entries) > self.max_entries
+            ):
+                _, old_rows = self.entries.popitem(last=False)
+                self.total_bytes -= old_rows.nbytes
+            metrics.set_value('result_cache_bytes', self.total_bytes)
+            metrics.set_value('result_cache_entries', len(self.entries))
+
+
+class LazyWorkbook(Mapping):
+    """
+    Sheet name -> prepared sheet. Only the sheet names are known up front: a sheet is prepared
+    the first time it is asked for and then kept in the shared PreparedSheetCache.
+    Looks in the cache first, then in the Arrow file saved for the same sheet content,
+    and only then reads the sheet from its workbook.
+    `sources` are the workbook files (paths, or the bytes) by source name; sheets of a named
+    source are called "<source>/<sheet>", those of the source '' keep their names.
+    `csv_sources` are the CSV exports (paths, or the bytes) downloaded with the workbook for the
+    'csv' engine, by sheet name; those sheets are read from them instead of the workbook.
+    With read_only (shared mode workers) nothing is written to the folder.
+    """
+    def __init__(self, sheet_versions, sources, cache, folder=SNAPSHOT_DIR, read_only=False, csv_sources=None):
+        self.sheet_versions = sheet_versions
+        self.sources = sources
+        self.csv_sources = csv_sources or {}
+        self.cache = cache
+        self.folder = folder
+        self.read_only = read_only
+        self.load_lock = threading.Lock()
+
+    def __getitem__(self, name):
+        return self.load([name])[name]
+
+    def __iter__(self):
+        return iter(self.sheet_versions)
+
+    def __len__(self):
+        return len(self.sheet_versions)
+
+    def _source_of(self, name):
+        # (source name, name in its workbook) of a sheet
+        if '' in self.sources:
+            return '', name
+        source_name, _, sheet = name.partition('/')
+        return source_name, sheet
+
+    def _read_raw(self, sheet_names):
+        # Raw sheets, from their stored CSV export or else workbook by workbook
+        raw_sheets = {name: ingest.read_csv_sheet(self.csv_sources[name]) for name in sheet_names if name in self.csv_sources}
+        by_source = {}
+        for name in sheet_names:
+            if name not in raw_sheets:
+                source_name, sheet = self._source_of(name)
+                by_source.setdefault(source_name, {})[sheet] = name
+        for source_name, names in by_source.items():
+            read = read_raw_sheets(self.sources[source_name], list(names))
+            raw_sheets.update((names[sheet], raw_df) for sheet, raw_df in read.items())
+        return raw_sheets
+
+    def _arrow_path(self, name):
+        return os.path.join(self.folder, sheet_file(self.sheet_versions[name])) if self.folder else None
+
+    def load(self, sheet_names):
+        """
+        Prepared sheets for `sheet_names`; the missing ones are read from the workbook together.
+        """
+        found = {}
+        for name in sheet_names:
+            prepared = self.cache.get(self.sheet_versions[name])
+            if prepared is not None:
+                found[name] = prepared
+
+        missing = [name for name in sheet_names if name not in found]
+        metrics.count('sheet_cache_hit', len(found))
+        metrics.count('sheet_cache_miss', len(missing))
+        if missing:
+            # One reader at a time, so two sessions opening the same sheet do not both parse it
+            with self.load_lock:
+                found.update(self._load_missing(missing))
+        # In the order asked for, whatever was cached
+        return {name: found[name] for name in sheet_names}
+
+    def _save(self, prepared, name):
+        if self.folder and not self.read_only:
+            try:
+                with metrics.timer('save_sheet_file'):
+                    save_prepared_sheet(prepared, self._arrow_path(name))
+            except Exception as e:
+                logger.warning("Could not save %s: %s", self._arrow_path(name), e)
+
+    def _load_missing(self, sheet_names):
+        found = {}
+        to_read = []
+        for name in sheet_names:
+            prepared = self.cache.get(self.sheet_versions[name])
+            if prepared is None and self.folder and os.path.exists(self._arrow_path(name)):
+                try:
+                    with metrics.timer('load_sheet_file'):
+                        prepared = load_prepared_sheet(self._arrow_path(name))
+                    # Files saved before the indexes were: save them with their indexes once
+                    if not os.path.exists(_index_path(self._arrow_path(name))):
+                        self._save(prepared, name)
+                except Exception as e:
+                    logger.warning("Could not read %s: %s", self._arrow_path(name), e)
+            if prepared is None:
+                to_read.append(name)
+            else:
+                self.cache.put(self.sheet_versions[name], prepared)
+                found[name] = prepared
+
+        # A few sheets at a time, so raw and prepared copies of every sheet are never held together
+        batch_size = max(1, INGEST_WORKERS)
+        for i in range(0, len(to_read), batch_size):
+            with metrics.timer('parse_sheets'):
+                raw_sheets = self._read_raw(to_read[i:i + batch_size])
+            for name, raw_df in raw_sheets.items():
+                prepared = records.prepare_sheet(raw_df)
+                self._save(prepared, name)
+                # Use the saved file from now on: its memory is shared with other processes
+                if self.folder and not self.read_only and os.path.exists(self._arrow_path(name)):
+                    with metrics.timer('load_sheet_file'):
+                        prepared = load_prepared_sheet(self._arrow_path(name))
+                self.cache.put(self.sheet_versions[name], prepared)
+                found[name] = prepared
+        return found
+
+    def structure_confidence(self):
+        """
+        How sure the column detection was (records.detect_structure's confidence) for every sheet
+        prepared so far, one dict per sheet; sheets not read yet are left out, not read.
+        """
+        rows = []
+        for name, version in self.sheet_versions.items():
+            prepared = self.cache.peek(version)
+            if prepared is not None and prepared.get('confidence'):
+                rows.append(dict(sheet=name, **prepared['confidence']))
+        return rows
+
+    def global_plot_index(self, sheet_names):
+        """
+        The cross-sheet plot index of `sheet_names` (records.build_global_plot_index). Read from its file
+        when one was saved for the same sheet contents, else built from the sheets and saved.
+        """
+        path = os.path.join(self.folder, global_index_file(self.sheet_versions, sheet_names)) if self.folder else None
+        if path and os.path.exists(path):
+            try:
+                with metrics.timer('load_global_index'):
+                    return load_global_plot_index(path)
+            except Exception as e:
+                logger.warning("Could not read %s: %s", path, e)
+        sheets = self.load(sheet_names)
+        with metrics.timer('build_global_index'):
+            index = records.build_global_plot_index(sheets)
+        if path and not self.read_only:
+            try:
+                save_global_plot_index(index, path)
+            except Exception as e:
+                logger.warning("Could not save %s: %s", path, e)
+        return index
+
+
+def data_sheet_names(sheets):
+    # Sheets to search: all but the first of every workbook (its cover page), unless it is the only one
+    workbooks = {}
+    for name in sheets:
+        workbooks.setdefault(name.partition('/')[0] if '/' in name else '', []).append(name)
+    return [name for names in workbooks.values() for name in (names[1:] if len(names) > 1 else names)]
+
+
+def sheet_file(sheet_version):
+    # File name of a prepared sheet, it changes with the sheet's contents
+    return f'{sheet_version}.sheet{SHEET_FILE_VERSION}.arrow'
+
+
+def global_index_file(sheet_versions, sheet_names):
+    # File name of the cross-sheet index of these sheets, it changes with any of their contents
+    key = '\n'.join(f'{name}\t{sheet_versions[name]}' for name in sheet_names)
+    return f"{hashlib.sha1(key.encode()).hexdigest()}.global{INDEX_VERSION}.arrow"
+
+
+def _arrow_column(series):
+    # Sheets often mix numbers and text in one column (123 and "123/4"); Arrow needs one type,
+    # so such columns are stored as text, which is also how the table shows them
+    try:
+        array = pa.array(series, from_pandas=True)
+    except (pa.ArrowInvalid, pa.ArrowTypeError):
+        array = pa.array(series.astype(str).where(series.notna()), from_pandas=True)
+    # pandas text columns are large_string, stored as such they load without a copy
+    return array.cast(pa.large_string()) if pa.types.is_string(array.type) else array
+
+
+def _write_table(table, path, meta):
+    # One uncompressed record batch (memory-mappable, one piece per column), replaced atomically
+    table = table.replace_schema_metadata({'land_record': json.dumps(meta, ensure_ascii=False)})
+    feather.write_feather(table, path + '.tmp', compression='uncompressed', chunksize=max(1, table.num_rows))
+    os.replace(path + '.tmp', path)
+
+
+def _read_table(path):
+    table = feather.read_table(path, memory_map=True)
+    return table, json.loads(table.schema.metadata[b'land_record'])
+
+
+def _write_arrays(path, arrays, meta):
+    # Arrays of any length in one file: a one-row list column per array
+    _write_table(pa.table({
+        name: pa.ListArray.from_arrays(
+            pa.array([0, len(array)], type=pa.int32()),
+            array if isinstance(array, pa.Array) else pa.array(array)
+        )
+        for name, array in arrays.items()
+    }), path, meta)
+
+
+def _read_arrays(path):
+    # The arrays of _write_arrays, as Arrow arrays over the memory-mapped file
+    table, meta = _read_table(path)
+    return {name: table.column(name).chunk(0).values for name in table.column_names}, meta
+
+
+def _mapped_column(column):
+    """
+    A pandas array over an Arrow column of a memory-mapped file. Text, whole numbers and the codes
+    of categoricals are used in place, not copied, so processes reading the same file share one
+    copy of it in memory; only the masks of blank cells are their own.
+    """
+    if column.num_chunks != 1:
+        # Empty, or an older file written in several pieces
+        return column.to_pandas()
+    array = column.chunk(0)
+    if pa.types.is_string(array.type) or pa.types.is_large_string(array.type):
+        return pd.arrays.ArrowStringArray(
+            pa.chunked_array([array.cast(pa.large_string())]),
+            dtype=pd.StringDtype('pyarrow', na_value=np.nan)
+        )
+    if pa.types.is_dictionary(array.type):
+        codes = array.indices.fill_null(-1) if array.null_count else array.indices
+        categories = _mapped_column(pa.chunked_array([array.dictionary]))
+        return pd.Categorical.from_codes(codes.to_numpy(), categories=categories)
+    if pa.types.is_integer(array.type):
+        # Nullable integers keep whole numbers as 3, not 3.0, next to blank cells
+        values = np.frombuffer(
+            array.buffers()[1],
+            dtype=array.type.to_pandas_dtype(),
+            count=len(array),
+            offset=array.offset * array.type.byte_width
+        )
+        return pd.arrays.IntegerArray(values, array.is_null().to_numpy(zero_copy_only=False))
+    return array.to_pandas()
+
+
+def _index_path(path):
+    # <sheet file>.arrow -> <sheet file>.index<INDEX_VERSION>.arrow
+    return path[:-len('.arrow')] + f'.index{INDEX_VERSION}.arrow'
+
+
+def save_prepared_sheet(prepared, path):
+    """
+    Write a prepared sheet to an uncompressed (memory-mappable) Arrow file, and its filter
+    and plot indexes to a second one next to it (see _index_path).
+    Column names can repeat, so the file uses positions and keeps the names in its metadata.
+    """
+    arrays = {}
+    bounds = {}
+    for key in ('ward_rows', 'sheet_rows', 'ward_sheet_rows'):
+        arrays[key], bounds[key] = records.pack_groups(prepared['filter_index'][key])
+    if prepared['plot_index'] is not None:
+        arrays['plot_keys'] = prepared['plot_index']['keys']
+        arrays['plot_order'] = prepared['plot_index']['order']
+    _write_arrays(_index_path(path), arrays, bounds)
+
+    df = prepared['df']
+    table = pa.table({str(i): _arrow_column(df.iloc[:, i]) for i in range(df.shape[1])})
+    _write_table(table, path, {
+        'columns': df.columns.tolist(),
+        'col_mapping': prepared['col_mapping'],
+        'confidence': prepared.get('confidence')
+    })
+
+
+def load_prepared_sheet(path):
+    """
+    Read a prepared sheet written by save_prepared_sheet. The table and indexes stay in the
+    memory-mapped files (see _mapped_column); indexes missing from an older file are rebuilt.
+    """
+    table, meta = _read_table(path)
+    df = pd.DataFrame({i: _mapped_column(column) for i, column in enumerate(table.columns)}, copy=False)
+    df.columns = meta['columns']
+    col_mapping = meta['col_mapping']
+    confidence = meta.get('confidence')
+    if not os.path.exists(_index_path(path)):
+        return records.build_prepared_sheet(df, col_mapping, confidence=confidence)
+
+    arrays, bounds = _read_arrays(_index_path(path))
+    groups = {key: records.unpack_groups(arrays[key].to_numpy(), bounds[key]) for key in bounds}
+    plot_index = None
+    if 'plot_keys' in arrays:
+        plot_index = records.plot_index_from_keys(arrays['plot_keys'], arrays['plot_order'].to_numpy())
+    return records.build_prepared_sheet(df, col_mapping, records.filter_index_from_groups(**groups), plot_index, confidence)
+
+
+def save_global_plot_index(global_index, path):
+    # Write a cross-sheet plot index (records.build_global_plot_index) to a memory-mappable file
+    arrays = {
+        'keys': global_index['keys'],
+        'order': global_index['order'],
+        'sheet': global_index['sheet'],
+        'row': global_index['row']
+    }
+    _write_arrays(path, arrays, {'sheets': global_index['sheet_names']})
+
+
+def load_global_plot_index(path):
+    # A cross-sheet plot index saved by save_global_plot_index, over the memory-mapped file
+    arrays, meta = _read_arrays(path)
+    index = records.plot_index_from_keys(arrays['keys'], arrays['order'].to_numpy())
+    index['sheet'] = arrays['sheet'].to_numpy()
+    index['sheet_names'] = meta['sheets']
+    index['row'] = arrays['row'].to_numpy()
+    return index
+
+
+def save_snapshot(state, path=SNAPSHOT_DIR):
+    """
+    Write manifest.json next to the stored workbook file and the Arrow files of prepared sheets,
+    and remove the files of older workbooks. The manifest is replaced atomically.
+    """
+    snapshot = state['snapshot']
+    workbook = snapshot['sheets']
+    files = list(workbook.sources.values()) + list(workbook.csv_sources.values())
+    if not path or not all(isinstance(source, str) for source in files):
+        return
+
+    manifest = {
+        'version': snapshot['version'],
+        'saved_at': time.time(),
+        'refresh_duration': state.get('refresh_duration'),
+        'sources': [
+            {
+                'name': name,
+                'url': entry['url'],
+                'version': entry['version'],
+                'etag': entry.get('etag'),
+                'last_modified': entry.get('last_modified'),
+                'workbook_file': os.path.basename(workbook.sources[name]),
+                'csv_files': {sheet: os.path.basename(source) for sheet, source in entry.get('csv_sources', {}).items()}
+            }
+            for name, entry in state['sources'].items()
+        ],
+        'sheets': [{'name': name, 'sheet_version': h} for name, h in snapshot['sheet_versions'].items()]
+    }
+    manifest_path = os.path.join(path, 'manifest.json')
+    # Workers of the shared mode may still be reading the previous snapshot, keep its files too
+    used = _manifest_files(manifest)
+    try:
+        with open(manifest_path, encoding='utf-8') as f:
+            used |= _manifest_files(json.load(f))
+    except (OSError, ValueError, KeyError):
+        pass
+
+    with open(manifest_path + '.tmp', 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, ensure_ascii=False)
+    os.replace(manifest_path + '.tmp', manifest_path)
+
+    # Drop files neither manifest points to
+    for file_name in os.listdir(path):
+        if file_name.endswith(('.arrow', '.xlsx', '.csv')) and file_name not in used:
+            try:
+                os.remove(os.path.join(path, file_name))
+            except OSError as e:
+                logger.warning("Could not remove %s: %s", file_name, e)
+
+
+def _manifest_sources(manifest):
+    # The sources of a manifest; older ones have a single workbook and its validators at the top
+    if 'sources' in manifest:
+        return manifest['sources']
+    return [{
+        'name': '',
+        'url': None,
+        'version': manifest['version'],
+        'etag': manifest.get('etag'),
+        'last_modified': manifest.get('last_modified'),
+        'workbook_file': manifest['workbook_file']
+    }]
+
+
+def _manifest_files(manifest):
+    # Names of the files a snapshot manifest uses
+    sheet_versions = {sheet['name']: sheet['sheet_version'] for sheet in manifest['sheets']}
+    files = {source['workbook_file'] for source in _manifest_sources(manifest)}
+    files |= {name for source in _manifest_sources(manifest) for name in source.get('csv_files', {}).values()}
+    files.add(global_index_file(sheet_versions, data_sheet_names(sheet_versions)))
+    for h in sheet_versions.values():
+        files |= {sheet_file(h), _index_path(sheet_file(h))}
+    return files
+
+
+def load_snapshot(state, path=SNAPSHOT_DIR, read_only=False):
+    """
+    Serve the workbook saved by save_snapshot. Only the manifest is read here, sheets are
+    loaded (from their Arrow files when present) as they are opened.
+    Returns True if a snapshot was found. It is marked as stale so it gets revalidated.
+    """
+    manifest_path = os.path.join(path, 'manifest.json') if path else None
+    if not manifest_path or not os.path.exists(manifest_path):
+        return False
+    with open(manifest_path, encoding='utf-8') as f:
+        manifest = json.load(f)
+    sources = {}
+    for source in _manifest_sources(manifest):
+        workbook_path = os.path.join(path, source['workbook_file'])
+        if not os.path.exists(workbook_path):
+            return False
+        csv_sources = {sheet: os.path.join(path, file_name) for sheet, file_name in source.get('csv_files', {}).items()}
+        if not all(os.path.exists(csv_path) for csv_path in csv_sources.values()):
+            return False
+        sources[source['name']] = dict(source, source=workbook_path, csv_sources=csv_sources)
+
+    sheet_versions = {sheet['name']: sheet['sheet_version'] for sheet in manifest['sheets']}
+    for name, entry in sources.items():
+        prefix = f'{name}/' if name else ''
+        entry['sheet_versions'] = {
+            sheet[len(prefix):]: h for sheet, h in sheet_versions.items() if sheet.startswith(prefix)
+        }
+    metrics.set_value('snapshot_sheets', len(sheet_versions))
+    state['snapshot'] = {
+        'sheets': LazyWorkbook(
+            sheet_versions, {name: entry['source'] for name, entry in sources.items()}, state['sheet_cache'],
+            path, read_only, _csv_sources(sources)
+        ),
+        'version': manifest['version'],
+        'sheet_versions': sheet_versions,
+        'sources': {name: entry['version'] for name, entry in sources.items()}
+    }
+    state.update(
+        sources=sources,
+        journal=changes.read_journal(journal_path(path), JOURNAL_SIZE),
+        refreshed_at=manifest.get('saved_at'),
+        refresh_duration=manifest.get('refresh_duration'),
+        checked_at=0
+    )
+    return True
+
+
+def publish_snapshot(state, sources=SOURCES, folder=SNAPSHOT_DIR):
+    """
+    Shared mode loader (loader.py): refresh the workbook, save every sheet with its indexes and
+    the cross-sheet plot index to `folder`, then write the manifest the workers follow.
+    Returns True if the data changed.
+    """
+    started = time.time()
+    with metrics.timer('publish'):
+        previous = state['snapshot']
+        changed = refresh_workbook(state, sources, folder=folder)
+        if changed:
+            try:
+                record_changes(state, previous, folder)
+            except Exception as e:
+                logger.warning("Could not compare the data with the previous version: %s", e)
+        workbook = state['snapshot']['sheets']
+        # One at a time, every sheet is saved as it is prepared; unchanged ones are already there
+        for name in workbook:
+            workbook.load([name])
+        workbook.global_plot_index(data_sheet_names(workbook))
+    state.update(last_error=source_error_text(state), refreshed_at=time.time(), refresh_duration=time.time() - started)
+    # Written on every check, so workers can tell how recent the data is
+    save_snapshot(state, folder)
+    return changed
+
+
+def follow_shared_snapshot(state, path=SNAPSHOT_DIR):
+    """
+    Shared mode worker: serve the snapshot loader.py last published in `path`, and switch to a
+    newer one within SHARED_POLL seconds. Nothing is downloaded or parsed here; the sheets are
+    memory-mapped from the loader's files, so all workers share one copy of them.
+    """
+    with state['lock']:
+        if state['snapshot'] is not None and time.time() - state['checked_at'] < SHARED_POLL:
+            return state['snapshot']
+        state['checked_at'] = time.time()
+        try:
+            with open(os.path.join(path, 'manifest.json'), encoding='utf-8') as f:
+                manifest = json.load(f)
+            if state['snapshot'] is None or state['snapshot']['version'] != manifest['version']:
+                if not load_snapshot(state, path, read_only=True):
+                    # The manifest names files that are not there (yet); keep serving what we have
+                    state['last_error'] = f"The shared snapshot in {path} is not published yet (is loader.py running?)"
+                    return state['snapshot']
+            state.update(
+                refreshed_at=manifest.get('saved_at'),
+                refresh_duration=manifest.get('refresh_duration') or 0.0,
+                checked_at=time.time(),
+                last_error=None
+            )
+        except FileNotFoundError:
+            state['last_error'] = f"No shared snapshot in {path} yet (is loader.py running?)"
+        except Exception as e:
+            state['last_error'] = str(e)
+    return state['snapshot']
+
+
+def journal_path(folder=SNAPSHOT_DIR):
+    # The change journal (record_changes) of a snapshot folder
+    return os.path.join(folder, 'journal.jsonl') if folder else None
+
+
+def record_changes(state, previous, folder=SNAPSHOT_DIR):
+    """
+    Compare the snapshot in `state` with the `previous` one and journal the records that were
+    added, removed or changed (changes.py): appended to journal.jsonl in `folder` and kept in
+    state['journal']. Only sheets whose hash changed are compared, so an edit to one VDC reads
+    that VDC in both versions and nothing else. Returns the new entries.
+    """
+    snapshot = state['snapshot']
+    if previous is None or snapshot is previous:
+        return []
+    old_names = data_sheet_names(previous['sheets'])
+    new_names = data_sheet_names(snapshot['sheets'])
+    at = time.time()
+    entries = []
+    with metrics.timer('diff_snapshots'):
+        for name in new_names:
+            if name not in previous['sheet_versions']:
+                entries.append(changes.sheet_entry(name, 'sheet_added', at, snapshot['version']))
+            elif previous['sheet_versions'][name] != snapshot['sheet_versions'][name]:
+                old, new = previous['sheets'][name], snapshot['sheets'][name]
+                diff = changes.diff_sheets(old, new)
+                entries += changes.journal_entries(name, old, new, diff, at, snapshot['version'], JOURNAL_SHEET_LIMIT)
+                for change in ('added', 'removed'):
+                    metrics.count(f'records_{change}', len(diff[change]))
+                metrics.count('records_changed', len(diff['changed'][0]))
+        entries += [
+            changes.sheet_entry(name, 'sheet_removed', at, snapshot['version'])
+            for name in old_names if name not in snapshot['sheet_versions']
+        ]
+    if entries:
+        logger.info("Journaled %d changes", len(entries))
+        if folder:
+            changes.append_journal(journal_path(folder), entries)
+        # Swapped in one assignment, like the snapshot, for sessions reading it meanwhile
+        state['journal'] = (state['journal'] + entries)[-JOURNAL_SIZE:]
+    return entries
+
+
+def recent_changes(journal, sheet=None, since=None, limit=None):
+    # Journal entries newest first, optionally of one sheet and after a time (seconds since the epoch)
+    entries = [
+        entry for entry in reversed(journal)
+        if (sheet is None or entry['sheet'] == sheet) and (since is None or entry['at'] > since)
+    ]
+    return entries[:limit]
+
+
+def new_workbook_state():
+    # Everything the loader keeps between refreshes
+    return {
+        'snapshot': None,
+        'sheet_cache': PreparedSheetCache(SHEET_CACHE_MB * 1024 * 1024),
+        'result_cache': ResultCache(RESULT_CACHE_MB * 1024 * 1024),
+        # Per source: URL, file hash, ETag / Last-Modified, workbook file and sheet hashes
+        'sources': {},
+        'source_errors': {},
+        'http': make_http_session(),
+        # The last JOURNAL_SIZE journal entries (record_changes), oldest first
+        'journal': [],
+        'checked_at': 0,
+        'refreshed_at': None,
+        'refresh_duration': None,
+        'last_error': None,
+        'refreshing': False,
+        'lock': threading.Lock(),
+        'first_load_lock': threading.Lock()
+    }
+
+
+def source_error_text(state):
+    # The sources that could not be downloaded in the last refresh and why, or None
+    errors = state.get('source_errors') or {}
+    return '; '.join(f"{name}: {error}" if name else error for name, error in errors.items()) or None
+
+
+def run_refresh(state, sources=SOURCES):
+    """
+    Refresh the snapshot and record how it went. Runs in the background thread.
+    """
+    started = time.time()
+    try:
+        with metrics.timer('refresh'):
+            previous = state['snapshot']
+            if refresh_workbook(state, sources):
+                try:
+                    record_changes(state, previous)
+                except Exception as e:
+                    logger.warning("Could not compare the data with the previous version: %s", e)
+                try:
+                    save_snapshot(state)
+                except Exception as e:
+                    logger.warning("Could not save the data snapshot: %s", e)
+        state['last_error'] = source_error_text(state)
+        state['refreshed_at'] = time.time()
+    except Exception as e:
+        metrics.count('refresh_failed')
+        state['last_error'] = str(e)
+    finally:
+        state['refresh_duration'] = time.time() - started
+        state['checked_at'] = time.time()
+        state['refreshing'] = False
+    # One line per refresh (every REFRESH_TTL at most), to follow the numbers in the server log
+    logger.info("Metrics: %s", metrics.log_line())
+
+
+def start_refresh(state, force=False, sources=SOURCES):
+    """
+    Revalidate the snapshot in a background thread if it is older than REFRESH_TTL (or force).
+    The old snapshot keeps being served until the new one is swapped in. Returns True if started.
+    """
+    if SHARED_MODE == 'worker':
+        # Only the loader refreshes; look for its newest snapshot on the next request instead
+        state['checked_at'] = 0
+        return False
+
+    with state['lock']:
+        is_stale = time.time() - state['checked_at'] > REFRESH_TTL
+        if state['refreshing'] or not (force or is_stale):
+            return False
+        state['refreshing'] = True
+
+    try:
+        threading.Thread(target=run_refresh, args=(state, sources), name='workbook-refresh', daemon=True).start()
+    except RuntimeError:
+        # No threads here (e.g. the browser build), refresh inline instead
+        run_refresh(state, sources)
+    return True
+
+
+def get_snapshot(state):
+    """
+    The snapshot to serve (dict with 'sheets', 'version', 'sheet_versions'), or None if there is
+    no data at all; state['last_error'] then says why. Starts a background revalidation when stale.
+    """
+    if SHARED_MODE == 'worker':
+        return follow_shared_snapshot(state)
+
+    if state['snapshot'] is None:
+        # Nothing to serve yet, so this first load has to be waited for (once, not per session)
+        with state['first_load_lock']:
+            if state['snapshot'] is None:
+                # A snapshot on disk starts us up in no time, it is revalidated in the background below
+                try:
+                    load_snapshot(state)
+                except Exception as e:
+                    logger.warning("Could not load the data snapshot: %s", e)
+            if state['snapshot'] is None:
+                with state['lock']:
+                    state['refreshing'] = True
+                run_refresh(state)
+        if state['snapshot'] is None:
+            return None
+
+    start_refresh(state)
+    return state['snapshot']
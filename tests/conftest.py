@@ -0,0 +1,29 @@
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+sys.path.insert(0, ROOT)
+
+import records  # noqa: E402
+from helpers import make_workbook, serve  # noqa: E402
+
+
+@pytest.fixture(autouse=True)
+def fresh_structure_cache():
+    # Layouts remembered by one test must not answer for the next one
+    records._structure_cache.clear()
+    yield
+    records._structure_cache.clear()
+
+
+@pytest.fixture
+def workbook_server(tmp_path):
+    # A made-up workbook (and its per-sheet CSVs) on a local HTTP server: (folder, sheet names, URL)
+    folder = tmp_path / 'server'
+    folder.mkdir()
+    names = make_workbook(str(folder), 2, 300, seed=3)
+    server = serve(str(folder))
+    yield folder, names, f'http://127.0.0.1:{server.server_address[1]}'
+    server.shutdown()
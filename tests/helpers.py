@@ -0,0 +1,121 @@
+"""
+Made-up land record sheets and a local HTTP server for the tests, so they need no internet and
+no benchmark scripts. Sheets look like the real ones: title rows above a Devanagari header row
+(spelled differently from sheet to sheet), blank cells, kittas like 12/3 and a cover sheet first.
+"""
+import csv
+import functools
+import http.server
+import os
+import random
+import threading
+
+import numpy as np
+import openpyxl
+import pandas as pd
+
+LAND_USES = ['आवासीय', 'कृषि', 'व्यावसायिक', 'वन', 'सार्वजनिक']
+# Spellings of the same header seen in different sheets
+HEADERS = {
+    'serial': ['सि.नं.', 'सि.नं', 'क्र.सं.'],
+    'vdc': ['साविक गा.वि.स.', 'साविक गा.वि.स'],
+    'ward': ['वडा नं.', 'वडा नं', 'वडा'],
+    'sheet_no': ['सिट नं.', 'सिट नं', 'नक्सा सिट नं.'],
+    'plot': ['कित्ता नं.', 'कित्ता नं', 'कित्ता'],
+    'area': ['क्षेत्रफल (व.मि.)'],
+    'land_use': ['भूउपयोग क्षेत्र', 'भूउपयोग']
+}
+
+
+def sheet_rows(rng, name, size):
+    """
+    The rows of one VDC sheet: a title and up to two more rows, the header row, then `size`
+    records (some without a kitta or land use, half of the sheets with a remarks column).
+    """
+    extra = [['जिल्ला: काठमाडौं', '', f'गा.वि.स.: {name}'], []]
+    rows = [['भू-उपयोग क्षेत्र वर्गीकरण विवरण']] + rng.sample(extra, rng.randint(0, len(extra)))
+    header = [rng.choice(HEADERS[key]) for key in ('serial', 'vdc', 'ward', 'sheet_no', 'plot', 'area', 'land_use')]
+    with_remarks = rng.random() < 0.5
+    rows.append(header + ['कैफियत'] * with_remarks)
+    for r in range(size):
+        plot = rng.randint(1, 9999)
+        row = [
+            r + 1,
+            name,
+            rng.randint(1, 9),
+            rng.randint(1, 40),
+            plot if rng.random() < 0.8 else f'{plot}/{rng.randint(1, 9)}',
+            round(rng.uniform(20, 5000), 2),
+            rng.choice(LAND_USES)
+        ]
+        if rng.random() < 0.01:
+            row[4] = None
+        if rng.random() < 0.05:
+            row[6] = None
+        if with_remarks:
+            row.append(rng.choice(['', '', 'सडक', 'कुलो']) or None)
+        rows.append(row)
+    return rows
+
+
+def raw_frame(rows):
+    # Rows as a raw sheet (like ingest reads it): no header, short rows padded with blanks
+    width = max([len(row) for row in rows] + [1])
+    return pd.DataFrame([row + [np.nan] * (width - len(row)) for row in rows], dtype=object)
+
+
+def make_workbook(folder, sheets, rows, seed=42):
+    """
+    Write workbook.xlsx (a cover sheet and `sheets` VDC sheets with `rows` records in all) and
+    the CSV export of every VDC sheet into `folder`. Returns the sheet names, cover sheet first.
+    """
+    rng = random.Random(seed)
+    workbook = openpyxl.Workbook(write_only=True)
+    workbook.create_sheet('Cover').append(['भू-उपयोग क्षेत्र वर्गीकरण'])
+    names = [f'VDC{s + 1:02d}' for s in range(sheets)]
+    sizes = [rows // sheets + (s < rows % sheets) for s in range(sheets)]
+    for name, size in zip(names, sizes):
+        data = sheet_rows(rng, name, size)
+        worksheet = workbook.create_sheet(name)
+        for row in data:
+            worksheet.append(row)
+        # Like Google's CSV export, every row has the same number of fields
+        width = max(len(row) for row in data)
+        with open(os.path.join(folder, f'{name}.csv'), 'w', newline='', encoding='utf-8') as f:
+            csv.writer(f).writerows(
+                ['' if value is None else value for value in row] + [''] * (width - len(row)) for row in data
+            )
+    workbook.save(os.path.join(folder, 'workbook.xlsx'))
+    return ['Cover'] + names
+
+
+class QuietHandler(http.server.SimpleHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+
+def flaky_handler():
+    # A file handler that answers the first request for each file with 503
+    failed = set()
+    lock = threading.Lock()
+
+    class FlakyHandler(QuietHandler):
+        def do_GET(self):
+            with lock:
+                fail = self.path not in failed
+                failed.add(self.path)
+            if fail:
+                self.send_error(503)
+                return
+            super().do_GET()
+
+    return FlakyHandler
+
+
+def serve(folder, handler=QuietHandler):
+    """
+    Serve the files in `folder` over HTTP on a free local port, in a background thread.
+    """
+    server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), functools.partial(handler, directory=folder))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
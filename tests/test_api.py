@@ -0,0 +1,139 @@
+import http.client
+import json
+import os
+import threading
+import time
+
+import pytest
+
+import api
+import refresh
+from helpers import make_workbook
+
+
+@pytest.fixture
+def api_server(workbook_server):
+    # api.py on a free port, answering from a refreshed copy of the made-up workbook
+    folder, names, base_url = workbook_server
+    sources = {'': base_url + '/workbook.xlsx'}
+    state = refresh.new_workbook_state()
+    assert refresh.refresh_workbook(state, sources, folder=None)
+    # Fresh, so no request starts a background refresh of the real data
+    state['checked_at'] = time.time()
+    server = api.make_server(port=0, state=state)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    connection = http.client.HTTPConnection('127.0.0.1', server.server_address[1], timeout=30)
+    yield connection, state, folder, sources
+    connection.close()
+    server.shutdown()
+    server.server_close()
+
+
+def request(connection, method, path, body=None):
+    if isinstance(body, (dict, list)):
+        body = json.dumps(body)
+    connection.request(method, path, body)
+    response = connection.getresponse()
+    return response.status, json.loads(response.read())
+
+
+def first_kitta(state, sheet='VDC01'):
+    prepared = state['snapshot']['sheets'][sheet]
+    return str(prepared['df'][prepared['col_mapping']['plot']].dropna().iloc[0])
+
+
+def test_query_finds_a_kitta(api_server):
+    connection, state, _, _ = api_server
+    kitta = first_kitta(state)
+    status, answer = request(connection, 'GET', f'/query?sheet=VDC01&plot={kitta}')
+    assert status == 200
+    assert answer['version'] == state['snapshot']['version']
+    assert answer['total'] >= 1
+    match = answer['matches'][0]
+    assert match['sheet'] == 'VDC01'
+    plot_column = match['columns'].index(state['snapshot']['sheets']['VDC01']['col_mapping']['plot'])
+    assert all(row[plot_column] == kitta for row in match['rows'])
+
+    # Every sheet, when no sheet is given
+    status, answer = request(connection, 'GET', f'/query?plot={kitta}')
+    assert status == 200 and answer['total'] >= 1
+
+    status, answer = request(connection, 'GET', '/query?sheet=VDC01&limit=x')
+    assert status == 400 and 'limit' in answer['error']
+
+
+def test_batch_with_wrong_field_types_answers_every_query(api_server):
+    connection, state, _, _ = api_server
+    kitta = first_kitta(state)
+    queries = [
+        {'sheet': ['VDC01']},
+        {'sheet': {'a': 1}},
+        {'plot': [kitta]},
+        {'plot': True},
+        {'sheet': 'VDC01', 'mode': 1},
+        {'sheet': 'VDC01', 'limit': 2.5},
+        {'sheet': 'VDC01', 'offset': [1]},
+        'VDC01',
+        {'sheet': 'VDC01', 'plot': kitta, 'limit': '1'}
+    ]
+    status, answer = request(connection, 'POST', '/query', {'queries': queries})
+    assert status == 200
+    results = answer['results']
+    assert len(results) == len(queries)
+    assert all('error' in result for result in results[:-1])
+    assert 'sheet must be text' in results[0]['error']
+    assert len(results[-1]['matches'][0]['rows']) == 1
+
+    # The connection is still open for the next request
+    status, answer = request(connection, 'GET', '/sheets')
+    assert status == 200 and answer['sheets'] == ['VDC01', 'VDC02']
+
+
+@pytest.mark.parametrize('body', [
+    b'not json',
+    b'[]',
+    b'{"queries": "VDC01"}',
+    b'{"query": []}',
+    json.dumps({'queries': [{}] * (api.MAX_BATCH + 1)}).encode()
+])
+def test_malformed_bodies_are_refused(api_server, body):
+    connection = api_server[0]
+    status, answer = request(connection, 'POST', '/query', body)
+    assert status == 400
+    assert answer['error']
+
+
+def test_empty_body_and_unknown_paths(api_server):
+    connection = api_server[0]
+    assert request(connection, 'POST', '/query', b'')[0] == 400
+    connection.close()
+    assert request(connection, 'POST', '/other', b'{"queries": []}')[0] == 404
+    # The next request on the same client is not mixed up with the unread body
+    assert request(connection, 'GET', '/other')[0] == 404
+    assert request(connection, 'GET', '/sheets')[0] == 200
+
+
+def test_changes_lists_new_entries(api_server):
+    connection, state, folder, sources = api_server
+    status, answer = request(connection, 'GET', '/changes')
+    assert status == 200 and answer['changes'] == []
+
+    make_workbook(str(folder), 2, 320, seed=4)
+    # Newer than the Last-Modified of the first download, whatever the clock's resolution
+    os.utime(folder / 'workbook.xlsx', (time.time() + 10, time.time() + 10))
+    previous = state['snapshot']
+    assert refresh.refresh_workbook(state, sources, folder=None)
+    entries = refresh.record_changes(state, previous, folder=None)
+    assert entries
+
+    status, answer = request(connection, 'GET', '/changes')
+    assert status == 200
+    assert len(answer['changes']) == len(entries)
+    status, answer = request(connection, 'GET', '/changes?sheet=VDC02&limit=3')
+    assert status == 200
+    assert len(answer['changes']) == 3 and {entry['sheet'] for entry in answer['changes']} == {'VDC02'}
+    status, answer = request(connection, 'GET', f"/changes?since={max(entry['at'] for entry in entries)}")
+    assert status == 200 and answer['changes'] == []
+
+    assert request(connection, 'GET', '/changes?since=yesterday')[0] == 400
+    assert request(connection, 'GET', '/changes?sheet=VDC99')[0] == 400
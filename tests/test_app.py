@@ -0,0 +1,72 @@
+import sys
+
+import pytest
+from streamlit.testing.v1 import AppTest
+
+
+@pytest.fixture(autouse=True)
+def keep_main_module(monkeypatch):
+    # The script runner leaves the test script in sys.modules['__main__'], where spawned
+    # processes (ingest's parallel reads) would run it again
+    monkeypatch.setitem(sys.modules, '__main__', sys.modules['__main__'])
+
+
+def paged_script():
+    # page_bounds alone, for a result of st.session_state['total'] rows
+    import streamlit as st
+
+    import app
+
+    total = st.session_state.get('total', 120)
+    reset_key = st.session_state.get('result', 'first search')
+    st.session_state['bounds'] = app.page_bounds(total, app.TRANSLATIONS['EN'], reset_key)
+
+
+def page_keys(at):
+    return sorted(key for key in at.session_state.keys() if key.startswith('page'))
+
+
+def test_page_bounds_at_the_edges():
+    at = AppTest.from_function(paged_script, default_timeout=60)
+    at.run()
+    assert not at.exception
+    assert at.session_state['bounds'] == (0, 50)
+    assert at.number_input[0].max == 3
+
+    # The last page is a partial one
+    at.number_input[0].set_value(3).run()
+    assert at.session_state['bounds'] == (100, 120)
+    assert at.caption[0].value == 'Showing rows 101–120 of 120 (3 pages)'
+
+    # Another page size starts again at page 1
+    at.selectbox[0].select(100).run()
+    assert at.session_state['bounds'] == (0, 100)
+    assert at.number_input[0].max == 2
+    at.number_input[0].set_value(2).run()
+    assert at.session_state['bounds'] == (100, 120)
+
+    # So does another result, on the same widget
+    at.session_state['result'] = 'second search'
+    at.session_state['total'] = 7
+    at.run()
+    assert at.session_state['bounds'] == (0, 7)
+    assert at.number_input[0].max == 1
+    assert page_keys(at) == ['page', 'page_of']
+
+    at.session_state['result'] = 'nothing found'
+    at.session_state['total'] = 0
+    at.run()
+    assert not at.exception
+    assert at.session_state['bounds'] == (0, 0)
+    assert at.caption[0].value == 'Showing rows 0–0 of 0 (1 pages)'
+
+
+def test_many_searches_keep_one_page_widget():
+    at = AppTest.from_function(paged_script, default_timeout=60)
+    at.run()
+    for i in range(20):
+        at.session_state['result'] = f'search {i}'
+        at.run()
+        at.number_input[0].set_value(2).run()
+    assert not at.exception
+    assert page_keys(at) == ['page', 'page_of']
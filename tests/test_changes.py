@@ -0,0 +1,37 @@
+import pandas as pd
+
+import changes
+import records
+
+
+def prepared(rows, columns):
+    df = pd.DataFrame(rows, columns=columns)
+    col_mapping = {'vdc': None, 'ward': 'वडा', 'sheet_no': 'सिट', 'plot': 'कित्ता', 'land_use': 'भूउपयोग'}
+    return records.build_prepared_sheet(df, col_mapping)
+
+
+def test_repeated_column_names_are_compared_by_position():
+    columns = ['कित्ता', 'वडा', 'सिट', 'भूउपयोग', 'कैफियत', 'कैफियत']
+    old = prepared([['1', 1, 1, 'कृषि', 'a', 'x'], ['2', 1, 1, 'वन', None, None]], columns)
+    new = prepared([['1', 1, 1, 'कृषि', 'a', 'y'], ['2', 1, 1, 'वन', None, None], ['3', 2, 1, 'वन', 'b', None]],
+                   columns)
+
+    diff = changes.diff_sheets(old, new)
+    assert diff['added'].tolist() == [2]
+    assert diff['removed'].tolist() == []
+    assert [rows.tolist() for rows in diff['changed']] == [[0], [0]]
+
+    entries = changes.journal_entries('VDC01', old, new, diff, 0, 'v2')
+    by_change = {entry['change']: entry for entry in entries}
+    assert by_change['changed']['values'] == {'कैफियत (2)': ['x', 'y']}
+    assert by_change['added']['values']['कैफियत'] == 'b'
+    assert by_change['added']['values']['कैफियत (2)'] is None
+    assert by_change['added']['plot'] == '3'
+
+
+def test_reordered_rows_and_number_types_are_not_changes():
+    columns = ['कित्ता', 'वडा', 'सिट', 'भूउपयोग']
+    old = prepared([['1', 1, 1, 'कृषि'], ['2', 1, 2, 'वन']], columns)
+    new = prepared([['2', '1', 2.0, 'वन'], ['1', 1, 1, 'कृषि']], columns)
+    diff = changes.diff_sheets(old, new)
+    assert len(diff['added']) == len(diff['removed']) == len(diff['changed'][0]) == 0
@@ -0,0 +1,41 @@
+import numpy as np
+import pandas as pd
+
+import records
+import refresh
+
+
+def compact(values, categorical=False):
+    return records.compact_column(pd.Series(values, dtype=object), categorical)
+
+
+def test_numbers_keep_their_type():
+    assert compact([1, 2, None]).dtype == 'Int32'
+    areas = compact([815.1, 20, None])
+    assert areas.dtype == float
+    assert areas.iloc[0] == 815.1 and areas.iloc[1] == 20.0 and np.isnan(areas.iloc[2])
+
+
+def test_bools_stay_as_they_are():
+    assert compact([True, False, None]).tolist() == [True, False, None]
+
+
+def test_only_text_mixed_with_numbers_becomes_text():
+    plots = compact([123, '124/1', None])
+    assert plots.tolist()[:2] == ['123', '124/1']
+    assert pd.isna(plots.iloc[2])
+
+
+def test_prepared_sheet_file_keeps_number_types(tmp_path):
+    raw_df = pd.DataFrame([
+        ['वडा नं.', 'कित्ता नं.', 'क्षेत्रफल', 'Checked'],
+        [1, 12, 815.1, True],
+        [2, '13/1', 20.25, False]
+    ], dtype=object)
+    prepared = records.prepare_sheet(raw_df)
+    path = str(tmp_path / 'sheet.arrow')
+    refresh.save_prepared_sheet(prepared, path)
+    df = refresh.load_prepared_sheet(path)['df']
+    assert df['क्षेत्रफल'].tolist() == [815.1, 20.25]
+    assert df['Checked'].tolist() == [True, False]
+    assert df['कित्ता नं.'].tolist() == ['12', '13/1']
@@ -0,0 +1,45 @@
+import io
+
+import numpy as np
+import openpyxl
+import pandas as pd
+
+import export
+import records
+
+
+def sheets():
+    return {
+        'VDC01': {'df': pd.DataFrame([['1', 'a', 'b'], ['2', None, 'c']], columns=['कित्ता', 'कैफियत', 'कैफियत'])},
+        'VDC02': {'df': pd.DataFrame([['3', 5.5]], columns=['कित्ता', 'क्षेत्रफल'])}
+    }
+
+
+def test_repeated_column_names_are_exported_by_position():
+    result = export.hits_export(sheets(), [('VDC01', [1, 0]), ('VDC02', [0])])
+    csv = b''.join(export.export_blocks(result, 'csv')).decode('utf-8-sig')
+    assert csv.splitlines() == [
+        'Sheet,कित्ता,कैफियत,कैफियत,क्षेत्रफल',
+        'VDC01,2,,c,',
+        'VDC01,1,a,b,',
+        'VDC02,3,,,5.5'
+    ]
+
+
+def test_xlsx_export_has_every_row():
+    result = export.hits_export(sheets(), [('VDC01', [0, 1]), ('VDC02', [0])], chunk_rows=1)
+    workbook = openpyxl.load_workbook(io.BytesIO(b''.join(export.export_blocks(result, 'xlsx'))))
+    rows = list(workbook.active.values)
+    assert rows[0] == ('Sheet', 'कित्ता', 'कैफियत', 'कैफियत', 'क्षेत्रफल')
+    assert rows[1:] == [('VDC01', '1', 'a', 'b', None), ('VDC01', '2', None, 'c', None), ('VDC02', '3', None, None, 5.5)]
+
+
+def test_global_export_follows_the_global_results():
+    global_index = {'sheet': np.array([1, 0, 0]), 'row': np.array([0, 1, 0]), 'sheet_names': ['VDC01', 'VDC02']}
+    found = np.array([0, 1, 2])
+    assert export.global_hits(global_index, found)[0][0] == 'VDC02'
+    columns, chunks = export.global_export(global_index, sheets(), found, chunk_rows=2)
+    exported = pd.concat(list(chunks), ignore_index=True)
+    results = records.global_results(global_index, sheets(), found)
+    assert columns == results.columns.tolist()
+    pd.testing.assert_frame_equal(exported, results)
@@ -0,0 +1,57 @@
+import random
+
+import numpy as np
+import pandas as pd
+
+import records
+from helpers import raw_frame, sheet_rows
+
+
+def prepared_sheets():
+    rng = random.Random(21)
+    return [records.prepare_sheet(raw_frame(sheet_rows(rng, f'VDC{i}', rng.randint(0, 900)))) for i in range(6)]
+
+
+def cell_texts(df, column):
+    # The text the filters compare a cell with, None for a blank cell
+    return np.array([None if pd.isna(v) else str(v) for v in df[column].astype(object)], dtype=object)
+
+
+def test_filter_index_positions_match_a_boolean_mask():
+    for prepared in prepared_sheets():
+        df = prepared['df']
+        index = prepared['filter_index']
+        wards = cell_texts(df, prepared['col_mapping']['ward'])
+        sheets = cell_texts(df, prepared['col_mapping']['sheet_no'])
+        assert index['ward_options'] == sorted(set(wards) - {None})
+        assert index['sheet_options'] == sorted(set(sheets) - {None})
+
+        for ward in index['ward_options']:
+            assert index['ward_rows'][ward].tolist() == np.flatnonzero(wards == ward).tolist()
+            assert index['ward_sheet_options'][ward] == sorted(set(sheets[wards == ward]) - {None})
+            for sheet_no in index['ward_sheet_options'][ward]:
+                mask = (wards == ward) & (sheets == sheet_no)
+                assert index['ward_sheet_rows'][(ward, sheet_no)].tolist() == np.flatnonzero(mask).tolist()
+        for sheet_no in index['sheet_options']:
+            assert index['sheet_rows'][sheet_no].tolist() == np.flatnonzero(sheets == sheet_no).tolist()
+
+
+def test_filter_rows_match_a_boolean_mask():
+    rng = random.Random(4)
+    for prepared in prepared_sheets():
+        df = prepared['df']
+        wards = cell_texts(df, prepared['col_mapping']['ward'])
+        sheets = cell_texts(df, prepared['col_mapping']['sheet_no'])
+        assert records.filter_rows(prepared) is None
+        for _ in range(20):
+            # Sometimes a ward or sheet no. the sheet does not have
+            ward = rng.choice(list(prepared['filter_index']['ward_options']) + ['99', None])
+            sheet_no = rng.choice(list(prepared['filter_index']['sheet_options']) + ['999', None])
+            mask = np.ones(len(df), dtype=bool)
+            if ward is not None:
+                mask &= wards == ward
+            if sheet_no is not None:
+                mask &= sheets == sheet_no
+            rows = records.filter_rows(prepared, ward, sheet_no)
+            expected = None if ward is None and sheet_no is None else np.flatnonzero(mask).tolist()
+            assert (None if rows is None else rows.tolist()) == expected
@@ -0,0 +1,58 @@
+import os
+
+import pandas as pd
+import pytest
+
+import ingest
+import records
+from helpers import make_workbook
+
+
+def cell_text(value):
+    # A cell as text, numbers written the same whether they were read as numbers or as text (CSV)
+    if pd.isna(value):
+        return None
+    try:
+        return repr(float(value))
+    except ValueError:
+        return str(value)
+
+
+def read_with_every_engine(folder, names):
+    path = os.path.join(folder, 'workbook.xlsx')
+    return {
+        'streaming': ingest.read_xlsx_sheets(path, names, engine='streaming'),
+        'pandas': ingest.read_xlsx_sheets(path, names, engine='pandas'),
+        'csv': {name: ingest.read_csv_sheet(os.path.join(folder, f'{name}.csv')) for name in names}
+    }
+
+
+def test_engines_read_the_same_raw_sheets(tmp_path):
+    names = make_workbook(str(tmp_path), 3, 600, seed=8)[1:]
+    by_engine = read_with_every_engine(str(tmp_path), names)
+    for name in names:
+        streaming = by_engine['streaming'][name]
+        pd.testing.assert_frame_equal(streaming, by_engine['pandas'][name], check_dtype=False)
+        csv = by_engine['csv'][name]
+        assert csv.shape == streaming.shape
+        assert csv.map(cell_text).equals(streaming.map(cell_text))
+
+        # And they become the same prepared sheet
+        plot_keys = {engine: records.prepare_sheet(sheets[name])['plot_index']['keys'].to_pylist()
+                     for engine, sheets in by_engine.items()}
+        assert plot_keys['pandas'] == plot_keys['streaming'] == plot_keys['csv']
+
+
+def test_parallel_streaming_reads_the_same_sheets(tmp_path):
+    names = make_workbook(str(tmp_path), 2, 200, seed=9)[1:]
+    path = os.path.join(str(tmp_path), 'workbook.xlsx')
+    single = ingest.read_xlsx_sheets(path, names)
+    parallel = ingest.read_xlsx_sheets(path, names, workers=2)
+    for name in names:
+        pd.testing.assert_frame_equal(parallel[name], single[name])
+
+
+def test_unknown_engine_is_refused():
+    assert ingest.check_engine('csv') == 'csv'
+    with pytest.raises(ValueError, match='streaming, pandas, csv'):
+        ingest.check_engine('csvv')
@@ -0,0 +1,62 @@
+import re
+
+import pytest
+
+import metrics
+
+
+@pytest.fixture(autouse=True)
+def empty_metrics():
+    metrics.reset()
+    yield
+    metrics.reset()
+
+
+def samples(text):
+    # {metric name with labels: value} of every sample line
+    return dict(line.rsplit(' ', 1) for line in text.splitlines() if not line.startswith('#'))
+
+
+def test_timer_and_counter_in_prometheus_text():
+    for _ in range(3):
+        with metrics.timer('download'):
+            pass
+    with pytest.raises(RuntimeError):
+        with metrics.timer('parse_sheets'):
+            raise RuntimeError
+    metrics.count('sheet_cache_hit')
+    metrics.count('sheet_cache_hit', 4)
+    metrics.set_value('sheet_cache_rows', 1234)
+
+    text = metrics.prometheus_text()
+    assert text.endswith('\n')
+    found = samples(text)
+    assert found['land_record_stage_seconds_count{stage="download"}'] == '3'
+    assert found['land_record_stage_seconds_count{stage="parse_sheets"}'] == '1'
+    longest = float(found['land_record_stage_seconds{stage="download",quantile="0.99"}'])
+    for q in metrics.QUANTILES:
+        assert 0 <= float(found[f'land_record_stage_seconds{{stage="download",quantile="{q}"}}']) <= longest
+    assert float(found['land_record_stage_seconds_sum{stage="download"}']) >= longest
+    assert found['land_record_events_total{event="sheet_cache_hit"}'] == '5'
+    assert found['land_record_sheet_cache_rows'] == '1234'
+
+    assert '# TYPE land_record_stage_seconds summary' in text
+    assert '# TYPE land_record_events_total counter' in text
+    assert '# TYPE land_record_sheet_cache_rows gauge' in text
+    assert metrics.prometheus_text(prefix='other').count('other_stage_seconds_count') == 2
+
+
+def test_names_and_labels_are_escaped():
+    with metrics.timer('filter_plot_"exact"\\\n'):
+        pass
+    metrics.count('bad"event')
+    metrics.set_value('rows per-sheet', 7)
+
+    text = metrics.prometheus_text()
+    assert 'land_record_stage_seconds_count{stage="filter_plot_\\"exact\\"\\\\\\n"} 1' in text
+    assert 'land_record_events_total{event="bad\\"event"} 1' in text
+    assert 'land_record_rows_per_sheet 7' in text
+    # Still one sample per line, and every metric name a valid one
+    for line in text.splitlines():
+        if not line.startswith('#'):
+            assert re.match(r'[a-zA-Z_:][a-zA-Z0-9_:]*(\{.*\})? \S+$', line), line
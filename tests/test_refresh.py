@@ -0,0 +1,126 @@
+import hashlib
+import os
+
+import pytest
+
+import refresh
+from helpers import QuietHandler, flaky_handler, make_workbook, serve
+
+
+def test_csv_engine_reads_the_sheets_downloaded_with_the_workbook(workbook_server, tmp_path, monkeypatch):
+    folder, names, base_url = workbook_server
+    monkeypatch.setattr(refresh, 'INGEST_ENGINE', 'csv')
+    monkeypatch.setattr(refresh, 'CSV_URL_TEMPLATE', base_url + '/{sheet}.csv')
+    snapshot_dir = str(tmp_path / 'snapshot')
+    state = refresh.new_workbook_state()
+    assert refresh.refresh_workbook(state, {'': base_url + '/workbook.xlsx'}, folder=snapshot_dir)
+    refresh.save_snapshot(state, snapshot_dir)
+    snapshot = state['snapshot']
+    for name in names[1:]:
+        # The version of a sheet is the hash of the CSV it is read from, kept next to the workbook
+        assert os.path.exists(os.path.join(snapshot_dir, f"{snapshot['sheet_versions'][name]}.csv"))
+
+    # Sheets change on the server after the refresh: opening them later must not show it
+    for name in names[1:]:
+        with open(folder / f'{name}.csv', 'a', encoding='utf-8') as f:
+            f.write(f'1,{name},1,1,77777,10,कृषि\n')
+    assert '77777' not in snapshot['sheets'][names[1]]['plot_index']['keys'].to_pylist()
+
+    restarted = refresh.new_workbook_state()
+    assert refresh.load_snapshot(restarted, snapshot_dir)
+    assert restarted['snapshot']['sheet_versions'] == snapshot['sheet_versions']
+    assert '77777' not in restarted['snapshot']['sheets'][names[2]]['plot_index']['keys'].to_pylist()
+
+
+def test_csv_sheets_are_downloaded_with_retries(workbook_server, monkeypatch):
+    folder, names, _ = workbook_server
+    # Every file answers 503 once, then the file
+    server = serve(str(folder), flaky_handler())
+    base_url = f'http://127.0.0.1:{server.server_address[1]}'
+    monkeypatch.setattr(refresh, 'INGEST_ENGINE', 'csv')
+    monkeypatch.setattr(refresh, 'CSV_URL_TEMPLATE', base_url + '/{sheet}.csv')
+    state = refresh.new_workbook_state()
+    try:
+        assert refresh.refresh_workbook(state, {'': base_url + '/workbook.xlsx'}, folder=None)
+    finally:
+        server.shutdown()
+    assert state['source_errors'] == {}
+    assert len(state['snapshot']['sheets'].csv_sources) == len(names) - 1
+
+
+class ETagHandler(QuietHandler):
+    """
+    Files with an ETag (the hash of the file), If-None-Match answered with 304 Not Modified,
+    and every request answered with 500 while the server's `failing` is set.
+    """
+    def do_GET(self):
+        self.server.seen.append(self.headers.get('If-None-Match'))
+        if self.server.failing:
+            self.send_error(500)
+            return
+        with open(self.translate_path(self.path), 'rb') as f:
+            data = f.read()
+        etag = f'"{hashlib.sha1(data).hexdigest()}"'
+        if self.headers.get('If-None-Match') == etag:
+            self.send_response(304)
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header('ETag', etag)
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+
+@pytest.fixture
+def etag_server(workbook_server):
+    folder, names, _ = workbook_server
+    server = serve(str(folder), ETagHandler)
+    server.seen = []
+    server.failing = False
+    yield folder, server, {'': f'http://127.0.0.1:{server.server_address[1]}/workbook.xlsx'}
+    server.shutdown()
+
+
+def test_not_modified_keeps_the_snapshot(etag_server):
+    _, server, sources = etag_server
+    state = refresh.new_workbook_state()
+    assert refresh.refresh_workbook(state, sources, folder=None)
+    snapshot = state['snapshot']
+
+    assert not refresh.refresh_workbook(state, sources, folder=None)
+    assert state['snapshot'] is snapshot
+    # The second request was conditional, with the ETag of the first answer
+    assert server.seen[0] is None and server.seen[1] == state['sources']['']['etag']
+
+
+def test_changed_etag_swaps_the_snapshot(etag_server):
+    folder, server, sources = etag_server
+    state = refresh.new_workbook_state()
+    assert refresh.refresh_workbook(state, sources, folder=None)
+    snapshot = state['snapshot']
+    etag = state['sources']['']['etag']
+
+    make_workbook(str(folder), 2, 400, seed=4)
+    assert refresh.refresh_workbook(state, sources, folder=None)
+    assert server.seen[-1] == etag
+    assert state['sources']['']['etag'] != etag
+    assert state['snapshot'] is not snapshot
+    assert state['snapshot']['version'] != snapshot['version']
+    assert sum(len(state['snapshot']['sheets'][name]['df']) for name in refresh.data_sheet_names(state['snapshot']['sheets'])) == 400
+
+
+def test_failed_download_serves_the_last_good_copy(etag_server):
+    _, server, sources = etag_server
+    state = refresh.new_workbook_state()
+    # No retries, so the failure is not waited for
+    state['http'] = refresh.make_http_session(retries=0)
+    assert refresh.refresh_workbook(state, sources, folder=None)
+    snapshot = state['snapshot']
+
+    # Nothing changes, so nothing is written to the snapshot folder
+    server.failing = True
+    refresh.run_refresh(state, sources)
+    assert state['snapshot'] is snapshot
+    assert '500' in state['last_error']
+    assert len(snapshot['sheets'][refresh.data_sheet_names(snapshot['sheets'])[0]]['df']) > 0
@@ -0,0 +1,66 @@
+import random
+
+import numpy as np
+
+import metrics
+import records
+import refresh
+from helpers import raw_frame, sheet_rows
+
+
+def prepared_sheets(count=4, seed=3):
+    rng = random.Random(seed)
+    sheets = {}
+    for i in range(count):
+        sheets[f'VDC{i}'] = records.prepare_sheet(raw_frame(sheet_rows(rng, f'VDC{i}', rng.randint(200, 800))))
+    return sheets
+
+
+def as_list(rows):
+    return None if rows is None else np.asarray(rows).tolist()
+
+
+def test_cached_filter_rows_match_filter_rows():
+    sheets = prepared_sheets()
+    cache = refresh.ResultCache(1 << 20)
+    rng = random.Random(11)
+    for _ in range(300):
+        name = rng.choice(list(sheets))
+        prepared = sheets[name]
+        df = prepared['df']
+        row = df.iloc[rng.randrange(len(df))]
+        ward = rng.choice([None, '', str(row[prepared['col_mapping']['ward']])])
+        sheet_no = rng.choice([None, str(row[prepared['col_mapping']['sheet_no']])])
+        plot = rng.choice([None, ' ', str(row[prepared['col_mapping']['plot']])[:rng.randint(1, 4)]])
+        mode = rng.choice(records.PLOT_MATCH_MODES)
+        expected = as_list(records.filter_rows(prepared, ward, sheet_no, records.normalize_plot_number(plot), mode))
+        # The first call fills the cache, the second one reads it
+        for _ in range(2):
+            rows = records.cached_filter_rows(cache, 'v1', name, prepared, ward, sheet_no, plot, mode)
+            assert as_list(rows) == expected, (name, ward, sheet_no, plot, mode)
+
+
+def test_narrowed_contains_searches_match_uncached():
+    sheets = prepared_sheets()
+    global_index = records.build_global_plot_index(sheets)
+    cache = refresh.ResultCache(1 << 20)
+    metrics.reset()
+    for plot in ('1', '12', '123', '1234', '4/', '4/2'):
+        for name, prepared in sheets.items():
+            for ward in (None, '1'):
+                rows = records.cached_filter_rows(cache, 'v1', name, prepared, ward, plot=plot, mode='contains')
+                assert as_list(rows) == as_list(records.filter_rows(prepared, ward, None, plot, 'contains'))
+        rows = records.cached_global_plot_rows(cache, 'v1', global_index, plot, mode='contains')
+        assert as_list(rows) == as_list(records.global_plot_rows(global_index, plot, mode='contains'))
+    # Every plot after the first of each typing run was searched in the rows found before
+    assert metrics.counters()['result_cache_narrowed'] == 4 * (len(sheets) * 2 + 1)
+
+
+def test_other_versions_are_not_mixed_up():
+    sheets = prepared_sheets(count=2)
+    old, new = sheets['VDC0'], sheets['VDC1']
+    cache = refresh.ResultCache(1 << 20)
+    plot = str(old['df'][old['col_mapping']['plot']].iloc[0])
+    records.cached_filter_rows(cache, 'v1', 'VDC', old, plot=plot, mode='prefix')
+    rows = records.cached_filter_rows(cache, 'v2', 'VDC', new, plot=plot, mode='prefix')
+    assert as_list(rows) == as_list(records.filter_rows(new, plot=plot, mode='prefix'))
@@ -0,0 +1,103 @@
+import pandas as pd
+
+import bulk
+import records
+import refresh
+
+COL_MAPPING = {'vdc': None, 'ward': 'वडा', 'sheet_no': 'सिट', 'plot': 'कित्ता', 'land_use': None}
+
+
+def prepared(rows, columns=('कित्ता', 'वडा', 'सिट', 'कैफियत', 'कैफियत')):
+    return records.build_prepared_sheet(pd.DataFrame(rows, columns=list(columns)), COL_MAPPING)
+
+
+def workbook():
+    return {
+        'VDC01': prepared([['12', 1, 1, 'a', 'b'], ['13', 1, 2, None, None], ['12', 2, 1, 'c', None]]),
+        'VDC02': prepared([['12', 3, 4, 'd']], columns=('कित्ता', 'वडा', 'सिट', 'कैफियत'))
+    }
+
+
+def test_global_results_keep_repeated_columns_once():
+    sheets = workbook()
+    global_index = records.build_global_plot_index(sheets)
+    results = records.global_results(global_index, sheets, records.global_plot_rows(global_index, '12'))
+    assert results.columns.tolist() == ['Sheet', 'कित्ता', 'वडा', 'सिट', 'कैफियत', 'कैफियत']
+    assert results.iloc[:, 0].tolist() == ['VDC01', 'VDC01', 'VDC02']
+    assert results.iloc[:, 4].tolist() == ['a', 'c', 'd']
+    assert results.iloc[0, 5] == 'b'
+    assert results.iloc[1:, 5].isna().all()
+
+
+def test_bulk_lookup_keeps_repeated_columns_once():
+    sheets = workbook()
+    global_index = records.build_global_plot_index(sheets)
+    lookup = bulk.read_lookup_list('VDC01, 1, 12\nVDC02, 3, 12\nVDC01, 9, 12\n'.encode())
+    found, not_found = bulk.bulk_lookup(sheets, global_index, lookup)
+    assert found.columns.tolist() == ['List row', 'Sheet', 'कित्ता', 'वडा', 'सिट', 'कैफियत', 'कैफियत']
+    assert found['List row'].tolist() == [1, 2]
+    assert found['Sheet'].tolist() == ['VDC01', 'VDC02']
+    assert found.iloc[:, 5].tolist() == ['a', 'd']
+    assert not_found['List row'].tolist() == [3]
+
+
+def test_blank_plot_is_refused_without_a_sheet():
+    sheets = workbook()
+    global_index = records.build_global_plot_index(sheets)
+    cache = refresh.ResultCache(1 << 20)
+    for plot in (None, '', ' ', '\t '):
+        for kwargs in ({}, {'cache': cache, 'version': 'v1'}):
+            try:
+                records.query_hits(sheets, {'plot': plot}, global_index, **kwargs)
+            except ValueError:
+                continue
+            raise AssertionError(f'{plot!r} was searched')
+    assert records.query_hits(sheets, {'plot': ' १२ '}, global_index)[0][1].tolist() == [0, 2]
+
+
+def test_blank_plot_in_one_sheet_is_no_filter():
+    sheets = workbook()
+    assert records.query_hits(sheets, {'sheet': 'VDC01', 'ward': '1', 'plot': ' '})[0][1].tolist() == [0, 1]
+
+
+def test_lookup_list_reads_quoted_csv():
+    lookup = bulk.read_lookup_list('"VDC","Ward","Kitta"\r\n"VDC01","3","123"\r\n"VDC02",,"124/1"\r\n'.encode())
+    assert lookup.values.tolist()[0] == ['VDC01', '3', '123']
+    assert lookup['plot'].tolist() == ['123', '124/1']
+
+
+def test_lookup_list_reads_pasted_lines():
+    lookup = bulk.read_lookup_list('VDC01, 3, 123\nVDC01,,124\n\n99\n'.encode())
+    assert lookup['plot'].tolist() == ['123', '124', '99']
+    assert lookup['vdc'].tolist()[:2] == ['VDC01', 'VDC01']
+    assert bulk.read_lookup_list('वडा\tकित्ता\n3\t12\n'.encode()).values.tolist() == [[None, '3', '12']]
+
+
+def test_vdc_names_romanized_differently_are_found():
+    names = ['काठमाडौं', 'पोखरा', 'ललितपुर', 'VDC01']
+    assert records.find_sheet_name(names, 'Kathmandu') == 'काठमाडौं'
+    assert records.find_sheet_name(names, 'Pokhara') == 'पोखरा'
+    assert records.find_sheet_name(['Lalitpur/काठमाडौं', 'Kaski/पोखरा'], 'pokhara') == 'Kaski/पोखरा'
+    # Names that are not the same place stay unknown
+    for name in ('Bharatpur', 'VDC09'):
+        try:
+            records.find_sheet_name(names + ['Bhaktapur'], name)
+        except ValueError:
+            continue
+        raise AssertionError(f'{name} was found')
+
+
+def test_bulk_lookup_matches_vdc_names_romanized_differently():
+    sheets = {
+        'काठमाडौं': prepared([['12', 1, 1, 'a', 'b']]),
+        'VDC02': records.build_prepared_sheet(
+            pd.DataFrame([['12', 1, 4, 'पोखरा'], ['13', 1, 4, 'पोखरा']], columns=['कित्ता', 'वडा', 'सिट', 'गा.वि.स.']),
+            dict(COL_MAPPING, vdc='गा.वि.स.')
+        )
+    }
+    global_index = records.build_global_plot_index(sheets)
+    lookup = bulk.read_lookup_list('Kathmandu, 1, 12\nPokhara, 1, 13\nBharatpur, 1, 12\n'.encode())
+    found, not_found = bulk.bulk_lookup(sheets, global_index, lookup)
+    assert found['List row'].tolist() == [1, 2]
+    assert found['Sheet'].tolist() == ['काठमाडौं', 'VDC02']
+    assert not_found['List row'].tolist() == [3]
@@ -0,0 +1,91 @@
+import os
+import random
+import time
+
+import pandas as pd
+import pytest
+
+import records
+import refresh
+from helpers import make_workbook, raw_frame, sheet_rows
+
+
+@pytest.fixture
+def shared_folder(workbook_server, tmp_path, monkeypatch):
+    # The loader's snapshot folder, and workers that look for a newer snapshot on every request
+    monkeypatch.setattr(refresh, 'SHARED_POLL', 0)
+    folder, _, base_url = workbook_server
+    yield str(tmp_path / 'shared'), {'': base_url + '/workbook.xlsx'}, folder
+
+
+def test_prepared_sheet_round_trip(tmp_path):
+    prepared = records.prepare_sheet(raw_frame(sheet_rows(random.Random(6), 'VDC01', 500)))
+    df = prepared['df']
+    # The serial number column, with two blank cells
+    serial = next(column for column in df.columns if str(df[column].dtype) == 'Int32')
+    df.loc[[3, 40], serial] = pd.NA
+    dtypes = {str(dtype) for dtype in df.dtypes}
+    assert {'category', 'Int32'} <= dtypes
+
+    path = str(tmp_path / 'sheet.arrow')
+    refresh.save_prepared_sheet(prepared, path)
+    loaded = refresh.load_prepared_sheet(path)
+
+    pd.testing.assert_frame_equal(loaded['df'], df)
+    assert loaded['df'][serial].isna().sum() == 2
+    assert loaded['df'][serial].iloc[4] == df[serial].iloc[4]
+    for column in df.columns:
+        if isinstance(df[column].dtype, pd.CategoricalDtype):
+            assert loaded['df'][column].cat.categories.tolist() == df[column].cat.categories.tolist()
+    assert loaded['col_mapping'] == prepared['col_mapping']
+    assert loaded['confidence'] == prepared['confidence']
+    for key in ('ward_rows', 'sheet_rows', 'ward_sheet_rows'):
+        expected = prepared['filter_index'][key]
+        assert {k: v.tolist() for k, v in loaded['filter_index'][key].items()} == {k: v.tolist() for k, v in expected.items()}
+    assert loaded['plot_index']['keys'].to_pylist() == prepared['plot_index']['keys'].to_pylist()
+    assert loaded['plot_index']['order'].tolist() == prepared['plot_index']['order'].tolist()
+
+
+def test_worker_follows_the_published_versions(shared_folder):
+    path, sources, server_folder = shared_folder
+    loader = refresh.new_workbook_state()
+    assert refresh.publish_snapshot(loader, sources, path)
+    first_version = loader['snapshot']['version']
+
+    worker = refresh.new_workbook_state()
+    snapshot = refresh.follow_shared_snapshot(worker, path)
+    assert snapshot['version'] == first_version
+    assert worker['last_error'] is None
+    pd.testing.assert_frame_equal(snapshot['sheets']['VDC01']['df'], loader['snapshot']['sheets']['VDC01']['df'])
+    # Nothing new: the worker keeps the snapshot it has
+    assert refresh.follow_shared_snapshot(worker, path) is snapshot
+
+    make_workbook(str(server_folder), 2, 340, seed=11)
+    # Newer than the Last-Modified of the first download, whatever the clock's resolution
+    os.utime(server_folder / 'workbook.xlsx', (time.time() + 10, time.time() + 10))
+    assert refresh.publish_snapshot(loader, sources, path)
+    assert loader['snapshot']['version'] != first_version
+
+    # The files of the previous version are kept for the workers still serving it
+    assert len(snapshot['sheets']['VDC02']['df']) == 150
+    snapshot = refresh.follow_shared_snapshot(worker, path)
+    assert snapshot['version'] == loader['snapshot']['version']
+    for name in ('VDC01', 'VDC02'):
+        pd.testing.assert_frame_equal(snapshot['sheets'][name]['df'], loader['snapshot']['sheets'][name]['df'])
+    assert sum(len(snapshot['sheets'][name]['df']) for name in ('VDC01', 'VDC02')) == 340
+
+
+def test_worker_before_the_snapshot_is_published(shared_folder):
+    path, sources, _ = shared_folder
+    worker = refresh.new_workbook_state()
+    os.makedirs(path)
+    assert refresh.follow_shared_snapshot(worker, path) is None
+    assert 'loader.py' in worker['last_error']
+
+    # A manifest naming files that are not there yet
+    refresh.publish_snapshot(refresh.new_workbook_state(), sources, path)
+    for file_name in os.listdir(path):
+        if file_name.endswith('.xlsx'):
+            os.remove(os.path.join(path, file_name))
+    assert refresh.follow_shared_snapshot(worker, path) is None
+    assert 'not published yet' in worker['last_error']
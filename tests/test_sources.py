@@ -0,0 +1,99 @@
+import os
+import time
+
+import pytest
+
+import records
+import refresh
+from helpers import flaky_handler, make_workbook, serve
+
+
+@pytest.fixture
+def source_folders(tmp_path):
+    # Two municipalities with different workbooks, each with a cover sheet and 2 VDC sheets
+    folders = {}
+    for i, name in enumerate(('Kathmandu', 'Lalitpur')):
+        folders[name] = tmp_path / name
+        folders[name].mkdir()
+        make_workbook(str(folders[name]), 2, 200 * (i + 1), seed=i)
+    return folders
+
+
+def serve_sources(folders, handler=None):
+    servers = {name: serve(str(folder), *([handler] if handler else [])) for name, folder in folders.items()}
+    urls = {name: f'http://127.0.0.1:{server.server_address[1]}/workbook.xlsx' for name, server in servers.items()}
+    return servers, urls
+
+
+def test_sheets_are_named_by_source(source_folders):
+    servers, sources = serve_sources(source_folders)
+    state = refresh.new_workbook_state()
+    try:
+        assert refresh.refresh_workbook(state, sources, folder=None)
+    finally:
+        for server in servers.values():
+            server.shutdown()
+    workbook = state['snapshot']['sheets']
+    assert list(workbook) == [
+        'Kathmandu/Cover', 'Kathmandu/VDC01', 'Kathmandu/VDC02', 'Lalitpur/Cover', 'Lalitpur/VDC01', 'Lalitpur/VDC02'
+    ]
+    # The cover sheet of every workbook is left out of searches
+    assert refresh.data_sheet_names(workbook) == ['Kathmandu/VDC01', 'Kathmandu/VDC02', 'Lalitpur/VDC01', 'Lalitpur/VDC02']
+    assert sum(len(workbook[name]['df']) for name in refresh.data_sheet_names(workbook)) == 600
+    assert records.find_sheet_name(workbook, 'Lalitpur/VDC02') == 'Lalitpur/VDC02'
+    # 'VDC01' is in both workbooks, so it needs its source
+    with pytest.raises(ValueError, match='Kathmandu/VDC01'):
+        records.find_sheet_name(workbook, 'VDC01')
+
+
+def test_one_failing_source_does_not_stop_the_others(source_folders):
+    servers, sources = serve_sources(source_folders)
+    sources['Bhaktapur'] = sources['Lalitpur'].replace('workbook.xlsx', 'missing.xlsx')
+    state = refresh.new_workbook_state()
+    state['http'] = refresh.make_http_session(retries=0)
+    try:
+        assert refresh.refresh_workbook(state, sources, folder=None)
+    finally:
+        for server in servers.values():
+            server.shutdown()
+    assert list(state['source_errors']) == ['Bhaktapur']
+    assert '404' in refresh.source_error_text(state)
+    assert {name.partition('/')[0] for name in state['snapshot']['sheets']} == {'Kathmandu', 'Lalitpur'}
+    assert len(state['snapshot']['sheets']['Lalitpur/VDC01']['df']) > 0
+
+
+def test_failing_source_keeps_its_last_data(source_folders):
+    servers, sources = serve_sources(source_folders)
+    state = refresh.new_workbook_state()
+    state['http'] = refresh.make_http_session(retries=0)
+    assert refresh.refresh_workbook(state, sources, folder=None)
+    versions = dict(state['snapshot']['sheet_versions'])
+
+    servers['Lalitpur'].shutdown()
+    servers['Lalitpur'].server_close()
+    make_workbook(str(source_folders['Kathmandu']), 2, 300, seed=9)
+    # Newer than the Last-Modified of the first download, whatever the clock's resolution
+    path = source_folders['Kathmandu'] / 'workbook.xlsx'
+    os.utime(path, (time.time() + 10, time.time() + 10))
+    try:
+        assert refresh.refresh_workbook(state, sources, folder=None)
+    finally:
+        servers['Kathmandu'].shutdown()
+    new_versions = state['snapshot']['sheet_versions']
+    assert list(state['source_errors']) == ['Lalitpur']
+    assert all(new_versions[name] == h for name, h in versions.items() if name.startswith('Lalitpur/'))
+    assert any(new_versions[name] != h for name, h in versions.items() if name.startswith('Kathmandu/'))
+    assert len(state['snapshot']['sheets']['Lalitpur/VDC02']['df']) > 0
+
+
+def test_downloads_are_retried(source_folders):
+    # Every server answers the first request for each file with 503
+    servers, sources = serve_sources(source_folders, flaky_handler())
+    state = refresh.new_workbook_state()
+    try:
+        assert refresh.refresh_workbook(state, sources, folder=None)
+    finally:
+        for server in servers.values():
+            server.shutdown()
+    assert state['source_errors'] == {}
+    assert len(refresh.data_sheet_names(state['snapshot']['sheets'])) == 4
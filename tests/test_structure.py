@@ -0,0 +1,83 @@
+import random
+
+import records
+import refresh
+from helpers import HEADERS, raw_frame, sheet_rows
+
+ENGLISH_HEADER = ['S.N.', 'VDC', 'Ward No', 'Sheet No', 'Kitta No', 'Area', 'Land Use']
+
+
+def reference_structure(raw_df):
+    # Header row, kept columns and mapping the way prepare_sheet found them before detect_structure:
+    # one row and one keyword at a time
+    header_row = 0
+    for i in range(min(records.HEADER_SEARCH_ROWS, len(raw_df))):
+        row_values = raw_df.iloc[i].fillna('').astype(str).tolist()
+        if sum(1 for val in row_values if any(k.lower() in val.lower() for k in records.HEADER_KEYWORDS)) >= 2:
+            header_row = i
+            break
+    columns = [str(c).strip() for c in raw_df.iloc[header_row]] if len(raw_df) else []
+    keep = [not (c.startswith('Unnamed') or c == 'nan') for c in columns]
+    kept = [c for c, k in zip(columns, keep) if k]
+    col_mapping = {}
+    for key, patterns in records.COLUMN_KEYWORDS.items():
+        col_mapping[key] = next((c for c in kept if any(p.lower() in c.lower() for p in patterns)), None)
+    return header_row, columns, keep, col_mapping
+
+
+def generated_frames(count, seed=7):
+    # Synthetic VDC sheets, some with English, missing or no headers, some shorter than the header search
+    rng = random.Random(seed)
+    for i in range(count):
+        rows = sheet_rows(rng, f'VDC{i}', rng.randint(0, 30))
+        kind = rng.random()
+        header_at = next(r for r, row in enumerate(rows) if row and row[0] in HEADERS['serial'])
+        if kind < 0.2:
+            rows[header_at] = ENGLISH_HEADER[:len(rows[header_at])]
+        elif kind < 0.35:
+            del rows[header_at]
+        elif kind < 0.45:
+            rows[header_at] = [None if rng.random() < 0.3 else name for name in rows[header_at]]
+        elif kind < 0.55:
+            rows = rows[:rng.randint(0, header_at + 1)]
+        yield raw_frame(rows)
+
+
+def test_detect_structure_matches_reference():
+    for raw_df in generated_frames(400):
+        structure = records.detect_structure(raw_df, use_cache=False)
+        header_row, columns, keep, col_mapping = reference_structure(raw_df)
+        assert structure['header_row'] == header_row
+        assert structure['columns'] == columns
+        assert structure['keep'] == keep
+        assert structure['col_mapping'] == col_mapping
+
+
+def test_cached_structure_matches_uncached():
+    frames = list(generated_frames(200, seed=11))
+    for raw_df in frames + frames:
+        assert records.detect_structure(raw_df) == records.detect_structure(raw_df, use_cache=False)
+
+
+def test_short_sheet_without_header_does_not_answer_for_longer_sheet():
+    title = [['भू-उपयोग क्षेत्र वर्गीकरण विवरण', None, None, None], ['जिल्ला: काठमाडौं', None, None, None]]
+    header = ['सि.नं.', 'वडा नं.', 'सिट नं.', 'कित्ता नं.']
+    short = raw_frame(title)
+    full = raw_frame(title + [header, [1, 2, 3, 45]])
+
+    assert records.detect_structure(short)['header_row'] == 0
+    structure = records.detect_structure(full)
+    assert structure['header_row'] == 2
+    assert structure['col_mapping']['plot'] == 'कित्ता नं.'
+
+
+def test_confidence_reaches_prepared_sheet_and_its_file(tmp_path):
+    raw_df = raw_frame([['title'], ['सि.नं.', 'वडा नं.', 'सिट नं.', 'कित्ता नं.'], [1, 2, 3, 45]])
+    prepared = records.prepare_sheet(raw_df)
+    assert prepared['confidence']['plot'] > 0
+    assert prepared['confidence']['vdc'] is None
+    assert prepared['confidence']['header'] == 0.6
+
+    path = str(tmp_path / 'sheet.arrow')
+    refresh.save_prepared_sheet(prepared, path)
+    assert refresh.load_prepared_sheet(path)['confidence'] == prepared['confidence']
@@ -0,0 +1,75 @@
+import random
+
+import pandas as pd
+
+import records
+from helpers import raw_frame, sheet_rows
+
+
+def prepared_sheet(seed):
+    rng = random.Random(seed)
+    return records.prepare_sheet(raw_frame(sheet_rows(rng, 'VDC01', 1500)))
+
+
+def as_text(series):
+    # The ward / sheet no. / land use of every row as the summary keys it, blank cells as ''
+    return series.astype(object).map(lambda v: '' if pd.isna(v) else str(v))
+
+
+def plain_counts(prepared, ward=None, sheet_no=None):
+    # Ward x land use kitta counts with a plain groupby over the selected rows
+    df = prepared['df']
+    col_mapping = prepared['col_mapping']
+    wards, sheets, land_uses = (as_text(df[col_mapping[key]]) for key in ('ward', 'sheet_no', 'land_use'))
+    keep = pd.Series(True, index=df.index)
+    if ward is not None:
+        keep &= wards == ward
+    if sheet_no is not None:
+        keep &= sheets == sheet_no
+    counts = pd.DataFrame({'ward': wards[keep], 'land_use': land_uses[keep]}) \
+        .groupby(['ward', 'land_use']).size().unstack(fill_value=0)
+    return counts
+
+
+def same_counts(counts, expected):
+    counts = counts.sort_index().sort_index(axis=1)
+    expected = expected.sort_index().sort_index(axis=1)
+    assert counts.index.tolist() == expected.index.tolist()
+    assert counts.columns.tolist() == expected.columns.tolist()
+    assert (counts.to_numpy() == expected.to_numpy()).all()
+
+
+def test_land_use_counts_match_a_plain_groupby():
+    prepared = prepared_sheet(5)
+    summary = prepared['land_use_summary']
+    df = prepared['df']
+    land_uses = as_text(df[prepared['col_mapping']['land_use']])
+    # Blank land use cells are counted, under ''
+    assert (land_uses == '').any()
+    assert '' in summary['by_ward'].columns
+
+    wards = sorted(set(as_text(df[prepared['col_mapping']['ward']])))
+    sheets = sorted(set(as_text(df[prepared['col_mapping']['sheet_no']])))
+    same_counts(records.land_use_counts(summary), plain_counts(prepared))
+    for ward in wards[:4]:
+        same_counts(records.land_use_counts(summary, ward=ward), plain_counts(prepared, ward=ward))
+        for sheet_no in sheets[:5]:
+            expected = plain_counts(prepared, ward, sheet_no)
+            counts = records.land_use_counts(summary, ward, sheet_no)
+            if expected.empty:
+                assert counts.empty
+            else:
+                same_counts(counts, expected)
+    for sheet_no in sheets[:5]:
+        same_counts(records.land_use_counts(summary, sheet_no=sheet_no), plain_counts(prepared, sheet_no=sheet_no))
+
+
+def test_land_use_totals_add_up_the_sheets():
+    sheets = {f'VDC0{i}': prepared_sheet(i) for i in range(1, 4)}
+    totals = records.build_land_use_totals(sheets)
+    for name, prepared in sheets.items():
+        expected = plain_counts(prepared).sum()
+        assert totals.loc[name, expected.index].tolist() == expected.tolist()
+        assert totals.loc[name].sum() == len(prepared['df'])
+    # Most common land use first
+    assert totals.sum().is_monotonic_decreasing